@@ -0,0 +1,8 @@
+import os, sys
+
+## The modules in tools/ are scripts, imported by their names
+TOOLSDIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),'tools')
+TEMPLATEDIR = os.path.join(os.path.dirname(TOOLSDIR),'run_templates_EMC')
+
+if TOOLSDIR not in sys.path:
+    sys.path.insert(0,TOOLSDIR)
@@ -0,0 +1,31 @@
+import os
+
+import chknml
+import namelist
+
+
+def test_collect_paths(tmp_path):
+    nmlfile = tmp_path / 'input.nml'
+    nmlfile.write_text('&namsfc\n'
+                       '  FNALBC2 = "C3359.facsf.tileX.nc",\n'
+                       '  FNGLAC  = "global_glacier.2x2.grb",\n'
+                       '  FNTSFC  = "FIX_AM/RTGSST.1982.2012.monthly.clim.grb",\n'
+                       '  FSMCL(2) = 99999\n'
+                       '/\n'
+                       '&atmos_model_nml\n'
+                       '  ccpp_suite = "FV3_RRFS_v1nssl",\n'
+                       '  restart = "RESTART/",\n'
+                       '/\n')
+    (tmp_path/'C3359.facsf.tile7.nc').write_bytes(b'x')
+
+    nmlgrp = namelist.namelistGroup.fromFile(str(nmlfile),'=')
+    paths  = chknml.collect_paths(nmlgrp,str(tmp_path))
+    assert paths == {os.path.join(tmp_path,'C3359.facsf.tile7.nc'): [('namsfc','fnalbc2')],
+                     os.path.join(tmp_path,'global_glacier.2x2.grb'): [('namsfc','fnglac')],
+                     os.path.join(tmp_path,'FIX_AM/RTGSST.1982.2012.monthly.clim.grb'): [('namsfc','fntsfc')],
+                     os.path.join(tmp_path,'RESTART'): [('atmos_model_nml','restart')]}
+
+    for scandir in (False, True):
+        results = chknml.check_paths(list(paths),jobs=4,scandir=scandir)
+        assert {path: status for path,(status,size,seconds) in results.items()} == \
+               {path: 'good' if 'facsf' in path else 'missing' for path in paths}
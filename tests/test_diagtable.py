@@ -0,0 +1,56 @@
+import os
+
+import diagtable
+from conftest import TEMPLATEDIR
+
+HEADER = ['title', '2022 05 11 00 0 0',
+          '"fv3_history",   1, "years", 1, "hours", "time"',
+          '"fv3_history2d", 1, "years", 1, "hours", "time"']
+
+
+def test_parse_template():
+    table = diagtable.DiagTable.fromFile(os.path.join(TEMPLATEDIR,'diag_table'))
+    assert table.basedate == 'YYYY MM DD 00 0 0'
+    assert list(table.files)[0:2] == ['grid_spec', 'atmos_static']
+    assert 'atmos_4xdaily' not in table.files                # commented out
+    assert table.problems() == []
+
+    field = next(iter(table.fields.values()))
+    assert isinstance(field.packing,int) and isinstance(field.reduction,bool)
+
+    again = diagtable.DiagTable.fromLines(str(table).splitlines())
+    assert (again.title, again.basedate) == (table.title, table.basedate)
+    assert again.files == table.files
+    assert dict(again.fields) == dict(table.fields)          # grouped by file
+
+
+def test_same_field_two_outputs():
+    table = diagtable.DiagTable.fromLines(HEADER+[
+        '"gfs_phys", "totprcp_ave", "prate_ave", "fv3_history2d", "all", .true., "none", 2',
+        '"gfs_phys", "totprcp_ave", "prate_max", "fv3_history2d", "all", max, "none", 2'])
+    assert [field.output for field in table.fields.values()] == ['prate_ave', 'prate_max']
+
+
+def test_diff():
+    table1 = diagtable.DiagTable.fromLines(HEADER+[
+        '"gfs_dyn", "ucomp", "ugrd", "fv3_history", "all", .false., "none", 2',
+        '"gfs_dyn", "vcomp", "vgrd", "fv3_history", "all", .false., "none", 2',
+        '"gfs_phys", "totprcp_ave", "prate_ave", "fv3_history2d", "all", .true., "none", 2'],'left')
+    table2 = diagtable.DiagTable.fromLines(HEADER[0:3]+[
+        '"gfs_dyn", "vcomp", "vgrd", "fv3_history", "all", .false., "none", 1',
+        '"gfs_dyn", "ucomp", "ugrd", "fv3_history", "all", .false., "none", 2',
+        '"gfs_dyn", "ucomp", "u", "fv3_history", "all", .false., "none", 2'],'right')
+
+    records = list(diagtable.DiagTable.records(table1,table2))
+    brief = [(record['type'], record.get('side'), record.get('field'), record.get('output')) for record in records]
+    assert brief == [('file', 'left', None, None),
+                     ('changed', None, 'vcomp', 'vgrd'),
+                     ('only', 'left', 'totprcp_ave', 'prate_ave'),
+                     ('only', 'right', 'ucomp', 'u'),
+                     ('summary', None, None, None)]
+    assert records[-1] == {'type': 'summary', 'left': 'left', 'right': 'right', 'files': 1, 'fields': 2,
+                           'changed': 1, 'left_only': 1, 'right_only': 1}
+
+    table1.merge(table2)
+    assert len(table1.fields) == 4
+    assert table1.fields[('gfs_dyn','vcomp','fv3_history','vgrd')].packing == 1
@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import esmfconfig
+import namelist
+from conftest import TEMPLATEDIR, TOOLSDIR
+
+CONFIGS = ['model_configure_EMC', 'model_configure_NSSL', 'model_configure_UKM', 'nems.configure']
+
+
+@pytest.mark.parametrize('name', CONFIGS)
+def test_roundtrip(name):
+    filename = os.path.join(TEMPLATEDIR,name)
+    with open(filename) as fhdl:
+        text = fhdl.read()
+    assert str(esmfconfig.ESMFConfig.fromFile(filename)) == text
+
+
+def test_inline_comments():
+    config = esmfconfig.ESMFConfig.fromFile(os.path.join(TEMPLATEDIR,'model_configure_EMC'))
+    assert config.get('cen_lon') == -97.5
+    assert config.get('nx') == 1799
+    assert config.get('dx') == 3000.0
+
+    config.set('cen_lon',-100.0)
+    lines = str(config).splitlines()
+    assert 'cen_lon:                 -100.0   # central longitude' in lines
+    assert config.get('cen_lon') == -100.0
+
+
+def test_placeholders_and_pes():
+    config = esmfconfig.ESMFConfig.fromFile(os.path.join(TEMPLATEDIR,'model_configure_NSSL'))
+    problems = config.validate()
+    assert any('PE_MEMBER01' in problem for problem in problems)
+    assert not any('cen_lon' in problem for problem in problems)
+
+    config.update({'PE_MEMBER01': 1008, 'start_year': 2022, 'start_month': 5, 'start_day': 11,
+                   'nhours_fcst': 60, 'write_groups': 2, 'write_tasks_per_group': 14,
+                   'nx': 1799, 'ny': 1059, 'lon1': -122.7, 'lat1': 21.1})
+    assert config.validate() == []
+
+    nmlgrp = namelist.namelistGroup.fromDict({'fv_core_nml': {'layout': [35,28]}})
+    assert esmfconfig.check_pes(config,nmlgrp) == []
+    config.set('PE_MEMBER01',1000)
+    assert len(esmfconfig.check_pes(config,nmlgrp)) == 1
+
+    with pytest.raises(ValueError):
+        config.set('nx','abc')
+
+
+def run_cli(*args):
+    return subprocess.run([sys.executable,os.path.join(TOOLSDIR,'esmfconfig.py')]+list(args),
+                          stdout=subprocess.PIPE,stderr=subprocess.PIPE,universal_newlines=True)
+
+
+def test_cli_group():
+    proc = run_cli('-g','grid',os.path.join(TEMPLATEDIR,'model_configure_EMC'))
+    assert "cen_lon = -97.5" in proc.stdout.splitlines()
+
+    ## place holders of the template, e.g. nx: NOX
+    proc = run_cli('-g','grid',os.path.join(TEMPLATEDIR,'model_configure_NSSL'))
+    assert proc.returncode == 2 and proc.stdout == ''
+    assert proc.stderr.startswith('ERROR: Wrong value of "nx"') and 'Traceback' not in proc.stderr
+
+    proc = run_cli('-g','grid','-s','nx=1799','-s','ny=1059','-s','lon1=-122.7','-s','lat1=21.1',
+                   os.path.join(TEMPLATEDIR,'model_configure_NSSL'))
+    assert 'nx = 1799' in proc.stdout.splitlines()
@@ -0,0 +1,84 @@
+import os
+
+import pytest
+
+import esmfconfig
+import fv3flow
+import namelist
+from conftest import TEMPLATEDIR
+
+
+def make_node(tmp_path,name,body,deps=()):
+    script = tmp_path / f"{name}.sh"
+    script.write_text(body.format(done=tmp_path/f"done.{name}"))
+    return fv3flow.Node(name,'fcst',(str(tmp_path),name),str(tmp_path),str(script),deps=deps)
+
+
+def test_scheduler_done(tmp_path):
+    nodes = [make_node(tmp_path,'a','touch {done}\n'),
+             make_node(tmp_path,'b','touch {done}\n',deps=['a']),
+             make_node(tmp_path,'c','touch {done}\n',deps=['a','b'])]
+    scheduler = fv3flow.Scheduler(nodes,fv3flow.LocalBackend(),poll=0.05)
+    assert scheduler.run(timeout=30) == 0
+    assert set(scheduler.statuses().values()) == {'done'}
+
+
+def test_scheduler_failure_blocks(tmp_path):
+    nodes = [make_node(tmp_path,'a','exit 1\n'),
+             make_node(tmp_path,'b','touch {done}\n',deps=['a']),
+             make_node(tmp_path,'c','touch {done}\n')]
+    scheduler = fv3flow.Scheduler(nodes,fv3flow.LocalBackend(),poll=0.05)
+    assert scheduler.run(timeout=30) == 1
+    status = scheduler.statuses()
+    assert status == {'a': 'error', 'b': 'waiting', 'c': 'done'}
+    assert scheduler.blocked(status) == {'b'}
+
+    ## resume after the failed node is fixed
+    os.unlink(tmp_path/'error.a')
+    (tmp_path/'a.sh').write_text(f"touch {tmp_path/'done.a'}\n")
+    scheduler = fv3flow.Scheduler(nodes,fv3flow.LocalBackend(),poll=0.05)
+    assert scheduler.run(timeout=30) == 0
+
+
+def test_scheduler_limits_and_inputs(tmp_path):
+    infile = tmp_path / 'input.dat'
+    nodes = [make_node(tmp_path,f"n{i}",'touch {done}\n') for i in range(3)]
+    nodes[2].inputs = [(str(infile),10)]
+    scheduler = fv3flow.Scheduler(nodes,fv3flow.LocalBackend(),limits={'fcst': 1},poll=0.05,stable=0.1)
+
+    status, wakeup = scheduler.step()
+    assert sorted(status.values()) == ['queued', 'waiting', 'waiting']
+    assert scheduler.run(timeout=0.5) == 1          # input.dat never comes
+    assert scheduler.statuses()['n2'] == 'waiting'
+
+    infile.write_bytes(b'x'*10)
+    assert scheduler.run(timeout=30) == 0
+
+
+@pytest.mark.parametrize('run', ['nssl', 'emc'])
+def test_pipeline_prepare(tmp_path,run):
+    rootdir = tmp_path / 'root'
+    rootdir.mkdir()
+    os.symlink(TEMPLATEDIR,rootdir/'run_templates_EMC')
+    eventdir = tmp_path / run.upper() / '2022051100'
+    os.makedirs(eventdir/'INPUT')
+
+    cfg = dict(fv3flow._JET_CONFIG,rootdir=str(rootdir),run=run)
+    nodes = fv3flow.build_pipeline(str(eventdir),'20220511',cfg)
+    table = fv3flow.node_table(nodes)
+    assert list(table)[0:2] == ['ics', 'lbc_003']
+    assert table['fcst'].deps == ['ics']+[f"lbc_{hour:03d}" for hour in range(3,61,3)]
+    assert 'upp_060' in table and 'bufr_061' in table
+
+    table['fcst'].prepare()
+    for name in ('input.nml', 'model_configure', 'diag_table', 'field_table', 'nems.configure',
+                 'run_fv3sar_2022051100.slurm'):
+        assert (eventdir/name).exists(), name
+
+    config = esmfconfig.ESMFConfig.fromFile(str(eventdir/'model_configure'))
+    assert config.validate() == []
+    assert config.get('PE_MEMBER01') == 35*28+2*14
+    assert config.get('start_day') == 11
+    nmlgrp = namelist.namelistGroup.fromFile(str(eventdir/'input.nml'),'=')
+    assert esmfconfig.check_pes(config,nmlgrp) == []
+    assert (eventdir/'diag_table').read_text().splitlines()[1].split()[0:3] == ['2022', '05', '11']
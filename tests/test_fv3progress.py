@@ -0,0 +1,92 @@
+import os
+
+import pytest
+
+import fv3flow
+import fv3progress
+from conftest import TEMPLATEDIR
+
+
+def write_steps(path,steps):
+    with open(path,'a') as fhdl:
+        for nstep,seconds in steps:
+            fhdl.write(f" PASS: fcstRUN phase 1, n_atmsteps = {nstep:8d} time is {seconds:12.6f}\n")
+
+
+def test_catch_up_hours(tmp_path):
+    (tmp_path/'model_configure').write_text('dt_atmos:                1200\n')     # 3 steps per hour
+    stdout = str(tmp_path/'fv3lam_1.out')
+    write_steps(stdout,[(n, float(n)) for n in range(1,8)])
+    for hour in range(3):
+        (tmp_path/f"logf{hour:03d}").touch()
+
+    tracker = fv3progress.ProgressTracker(str(tmp_path),0,3)
+    assert tracker.dt_atmos == 1200.0
+    events = tracker.new_hours()
+    assert [event['fhr'] for event in events] == [0, 1, 2]
+    assert 'step_mean' not in events[0]
+    assert (events[1]['nsteps'], events[1]['step_mean'], events[1]['step_max']) == (3, 2.0, 3.0)
+    assert (events[2]['nsteps'], events[2]['step_mean'], events[2]['step_max']) == (6, 5.0, 6.0)
+    assert events[2]['model_seconds_per_hour'] == 15.0
+
+    ## step 7 was read before logf003, it is in hour 3
+    write_steps(stdout,[(8, 8.0), (9, 9.0)])
+    (tmp_path/'logf003').touch()
+    events = tracker.new_hours()
+    assert [event['fhr'] for event in events] == [3]
+    assert (events[0]['nsteps'], events[0]['step_mean']) == (9, 8.0)
+    assert tracker.finished()
+
+
+def test_catch_up_without_dt(tmp_path):
+    write_steps(str(tmp_path/'fv3lam_1.out'),[(1, 1.0), (2, 2.0)])
+    (tmp_path/'logf000').touch()
+    (tmp_path/'logf001').touch()
+    events = fv3progress.ProgressTracker(str(tmp_path),0,3).new_hours()
+    assert not any('step_mean' in event for event in events)
+
+
+class FakeBackend:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self,node):
+        self.submitted.append(node.name)
+        return str(len(self.submitted))
+
+    def poll(self):
+        return []
+
+
+def test_submit_last_bufr(tmp_path):
+    rootdir = tmp_path / 'root'
+    (rootdir/'fix_am').mkdir(parents=True)
+    (rootdir/'fix_am'/'hiresw_conusfv3_profdat').touch()
+    os.symlink(TEMPLATEDIR,rootdir/'run_templates_EMC')
+    rundir = tmp_path / 'NSSL' / '2022051100'
+    rundir.mkdir(parents=True)
+
+    cfg = dict(fv3flow._JET_CONFIG,rootdir=str(rootdir),tophour=1)
+    submitter = fv3progress.PostSubmitter(str(rundir),'20220511','local',cfg)
+    submitter.backend = FakeBackend()
+
+    assert submitter.submit(0) == ['upp_000', 'bufr_000']
+    assert submitter.submit(1) == ['upp_001', 'bufr_001']
+    assert submitter.submit(1) == []
+    assert submitter.pending and submitter.submit_last() == []
+
+    postbufr = rundir / 'postbufr'
+    for hour in range(2):
+        os.unlink(postbufr/f"queue.postbufr_{hour:03d}")
+    (postbufr/'done.postbufr_000').touch()
+    (postbufr/'error.postbufr_001').touch()
+    with pytest.raises(RuntimeError):
+        submitter.submit_last()
+    assert not submitter.pending
+
+    os.unlink(postbufr/'error.postbufr_001')
+    (postbufr/'done.postbufr_001').touch()
+    submitter.pending = True
+    assert submitter.submit_last() == ['bufr_002']
+    assert (postbufr/'exhiresw_bufr002.job').exists()
+    assert submitter.backend.submitted[-1] == 'bufr_002' and not submitter.pending
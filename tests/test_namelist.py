@@ -0,0 +1,477 @@
+import os
+import shutil
+import time
+
+import pytest
+
+import namelist
+from conftest import TEMPLATEDIR
+
+
+@pytest.fixture
+def nmlfile(tmp_path):
+    filename = str(tmp_path/'input.nml')
+    shutil.copy(os.path.join(TEMPLATEDIR,'input.nml_NSSL'),filename)
+    return filename
+
+
+def set_mtime(filename,mtime_ns):
+    os.utime(filename,ns=(mtime_ns,mtime_ns))
+
+
+##======================================================================
+## namelistCache
+##======================================================================
+
+def test_cache_hits(nmlfile):
+    cache = namelist.namelistCache()
+    set_mtime(nmlfile,time.time_ns()-10**10)
+
+    nmlgrp = cache.load(namelist.namelistGroup,nmlfile,'=')
+    nmlgrp['fv_core_nml'].layout = [1, 1]           # changes only the copy
+    nmlgrp = cache.load(namelist.namelistGroup,nmlfile,'=')
+    assert nmlgrp['fv_core_nml']['layout'].data == ['LAYOUTX', 'LAYOUTY']
+    assert cache.stats()['misses'] == 1 and cache.stats()['hits'] == 1
+
+    set_mtime(nmlfile,time.time_ns()-5*10**9)       # touched only
+    cache.load(namelist.namelistGroup,nmlfile,'=')
+    assert cache.stats()['misses'] == 1 and cache.stats()['hits'] == 2
+
+
+def test_cache_same_stamp(nmlfile):
+    cache = namelist.namelistCache()
+    mtime = time.time_ns()-10**10
+    set_mtime(nmlfile,mtime)
+    cache.load(namelist.namelistGroup,nmlfile,'=')
+
+    ## same size and modification time, the change time tells it
+    with open(nmlfile) as fhdl:
+        text = fhdl.read()
+    with open(nmlfile,'w') as fhdl:
+        fhdl.write(text.replace('LAYOUTX','LAYOUTZ'))
+    set_mtime(nmlfile,mtime)
+    nmlgrp = cache.load(namelist.namelistGroup,nmlfile,'=')
+    assert nmlgrp['fv_core_nml']['layout'].data == ['LAYOUTZ', 'LAYOUTY']
+
+
+def test_cache_recent_change(nmlfile):
+    ## a file changed within the granularity is hashed at each load
+    cache = namelist.namelistCache()
+    cache.load(namelist.namelistGroup,nmlfile,'=')
+    entry = next(iter(cache._entries.values()))
+    assert entry[0] is None
+
+    cache.load(namelist.namelistGroup,nmlfile,'=')
+    assert cache.stats()['misses'] == 1 and cache.stats()['hits'] == 1
+
+
+##======================================================================
+## namelistCMPGroup
+##======================================================================
+
+def make_block(text):
+    return namelist.namelistGroup.fromDict({'nml': text})['nml']
+
+
+def test_compare_blocks():
+    ## hash(-1) == hash(-2) in CPython, equal hashes are not equal values
+    blockL = make_block({'a': -1, 'b': True, 'c': [1.0, 2.0]})
+    blockR = make_block({'a': -2, 'b': True, 'c': [1.0, 2.0]})
+    result = namelist.namelistCMPGroup.compare_blocks(blockL,blockR)
+    assert result['varC'] == ['a'] and sorted(result['varS']) == ['b', 'c']
+
+    blockR.a = -1
+    result = namelist.namelistCMPGroup.compare_blocks(blockL,blockR)
+    assert result['varC'] == [] and sorted(result['varS']) == ['a', 'b', 'c']
+
+
+MATRIX = ["&a_nml\n  flag = .T.\n  n = 1\n  s = 'x'\n/\n&b_nml\n  k = 2\n/\n",
+          "&a_nml\n  flag = .true.\n  n = 2\n  s = 'x'\n/\n&b_nml\n  k = 2\n/\n",
+          "&a_nml\n  flag = .false.\n  n = 1\n/\n&b_nml\n  k = 3\n/\n",
+          "&a_nml\n  flag = .TRUE.\n  n = 3\n  s = 'x'\n/\n"]
+
+
+def test_compare_matrix(tmp_path):
+    import io
+    nmlgrps = []
+    for i,text in enumerate(MATRIX):
+        (tmp_path/f'{i}.nml').write_text(text)
+        nmlgrps.append(namelist.namelistGroup.fromFile(str(tmp_path/f'{i}.nml'),'='))
+
+    matrix = namelist.namelistCMPMatrix(nmlgrps)
+    assert matrix.table == {'a_nml': {'flag': [0, 0, 1, 0], 'n': [0, 1, 0, 2], 's': [0, 0, None, 0]},
+                            'b_nml': {'k': [0, 0, 1, None]}}
+    assert [str(value) for value in matrix.values['a_nml']['flag']] == ['.T.', '.false.']
+    assert [(blk, var) for blk,var,ids,distinct in matrix.differences()] == \
+           [('a_nml', 'flag'), ('a_nml', 'n'), ('a_nml', 's'), ('b_nml', 'k')]
+    assert [var for blk,var,ids,distinct in matrix.differences(['b_nml'])] == ['k']
+
+    ## strict, .T. and .true. are different values
+    assert namelist.namelistCMPMatrix(nmlgrps,strict=True).table['a_nml']['flag'] == [0, 1, 2, 3]
+
+    ofile = io.StringIO()
+    matrix.output(ofile,color=False)
+    lines = ofile.getvalue().splitlines()
+    assert 'namelist b_nml missing in file(s) 3' in ''.join(lines)
+    assert '  s                        aa-a' in lines
+    assert '  k                        aab-' in lines
+    assert '                             a = .T.  [0,1,3]' in lines
+
+
+SCHEMA_LEFT  = "&a_nml\n  n = 1\n  f = .T.\n  s = 'x'\n  l = 1\n/\n&b_nml\n  k = 2\n/\n&c_nml\n  c = 1\n/\n"
+SCHEMA_RIGHT = "&a_nml\n  n = 2\n  f = .true.\n  s = 'y'\n  r = 2.5\n/\n&b_nml\n  k = 2\n/\n&d_nml\n  d = 1\n/\n"
+
+
+@pytest.fixture
+def schema_files(tmp_path):
+    (tmp_path/'l.nml').write_text(SCHEMA_LEFT)
+    (tmp_path/'r.nml').write_text(SCHEMA_RIGHT)
+    return str(tmp_path/'l.nml'), str(tmp_path/'r.nml')
+
+
+def test_records_schema(schema_files):
+    left, right = schema_files
+    records = list(namelist.namelistCMPGroup.records(namelist.namelistGroup.fromFile(left,'='),
+                                                     namelist.namelistGroup.fromFile(right,'=')))
+    assert records == [
+        {'type': 'changed', 'block': 'a_nml', 'var': 'n', 'left': '1', 'right': '2', 'left_typed': 1, 'right_typed': 2},
+        {'type': 'changed', 'block': 'a_nml', 'var': 's', 'left': "'x'", 'right': "'y'", 'left_typed': 'x', 'right_typed': 'y'},
+        {'type': 'only', 'side': 'left', 'block': 'a_nml', 'var': 'l', 'value': '1', 'typed': 1},
+        {'type': 'only', 'side': 'right', 'block': 'a_nml', 'var': 'r', 'value': '2.5', 'typed': 2.5},
+        {'type': 'block', 'side': 'left', 'block': 'c_nml'},
+        {'type': 'block', 'side': 'right', 'block': 'd_nml'},
+        {'type': 'summary', 'left': left, 'right': right, 'blocks': 2, 'identical_blocks': 1, 'changed': 2,
+         'left_only': 1, 'right_only': 1, 'left_blocks': 1, 'right_blocks': 1}]
+
+
+@pytest.mark.parametrize('fmt', ['json', 'ndjson'])
+def test_records_format(schema_files,capsys,fmt):
+    import json
+    left, right = schema_files
+    assert namelist.main(['--format',fmt,left,right]) == 0
+    out = capsys.readouterr().out
+    if fmt == 'json':
+        records = json.loads(out)                 ## one valid JSON list
+        assert isinstance(records,list)
+    else:
+        records = [json.loads(line) for line in out.splitlines()]
+    assert [record['type'] for record in records] == ['changed', 'changed', 'only', 'only', 'block', 'block', 'summary']
+
+    ## no differences
+    assert namelist.main(['--format',fmt,left,left]) == 0
+    out = capsys.readouterr().out
+    records = json.loads(out) if fmt == 'json' else [json.loads(line) for line in out.splitlines()]
+    assert [record['type'] for record in records] == ['summary']
+
+
+##======================================================================
+## Variable index of findblock and merge1dict
+##======================================================================
+
+def test_findblock_index(capsys):
+    nmlgrp = namelist.namelistGroup.fromDict({'a_nml': {'x': 1, 'y': 1}, 'b_nml': {'x': 2, 'z': 1}})
+    assert nmlgrp.findblock('x') == 'a_nml'          ## the index is built here
+
+    del nmlgrp['a_nml']['x']
+    assert nmlgrp.findblock('x') == 'b_nml'
+    nmlgrp.merge1dict({'x': 5})
+    assert nmlgrp['b_nml']['x'].value == 5 and 'x' not in nmlgrp['a_nml']
+
+    nmlgrp['a_nml'].append('x',['7'],'=')
+    assert nmlgrp.findblock('x') == 'a_nml'
+    assert nmlgrp.findblock('x',['b_nml']) == 'b_nml'
+
+    nmlgrp['a_nml'].pop('y')
+    assert nmlgrp.findblock('y') is None
+    nmlgrp.merge1dict({'y': 3})
+    assert 'Unknown variables "y"' in capsys.readouterr().err and 'y' not in nmlgrp['a_nml']
+
+    ## replace a block
+    nmlgrp['b_nml'] = make_block({'w': 4})
+    assert nmlgrp.keys() == ['a_nml', 'b_nml']
+    assert nmlgrp.findblock('z') is None and nmlgrp.findblock('w') == 'b_nml'
+    nmlgrp.merge1dict({'w': 8, 'x': 9})
+    assert nmlgrp['b_nml']['w'].value == 8 and nmlgrp['a_nml']['x'].value == 9
+
+
+def test_merge_many():
+    nmlgrp = namelist.namelistGroup.fromDict({'a_nml': {'x': 1, 'y': 1}, 'b_nml': {'z': 1}})
+    nmlgrp.merge_many([{'x': 2, 'z': 2}, {'x': 3}, make_block({'z': 4, 'y': 5})])
+    assert [nmlgrp['a_nml']['x'].value, nmlgrp['a_nml']['y'].value, nmlgrp['b_nml']['z'].value] == [3, 5, 4]
+
+
+##======================================================================
+## diff_trees
+##======================================================================
+
+@pytest.fixture
+def trees(tmp_path):
+    left, right = tmp_path/'left', tmp_path/'right'
+    for topdir in (left, right):
+        (topdir/'mem01').mkdir(parents=True)
+        shutil.copy(os.path.join(TEMPLATEDIR,'nems.configure'),str(topdir/'nems.configure'))
+        shutil.copy(os.path.join(TEMPLATEDIR,'diag_table'),str(topdir/'mem01'/'diag_table'))
+    nmltext = open(os.path.join(TEMPLATEDIR,'input.nml_NSSL')).read()
+    cfgtext = open(os.path.join(TEMPLATEDIR,'model_configure_EMC')).read()
+    (left/'mem01'/'input.nml').write_text(nmltext)
+    (right/'mem01'/'input.nml').write_text(nmltext.replace('npx        = NPX','npx        = 100'))
+    (left/'mem01'/'model_configure').write_text(cfgtext)
+    (right/'mem01'/'model_configure').write_text(cfgtext.replace('TTTTTT','6'))
+    (left/'mem01'/'extra.nml').write_text('&x_nml\n  a = 1\n/\n')
+    (left/'same.nml').write_text('&x_nml\n  a = 1, .T.\n/\n')
+    (right/'same.nml').write_text('&x_nml\n  a   = 1,.true.\n/\n')
+    (left/'mem01'/'input.nml.bak').write_text(nmltext)          ## backups are skipped
+    (right/'mem01'/'field_table').write_text(open(os.path.join(TEMPLATEDIR,'field_table_NSSL')).read())
+    return str(left), str(right)
+
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_diff_trees(trees,jobs):
+    import io, json
+    left, right = trees
+
+    ofile = io.StringIO()
+    assert namelist.diff_trees(left,right,ofile,fmt='ndjson',jobs=jobs) == 4
+    records = [json.loads(line) for line in ofile.getvalue().splitlines()]
+
+    assert records[:2] == [{'type': 'file', 'side': 'left', 'file': 'mem01/extra.nml'},
+                           {'type': 'file', 'side': 'right', 'file': 'mem01/field_table'}]
+    changed = [(record['file'], record['var'], record['right']) for record in records if record['type'] == 'changed']
+    assert changed == [('mem01/input.nml', 'npx', '100'), ('mem01/model_configure', 'nhours_fcst', '6')]
+    assert records[-1] == {'type': 'tree_summary', 'left': left, 'right': right, 'files': 5, 'identical': 2,
+                           'equal': 1, 'differ': 2, 'left_files': 1, 'right_files': 1}
+
+    ofile = io.StringIO()
+    assert namelist.diff_trees(left,right,ofile,color=False,jobs=jobs) == 4
+    text = ofile.getvalue()
+    assert '++++ only in left : mem01/extra.nml' in text
+    assert '5 files in both trees: 2 identical, 1 with the same values, 2 different; 1 only in left, 1 only in right' in text
+
+
+def test_diff_trees_status(trees,capsys):
+    left, right = trees
+    assert namelist.main([left,right]) == 1
+    assert namelist.main([left,left]) == 0
+    assert '0 different; 0 only in left, 0 only in right' in capsys.readouterr().out
+
+
+##======================================================================
+## Backups
+##======================================================================
+
+def test_backups(tmp_path):
+    filename = str(tmp_path/'input.nml')
+    names = []
+    for text in ('a', 'b', 'a', 'c'):
+        with open(filename,'w') as fhdl:
+            fhdl.write(text)
+        names.append(os.path.basename(namelist.create_a_backup_file(filename,keep=2)))
+
+    ## "a" is not copied twice, the least recently used "b" is removed
+    assert names == ['input.nml.bak', 'input.nml.bak01', 'input.nml.bak', 'input.nml.bak02']
+    assert sorted(os.listdir(tmp_path)) == ['input.nml', 'input.nml.bak', 'input.nml.bak02', 'input.nml.bakidx']
+    assert list(namelist._backup_index(filename)) == ['input.nml.bak', 'input.nml.bak02']
+
+
+def test_write_inline(tmp_path,capsys):
+    filename = str(tmp_path/'input.nml')
+    with open(filename,'w') as fhdl:
+        fhdl.write('old\n')
+    opts = {'backup_keep': None, 'backup_bytes': None}
+
+    namelist.write_inline(filename,'old\n',opts)
+    assert 'unchanged' in capsys.readouterr().err
+    assert os.listdir(tmp_path) == ['input.nml']
+
+    namelist.write_inline(filename,'new\n',opts)
+    assert 'input.nml.bak' in capsys.readouterr().err
+    with open(filename) as fhdl:
+        assert fhdl.read() == 'new\n'
+    with open(filename+'.bak') as fhdl:
+        assert fhdl.read() == 'old\n'
+
+
+##======================================================================
+## writeToFileWithComments, patched from the source span index
+##======================================================================
+
+SOURCE = '''! header comment
+&fv_core_nml
+    layout   = 35, 28        ! processors
+    npx = 1821, npy = 1093
+    levels   = 1.0, 2.0,
+               3.0, 4.0
+    blend(1,1) = 1, 2
+    blend(1,2) = 3, 4
+
+    name = 'a, b' ! string with a comma
+/
+&other_nml
+    flag = .true.
+/
+'''
+
+
+def write_with_comments(nmlgrp,**kwargs):
+    import io
+    outhdl = io.StringIO()
+    nmlgrp.writeToFileWithComments(outhdl,**kwargs)
+    return outhdl.getvalue()
+
+
+@pytest.mark.parametrize('srcindex', [True, False])
+def test_write_with_comments(tmp_path,srcindex):
+    filename = tmp_path/'input.nml'
+    filename.write_text(SOURCE)
+    nmlgrp = namelist.namelistGroup.fromFile(str(filename),'=',srcindex=srcindex)
+    assert write_with_comments(nmlgrp) == SOURCE              # unchanged, written as it is
+
+    block = nmlgrp['fv_core_nml']
+    block.layout = [20, 50]
+    block.npy    = 1000
+    block.levels = [1.5, 2.5, 3.5]
+    block.name   = 'c'
+    assert write_with_comments(nmlgrp) == SOURCE.replace('35, 28  ','20,50  ') \
+                                             .replace('npy = 1093','npy = 1000') \
+                                             .replace('1.0, 2.0,\n               3.0, 4.0','1.5,2.5,3.5') \
+                                             .replace("'a, b'","'c'")
+
+
+def test_write_with_comments_2d(tmp_path):
+    filename = tmp_path/'input.nml'
+    filename.write_text(SOURCE)
+    nmlgrp = namelist.namelistGroup.fromFile(str(filename),'=',srcindex=True)
+    assert nmlgrp['fv_core_nml']['blend'].array == ((2, 2), (1, 2, 3, 4))
+
+    nmlgrp['fv_core_nml']['blend'][1][0] = '5'
+    nmlgrp['fv_core_nml']['blend']._invalidate()
+    nmlgrp['other_nml'].newvar = 3
+    output = write_with_comments(nmlgrp,forceadd=True)
+    assert '    blend(:,1) = 1,2,\n    blend(:,2) = 5,4,\n\n    name' in output
+    assert output.endswith('    flag = .true.\n  newvar = 3,\n/\n')
+
+    ## only the blocks asked for
+    assert 'newvar' not in write_with_comments(nmlgrp,blks=['fv_core_nml'],forceadd=True)
+
+
+##======================================================================
+## Semantic comparison: repeat counts, 2-D arrays and --rtol
+##======================================================================
+
+LEFT  = "&a_nml\n  x = 3*0.0, 1\n  y = 1.0, 2.0, 3.0\n  z(1,1) = 1, 2\n  z(1,2) = 3, 4\n  w = .true.\n/\n"
+RIGHT = "&a_nml\n  x = 0.0, 0., 0.0, 1\n  y = 1.0, 2.0000001, 3.1\n  z(:,1) = 1, 2\n  z(:,2) = 3, 5\n  w = .T.\n/\n"
+
+
+@pytest.fixture
+def groups(tmp_path):
+    (tmp_path/'l.nml').write_text(LEFT)
+    (tmp_path/'r.nml').write_text(RIGHT)
+    return (namelist.namelistGroup.fromFile(str(tmp_path/'l.nml'),'='),
+            namelist.namelistGroup.fromFile(str(tmp_path/'r.nml'),'='))
+
+
+def test_repeat_counts(groups):
+    left, right = groups
+    assert left['a_nml']['x'].canonical == (0.0, 0.0, 0.0, 1)
+    assert left['a_nml']['x'].isequal(right['a_nml']['x'],False)
+    assert not left['a_nml']['x'].isequal(right['a_nml']['x'],True)
+    assert left['a_nml']['w'].isequal(right['a_nml']['w'],False)
+    assert right['a_nml']['z'].array == ((2, 2), (1, 2, 3, 5))
+
+
+def test_diff_elements(groups):
+    left, right = groups
+    y1, y2 = left['a_nml']['y'], right['a_nml']['y']
+    assert y1.diff_elements(y2) == [((3,), 3.0, 3.1)]
+    assert y1.diff_elements(y2,rtol=0.0) == [((2,), 2.0, 2.0000001), ((3,), 3.0, 3.1)]
+    assert y1.diff_elements(y2,rtol=0.05) == []
+    assert left['a_nml']['z'].diff_elements(right['a_nml']['z']) == [((2, 2), 4, 5)]
+
+
+@pytest.mark.parametrize('rtol,changed', [(None, ['y', 'z']), (1e-6, ['y', 'z']), (0.05, ['z'])])
+def test_rtol(groups,rtol,changed):
+    left, right = groups
+    records = list(namelist.namelistCMPGroup.records(left,right,tolerance=rtol))
+    assert [record['var'] for record in records if record['type'] == 'changed'] == changed
+    if rtol is not None:
+        elements = {record['var']: record['elements'] for record in records if record['type'] == 'changed'}
+        assert elements['z'] == [{'index': [2, 2], 'left': 4, 'right': 5}]
+
+    strict = list(namelist.namelistCMPGroup.records(left,right,strict=True))
+    assert [record['var'] for record in strict if record['type'] == 'changed'] == ['x', 'y', 'z', 'w']
+
+
+@pytest.mark.parametrize('umask', [0o022, 0o077])
+def test_replace_file_mode(tmp_path,umask):
+    import stat
+    filename = str(tmp_path/'new.nml')
+    oldmask  = os.umask(umask)
+    try:
+        assert namelist.replace_file(filename,'text\n')
+    finally:
+        os.umask(oldmask)
+    assert stat.S_IMODE(os.stat(filename).st_mode) == 0o666 & ~umask
+
+    ## an existing file keeps its mode
+    os.chmod(filename,0o640)
+    assert namelist.replace_file(filename,'other\n')
+    assert stat.S_IMODE(os.stat(filename).st_mode) == 0o640
+
+
+##======================================================================
+## Batch rendering
+##======================================================================
+
+BATCH_VALUES = {'NPX': 100, 'NPY': 90, 'LAYOUTX': 5, 'LAYOUTY': 6, 'BC_UPDATE': 3}
+
+
+def run_batch(tmp_path,monkeypatch,table,*argv):
+    monkeypatch.chdir(tmp_path)
+    return namelist.main(['-b',str(table),'-o','input.nml']+list(argv)+[os.path.join(TEMPLATEDIR,'input.nml_NSSL')])
+
+
+def batch_layout(tmp_path,rundir):
+    nmlgrp = namelist.namelistGroup.fromFile(str(tmp_path/rundir/'input.nml'),'=')
+    return nmlgrp['fv_core_nml']['layout'].value, nmlgrp['fv_core_nml']['npx'].value
+
+
+@pytest.mark.parametrize('jobs', ['1', '2'])
+def test_batch_csv(tmp_path,monkeypatch,capsys,jobs):
+    table = tmp_path/'runs.csv'
+    columns = ','.join(f'${key}' for key in BATCH_VALUES)
+    table.write_text(f'dir,{columns},fv_core_nml.k_split\n'+
+                     ''.join(f'mem{i},{i*100},90,5,{i},3,{i}\n' for i in range(1,4)))
+    assert run_batch(tmp_path,monkeypatch,table,'-j',jobs) == 0
+    for i in range(1,4):
+        assert batch_layout(tmp_path,f'mem{i}') == ([5, i], i*100)
+
+    ## place holders as variable names, without "$"
+    table.write_text('dir,NPX,LAYOUTX\nbad1,100,5\n')
+    assert run_batch(tmp_path,monkeypatch,table,'-j',jobs) == 1
+    assert 'ERROR: unknown variables NPX,LAYOUTX' in capsys.readouterr().err
+    assert not (tmp_path/'bad1'/'input.nml').exists()
+
+
+@pytest.mark.parametrize('jobs', ['1', '2'])
+def test_batch_json(tmp_path,monkeypatch,capsys,jobs):
+    import json
+    runs  = [{'dir': f'mem{i}', 'values': dict(BATCH_VALUES,LAYOUTY=i)} for i in range(1,4)]
+    table = tmp_path/'runs.json'
+    table.write_text(json.dumps({'runs': runs}))
+    assert run_batch(tmp_path,monkeypatch,table,'-j',jobs) == 0
+    assert [batch_layout(tmp_path,f'mem{i}') for i in range(1,4)] == [([5, i], 100) for i in range(1,4)]
+
+    ## BC_UPDATE is missing in the second run
+    del runs[1]['values']['BC_UPDATE']
+    runs[1]['dir'] = 'bad2'
+    table.write_text(json.dumps(runs))
+    assert run_batch(tmp_path,monkeypatch,table,'-j',jobs) == 1
+    assert 'ERROR: place holders BC_UPDATE are not replaced in <bad2/input.nml>' in capsys.readouterr().err
+    assert not (tmp_path/'bad2'/'input.nml').exists()
+
+
+def test_place_holders():
+    template = namelist.namelistTemplate(os.path.join(TEMPLATEDIR,'input.nml_NSSL'))
+    assert template.holders == {('fv_core_nml', 'layout'): {'LAYOUTX', 'LAYOUTY'},
+                                ('fv_core_nml', 'npx'): {'NPX'}, ('fv_core_nml', 'npy'): {'NPY'},
+                                ('fv_core_nml', 'bc_update_interval'): {'BC_UPDATE'}}
@@ -0,0 +1,85 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from conftest import TOOLSDIR, TEMPLATEDIR
+
+CLIENT  = os.path.join(TOOLSDIR,'nmlclient.py')
+NMLFILE = os.path.join(TEMPLATEDIR,'input.nml_NSSL')
+
+
+def run_client(sockpath,*argv):
+    env = dict(os.environ,NAMELIST_SOCKET=sockpath)
+    return subprocess.run([sys.executable,CLIENT]+list(argv),env=env,stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE,universal_newlines=True)
+
+
+def test_fallback_without_server(tmp_path):
+    proc = run_client(str(tmp_path/'none.sock'),'-p',NMLFILE)
+    assert proc.returncode == 0
+    assert '&fv_core_nml' in proc.stdout
+
+
+def test_no_fallback_after_send(tmp_path):
+    ## a server that reads the request and dies without an answer
+    sockpath = str(tmp_path/'dead.sock')
+    server = socket.socket(socket.AF_UNIX,socket.SOCK_STREAM)
+    server.bind(sockpath)
+    server.listen(1)
+
+    def serve():
+        conn, _ = server.accept()
+        with conn:
+            conn.recv(65536)
+
+    thread = threading.Thread(target=serve)
+    thread.start()
+    try:
+        proc = run_client(sockpath,'-p',NMLFILE)
+    finally:
+        thread.join()
+        server.close()
+
+    assert proc.returncode == 2
+    assert proc.stdout == ''
+    assert 'ERROR: request to' in proc.stderr
+
+
+def test_client_environment(tmp_path):
+    ## the server has its own NAMELIST_* variables, the client ones are used
+    sockpath = str(tmp_path/'nml.sock')
+    env = dict(os.environ,NAMELIST_BACKUP_KEEP='5',NAMELIST_CACHE_DIR=str(tmp_path))
+    server = subprocess.Popen([sys.executable,os.path.join(TOOLSDIR,'namelist.py'),'--serve',sockpath],
+                              env=env,stderr=subprocess.PIPE)
+    try:
+        for _ in range(100):
+            if os.path.exists(sockpath): break
+            time.sleep(0.05)
+
+        nmlfile = tmp_path/'input.nml'
+        nmlfile.write_text(open(NMLFILE).read())
+        setfile = tmp_path/'set.txt'
+        os.environ['NAMELIST_BACKUP_KEEP'] = '1'
+        try:
+            for npx in (11, 12, 13):
+                setfile.write_text(f'npx = {npx}\n')
+                proc = run_client(sockpath,'-s','-i',str(nmlfile),str(setfile))
+                assert proc.returncode == 0, proc.stderr
+        finally:
+            del os.environ['NAMELIST_BACKUP_KEEP']
+        assert sorted(path.name for path in tmp_path.glob('input.nml.bak*')) == ['input.nml.bak02', 'input.nml.bakidx']
+
+        ## --cachedir of one request does not stay for the next one
+        cachedir = tmp_path/'cache'
+        cachedir.mkdir()
+        assert run_client(sockpath,'--cachedir',str(cachedir),'-p',NMLFILE).returncode == 0
+        assert len(list(cachedir.iterdir())) == 1
+        assert run_client(sockpath,'-p',os.path.join(TEMPLATEDIR,'input.nml_EMC')).returncode == 0
+        assert len(list(cachedir.iterdir())) == 1
+        assert not list(tmp_path.glob('*.pkl'))
+    finally:
+        run_client(sockpath,'--shutdown')
+        server.wait(timeout=10)
@@ -0,0 +1,84 @@
+'''Parse and write parity of namelist.py with the baseline version on the
+   run_templates_EMC files, the baseline script is taken from git.
+'''
+import os
+import subprocess
+import sys
+
+import pytest
+
+import namelist
+from conftest import TOOLSDIR, TEMPLATEDIR
+
+BASELINE  = '9e50472'
+NMLFILES  = ['input.nml_NSSL', 'input.nml_EMC']
+CFGFILES  = ['model_configure_NSSL', 'model_configure_EMC', 'model_configure_UKM', 'nems.configure']
+
+## the baseline kept an inline comment after the last value in the value
+BASELINE_BUGS = {'input.nml_EMC': [('  cdmbgwd = 0.88,0.04       ! NCEP default,\n', '  cdmbgwd = 0.88,0.04,\n')]}
+
+
+@pytest.fixture(scope='session')
+def baseline(tmp_path_factory):
+    rootdir = os.path.dirname(TOOLSDIR)
+    try:
+        text = subprocess.run(['git','show',f'{BASELINE}:tools/namelist.py'],cwd=rootdir,stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL,universal_newlines=True,check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip(f'baseline {BASELINE} is not available')
+    script = tmp_path_factory.mktemp('baseline') / 'namelist.py'
+    script.write_text(text)
+    return str(script)
+
+
+def run(script,*args,cwd=None):
+    proc = subprocess.run([sys.executable,script]+list(args),stdout=subprocess.PIPE,stderr=subprocess.DEVNULL,
+                          universal_newlines=True,cwd=cwd)
+    assert proc.returncode == 0
+    return proc.stdout
+
+
+def decode(text,tmp_path,varsep='='):
+    filename = tmp_path / 'decode.nml'
+    filename.write_text(text)
+    nmlgrp = namelist.namelistGroup.fromFile(str(filename),varsep,dictionary=(varsep == ':'))
+    return {name: nmlgrp[name].cmpkeys(True) for name in nmlgrp.keys()}
+
+
+@pytest.mark.parametrize('name', NMLFILES)
+def test_print(baseline,name):
+    filename = os.path.join(TEMPLATEDIR,name)
+    expected = run(baseline,'-p',filename)
+    for old,new in BASELINE_BUGS.get(name,[]):
+        assert old in expected
+        expected = expected.replace(old,new)
+    assert run(os.path.join(TOOLSDIR,'namelist.py'),'-p',filename) == expected
+
+
+@pytest.mark.parametrize('name', CFGFILES)
+@pytest.mark.parametrize('option', ['-p', '-k'])
+def test_config(baseline,name,option):
+    filename = os.path.join(TEMPLATEDIR,name)
+    assert run(os.path.join(TOOLSDIR,'namelist.py'),option,'-d',':',filename) == run(baseline,option,'-d',':',filename)
+
+
+@pytest.mark.parametrize('name', NMLFILES)
+@pytest.mark.parametrize('action', [[], ['-s', 'set.txt'], ['-s', '-f', 'set.txt'], ['-m', 'input.nml_NSSL']])
+def test_keep(baseline,tmp_path,name,action):
+    ''' -k keeps the source text, the values are those of the baseline'''
+    (tmp_path/'set.txt').write_text('layout = 4, 5\nnpx = 100\nnewvar = 3\n')
+    os.symlink(os.path.join(TEMPLATEDIR,'input.nml_NSSL'),tmp_path/'input.nml_NSSL')
+
+    filename = os.path.join(TEMPLATEDIR,name)
+    args     = ['-k']+action[:-1]+[filename]+action[-1:]
+    output   = run(os.path.join(TOOLSDIR,'namelist.py'),*args,cwd=str(tmp_path))
+    values   = decode(output,tmp_path)
+    assert values == decode(run(baseline,*args,cwd=str(tmp_path)),tmp_path)
+    if '-s' in action:
+        assert values['fv_core_nml']['layout'] == ('4', '5')
+
+    ## the comment lines and the blank lines of the source are kept
+    with open(filename) as fhdl:
+        srclines = [line for line in fhdl if line.startswith('!') or not line.strip()]
+    outlines = output.splitlines(True)
+    assert all(line in outlines for line in srclines)
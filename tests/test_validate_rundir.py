@@ -0,0 +1,65 @@
+import os
+
+import fv3flow
+import validate_rundir
+from conftest import TEMPLATEDIR
+
+
+def prepare_rundir(tmp_path,eventdate):
+    rootdir = tmp_path / 'root'
+    rootdir.mkdir()
+    os.symlink(TEMPLATEDIR,rootdir/'run_templates_EMC')
+    eventdir = tmp_path / 'NSSL' / f"{eventdate}00"
+    os.makedirs(eventdir/'INPUT')
+    nodes = fv3flow.node_table(fv3flow.build_pipeline(str(eventdir),eventdate,dict(fv3flow._JET_CONFIG,rootdir=str(rootdir))))
+    nodes['fcst'].prepare()
+    return eventdir
+
+
+def test_prepared_rundir(tmp_path):
+    eventdir = prepare_rundir(tmp_path,'20211231')
+    required, results, problems = validate_rundir.validate_rundir(str(eventdir))
+    assert problems == []
+
+    ## the 60 h forecast ends in 2022, the fix files are links to nowhere
+    ## here and run_fv3_Jet.sh links the years up to 2021 only
+    for year,status in ((2021, 'broken'), (2022, 'missing')):
+        path = os.path.join(eventdir,f"co2historicaldata_{year}.txt")
+        assert required[path] == f"ico2 = 2, forecast in {year}"
+        assert results[path][0] == status
+    assert os.path.join(eventdir,'co2historicaldata_2020.txt') not in required
+    assert results[os.path.join(eventdir,'field_table')][0] == 'good'
+
+
+def test_diag_table_date(tmp_path):
+    eventdir = prepare_rundir(tmp_path,'20220511')
+    with open(eventdir/'diag_table') as fhdl:
+        lines = fhdl.readlines()
+    lines[1] = '2022 05 12 00 0 0\n'
+    lines.append('"gfs_dyn", "ucomp", "ugrd", "fv3_nowhere", "all", .false., "none", 2\n')
+    with open(eventdir/'diag_table','w') as fhdl:
+        fhdl.writelines(lines)
+
+    start, end = validate_rundir.forecast_dates(validate_rundir.namelist.namelistGroup.fromFile(
+                                                str(eventdir/'model_configure'),':',dictionary=True))
+    problems = validate_rundir.check_diag_table(str(eventdir/'diag_table'),start)
+    assert len(problems) == 2
+    assert 'not the start date 2022 05 11 00' in problems[0]
+    assert 'undefined file "fv3_nowhere"' in problems[1]
+
+
+def test_field_table(tmp_path):
+    table = tmp_path / 'field_table'
+    table.write_text('# comment with "quotes" /\n'
+                     ' "TRACER", "atmos_mod", "sphum"\n'
+                     '     "longname", "specific humidity"\n'
+                     '     "profile_type", "fixed", "surface_value=1.e30" /\n'
+                     ' "TRACER", "atmos_mod", "liq_wat" /  # cloud water\n'
+                     ' "TRACER", "atmos_mod", "sphum" /\n'
+                     ' "TRACER", "atmos_mod", "o3mr"\n')
+    nmlgrp = validate_rundir.namelist.namelistGroup.fromDict({'fv_core_nml': {'nwat': 3}})
+    names, problems = validate_rundir.field_table_tracers(str(table))
+    assert names == ['sphum', 'liq_wat', 'sphum']
+    assert [problem.split(': ',1)[1] for problem in problems] == \
+           ['line 6: duplicated tracer "sphum"', 'line 7: record not ended with "/"']
+    assert validate_rundir.check_field_table(str(table),nmlgrp)[-1].endswith('tracer "ice_wat" is missing for nwat = 3')
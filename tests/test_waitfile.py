@@ -0,0 +1,95 @@
+import os
+import select
+import threading
+import time
+
+import pytest
+
+import waitfile
+
+
+def write_later(delay,path,data=b'x'):
+    timer = threading.Timer(delay,lambda: open(path,'ab').write(data))
+    timer.start()
+    return timer
+
+
+def test_inotify(tmp_path):
+    try:
+        notify = waitfile.Inotify()
+    except OSError as err:
+        pytest.skip(str(err))
+    try:
+        assert notify.add_watch(str(tmp_path))
+        assert not notify.add_watch(str(tmp_path/'none'))
+        (tmp_path/'a.txt').write_text('a')
+        events, _, _ = select.select([notify],[],[],5.0)
+        assert events and notify.drain() > 0
+        assert notify.drain() == 0
+    finally:
+        notify.close()
+
+
+@pytest.mark.parametrize('usenotify', [True, False])
+def test_stable(tmp_path,usenotify):
+    ## the file is written for 0.3 s, ready 0.2 s after the last write
+    path = str(tmp_path/'a.txt')
+    open(path,'wb').close()
+    timers = [write_later(0.05*i,path) for i in range(1,7)]
+    readytime = {}
+    btime = time.monotonic()
+    pending = waitfile.wait_for([path],stable=0.2,timeout=10,poll=0.02,usenotify=usenotify,
+                                callback=lambda pattern,paths: readytime.update({pattern: time.monotonic()}))
+    for timer in timers: timer.join()
+    assert pending == []
+    assert os.path.getsize(path) == 6
+    assert readytime[path]-btime >= 0.5
+
+
+@pytest.mark.parametrize('usenotify', [True, False])
+def test_minsize(tmp_path,usenotify):
+    path = str(tmp_path/'a.txt')
+    with open(path,'wb') as fhdl: fhdl.write(b'x'*10)
+    assert waitfile.wait_for([path],stable=0.0,minsize=100,timeout=0.2,poll=0.02,usenotify=usenotify) == [path]
+
+    timer = write_later(0.1,path,b'x'*90)
+    assert waitfile.wait_for([path],stable=0.0,minsize=100,timeout=10,poll=0.02,usenotify=usenotify) == []
+    timer.join()
+
+
+@pytest.mark.parametrize('usenotify', [True, False])
+def test_count(tmp_path,usenotify):
+    pattern = str(tmp_path/'done.lbc_*')
+    timers = [write_later(0.05*i,str(tmp_path/f'done.lbc_{i:03d}')) for i in range(3)]
+    ready = []
+    pending = waitfile.wait_for([pattern],stable=0.0,count=3,timeout=10,poll=0.02,usenotify=usenotify,
+                                callback=lambda pattern,paths: ready.append((pattern,paths)))
+    for timer in timers: timer.join()
+    assert pending == []
+    assert ready == [(pattern, [str(tmp_path/f'done.lbc_{i:03d}') for i in range(3)])]
+
+    ## a fourth file does not come
+    assert waitfile.wait_for([pattern],stable=0.0,count=4,timeout=0.2,poll=0.02,usenotify=usenotify) == [pattern]
+
+
+@pytest.mark.parametrize('usenotify', [True, False])
+def test_anyone(tmp_path,usenotify):
+    paths = [str(tmp_path/name) for name in ('a.txt', 'b.txt', 'c.txt')]
+    timer = write_later(0.1,paths[1])
+    ready = []
+    pending = waitfile.wait_for(paths,stable=0.0,timeout=10,poll=0.02,anyone=True,usenotify=usenotify,
+                                callback=lambda pattern,paths: ready.append(pattern))
+    timer.join()
+    assert ready == [paths[1]]
+    assert pending == [paths[0], paths[2]]
+
+
+@pytest.mark.parametrize('usenotify', [True, False])
+def test_timeout(tmp_path,usenotify):
+    paths = [str(tmp_path/'a.txt'), str(tmp_path/'b.txt')]
+    open(paths[0],'wb').close()
+    btime = time.monotonic()
+    pending = waitfile.wait_for(paths,stable=0.0,timeout=0.3,poll=0.02,usenotify=usenotify)
+    elapsed = time.monotonic()-btime
+    assert pending == [paths[1]]
+    assert 0.3 <= elapsed < 5.0
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+## ---------------------------------------------------------------------
+##
+## Benchmarks for the namelist.py module.
+##
+##   parse   Time namelistGroup.fromFile on a namelist file, optionally
+##           against a reference copy of namelist.py, e.g. an earlier
+##           revision extracted with
+##
+##             git show <rev>:tools/namelist.py > /tmp/namelist_ref.py
+##
+##   memory  Memory held by parsed namelist groups, in bytes per variable,
+##           optionally against a reference copy of namelist.py.
+##
+##   diff    Time namelistCMPGroup of a namelist file against a copy of
+##           itself with one added variable, optionally against a reference
+##           copy of namelist.py.
+##
+##   merge   Time merge1dict of a flat override dict with every "-s"-th
+##           variable of a namelist file, optionally against a reference
+##           copy of namelist.py.
+##
+##   serve   Time a namelist.py command run in a fresh process, through
+##           nmlclient.py and a "namelist.py --serve" server, and as a
+##           request to the server without client startup.
+##
+##   importtime
+##           Cold start regression check. Time "import namelist" with
+##           "python -X importtime" and the wall time of "-p" through
+##           namelist.py, nmlclient.py and of chknml.py in fresh processes,
+##           against fixed budgets. It also fails when modules needed only
+##           by some actions are imported by "import namelist". The exit
+##           status is 1 when any check fails.
+##
+##   matrix  Time the N-way comparison (namelistCMPMatrix) of N copies
+##           of a namelist file against all pairwise comparisons.
+##
+## ---------------------------------------------------------------------
+##
+## Requirements:
+##
+##   o Python 3.6 or above
+##
+########################################################################
+
+import os, sys
+import argparse
+import importlib.util
+import gc
+import timeit
+import tracemalloc
+import subprocess
+import tempfile
+import time
+
+_tooldir = os.path.dirname(os.path.abspath(__file__))
+_rootdir = os.path.dirname(_tooldir)
+sys.path.insert(0,_tooldir)
+
+import namelist
+
+_default_nml = os.path.join(_rootdir,'run_templates_EMC','input.nml_NSSL')
+
+##======================================================================
+## Helpers
+##======================================================================
+
+def load_reference(filename):
+    '''Import a reference copy of namelist.py under the name "namelist_ref"'''
+
+    spec = importlib.util.spec_from_file_location('namelist_ref',filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+#enddef load_reference
+
+##----------------------------------------------------------------------
+
+def best_of(func,number,repeat):
+    '''Return the best time per call in milliseconds'''
+
+    times = timeit.repeat(func,number=number,repeat=repeat)
+    return min(times)/number*1000.0
+#enddef best_of
+
+##======================================================================
+## Benchmarks
+##======================================================================
+
+def bench_parse(args):
+    '''Time namelistGroup.fromFile'''
+
+    devnull = open(os.devnull,'w')
+    stderr  = sys.stderr
+    sys.stderr = devnull               # mute warnings of the template place holders
+    try:
+        modules = [('current',namelist)]
+        if args.ref:
+            modules.append(('reference',load_reference(args.ref)))
+
+        results = {}
+        for label,module in modules:
+            func = lambda: module.namelistGroup.fromFile(args.file,args.separator,False,args.separator == ':')
+            results[label] = best_of(func,args.number,args.repeat)
+    finally:
+        sys.stderr = stderr
+        devnull.close()
+
+    print(f"parse {args.file} (best of {args.repeat} x {args.number})")
+    for label,msec in results.items():
+        print(f"  {label:<10} {msec:10.3f} ms/parse")
+
+    if 'reference' in results:
+        print(f"  {'speedup':<10} {results['reference']/results['current']:10.2f} x")
+#enddef bench_parse
+
+##----------------------------------------------------------------------
+
+def bench_memory(args):
+    '''Measure memory held by "args.copies" parsed copies of a namelist file'''
+
+    devnull = open(os.devnull,'w')
+    stderr  = sys.stderr
+    sys.stderr = devnull
+    try:
+        modules = [('current',namelist)]
+        if args.ref:
+            modules.append(('reference',load_reference(args.ref)))
+
+        results = {}
+        for label,module in modules:
+            fromFile = module.namelistGroup.fromFile
+            fromFile(args.file,args.separator,False,args.separator == ':')  # warm up caches
+
+            gc.collect()
+            tracemalloc.start()
+            before = tracemalloc.get_traced_memory()[0]
+            groups = [fromFile(args.file,args.separator,False,args.separator == ':')
+                      for _ in range(args.copies)]
+            gc.collect()
+            after  = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+
+            nvars = sum(len(blk) for grp in groups for blk in grp.values())
+            results[label] = ((after-before)/nvars, (after-before)/args.copies)
+            del groups
+    finally:
+        sys.stderr = stderr
+        devnull.close()
+
+    print(f"memory {args.file} ({args.copies} copies)")
+    for label,(pervar,perfile) in results.items():
+        print(f"  {label:<10} {pervar:10.1f} bytes/variable {perfile/1024:10.1f} KiB/file")
+
+    if 'reference' in results:
+        print(f"  {'saving':<10} {1.0-results['current'][0]/results['reference'][0]:10.1%}")
+#enddef bench_memory
+
+##----------------------------------------------------------------------
+
+def bench_diff(args):
+    '''Time namelistCMPGroup of two parsed groups'''
+
+    devnull = open(os.devnull,'w')
+    stderr  = sys.stderr
+    sys.stderr = devnull
+    try:
+        modules = [('current',namelist)]
+        if args.ref:
+            modules.append(('reference',load_reference(args.ref)))
+
+        results = {}
+        for label,module in modules:
+            fromFile = module.namelistGroup.fromFile
+            grp1 = fromFile(args.file,args.separator,False,args.separator == ':')
+            grp2 = fromFile(args.file,args.separator,False,args.separator == ':')
+            grp2[grp2.keys()[0]].append('bench_var',['1'],',')    # one difference in the first block
+
+            func = lambda: module.namelistCMPGroup(grp1,grp2,args.strict)
+            results[label] = best_of(func,args.number,args.repeat)
+    finally:
+        sys.stderr = stderr
+        devnull.close()
+
+    print(f"diff {args.file} (best of {args.repeat} x {args.number})")
+    for label,msec in results.items():
+        print(f"  {label:<10} {msec:10.3f} ms/diff")
+
+    if 'reference' in results:
+        print(f"  {'speedup':<10} {results['reference']/results['current']:10.2f} x")
+#enddef bench_diff
+
+##----------------------------------------------------------------------
+
+def bench_merge(args):
+    '''Time namelistGroup.merge1dict'''
+
+    devnull = open(os.devnull,'w')
+    stderr  = sys.stderr
+    sys.stderr = devnull
+    try:
+        modules = [('current',namelist)]
+        if args.ref:
+            modules.append(('reference',load_reference(args.ref)))
+
+        results = {}
+        for label,module in modules:
+            nmlgrp = module.namelistGroup.fromFile(args.file,args.separator,False,args.separator == ':')
+            allvars  = [var for blk in nmlgrp.values() for var in blk.keys()]
+            override = module.namelistBlock.clone_from_dict({var: 1 for var in allvars[::args.step]})
+
+            func = lambda: nmlgrp.merge1dict(override)
+            results[label] = best_of(func,args.number,args.repeat)
+    finally:
+        sys.stderr = stderr
+        devnull.close()
+
+    print(f"merge {len(override)} variables into {args.file} (best of {args.repeat} x {args.number})")
+    for label,msec in results.items():
+        print(f"  {label:<10} {msec:10.3f} ms/merge")
+
+    if 'reference' in results:
+        print(f"  {'speedup':<10} {results['reference']/results['current']:10.2f} x")
+#enddef bench_merge
+
+##----------------------------------------------------------------------
+
+def bench_serve(args):
+    '''Time fresh processes against requests to a namelist.py server'''
+
+    import nmlclient
+
+    nmlpy   = os.path.join(_tooldir,'namelist.py')
+    client  = os.path.join(_tooldir,'nmlclient.py')
+    nmlargs = [arg for arg in args.nmlargs if arg != '--'] or [args.file]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        sockpath = os.path.join(tmpdir,'namelist.sock')
+        env = dict(os.environ, NAMELIST_SOCKET=sockpath)
+        server = subprocess.Popen([sys.executable,nmlpy,'--serve',sockpath],stderr=subprocess.DEVNULL)
+        try:
+            deadline = time.monotonic()+30.0
+            while not os.path.exists(sockpath):
+                if server.poll() is not None:
+                    raise RuntimeError(f"namelist.py --serve exited with status {server.returncode}")
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"namelist.py --serve did not create {sockpath} in 30 s")
+                time.sleep(0.05)
+
+            def send(req):
+                return nmlclient.request(nmlclient.connect(sockpath),req)
+
+            def run(cmd):
+                subprocess.run(cmd,env=env,stdout=subprocess.DEVNULL,stderr=subprocess.DEVNULL)
+
+            req = {'op': 'run', 'argv': nmlargs, 'cwd': os.getcwd()}
+            results = {
+                'fresh'   : best_of(lambda: run([sys.executable,nmlpy]+nmlargs),args.number,args.repeat),
+                'client'  : best_of(lambda: run([sys.executable,client]+nmlargs),args.number,args.repeat),
+                'request' : best_of(lambda: send(req),args.number,args.repeat),
+            }
+            stats = send({'op': 'stats'})
+        finally:
+            try:
+                nmlclient.request(nmlclient.connect(sockpath),{'op': 'shutdown'})
+            except OSError:
+                pass
+            if server.poll() is None:
+                try:
+                    server.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+                    server.wait()
+
+    print(f"serve namelist.py {' '.join(nmlargs)} (best of {args.repeat} x {args.number})")
+    for label,msec in results.items():
+        print(f"  {label:<10} {msec:10.3f} ms/call")
+    print(f"  {'server':<10} {stats['elapsed']/stats['requests']*1000:10.3f} ms/call in the server")
+    print(f"  {'speedup':<10} {results['fresh']/results['client']:10.2f} x with client")
+#enddef bench_serve
+
+##----------------------------------------------------------------------
+
+_lazy_modules = ('argparse', 'tempfile', 'shutil', 'filecmp', 'pickle', 'json', 'csv',
+                 'concurrent.futures', 'socket', 'socketserver', 'hashlib')
+
+def bench_importtime(args):
+    '''Check the cold start time of namelist.py against budgets'''
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=tmpdir)   # byte code is cached as in normal use
+        env.pop('PYTHONDONTWRITEBYTECODE',None)
+        env.pop('NAMELIST_SOCKET',None)
+
+        def run(cmd):
+            return subprocess.run(cmd,env=env,cwd=_tooldir,stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.PIPE,universal_newlines=True)
+
+        importcmd = [sys.executable,'-X','importtime','-c','import namelist']
+        run(importcmd)                                          # warm up the byte code cache
+
+        imports = {}
+        for _ in range(args.repeat):
+            for line in run(importcmd).stderr.splitlines():
+                fields = line.split('|')
+                if len(fields) == 3 and fields[1].strip().isdigit():
+                    name = fields[2].strip()
+                    usec = int(fields[1])
+                    imports[name] = min(usec,imports.get(name,usec))
+
+        commands = [('namelist.py -p', [sys.executable,'namelist.py','-p',args.file], args.budget_print),
+                    ('nmlclient.py -p',[sys.executable,'nmlclient.py','-p',args.file], args.budget_print),
+                    ('chknml.py',      [sys.executable,'chknml.py',args.file],          args.budget_chknml)]
+        results = [('import namelist', imports.get('namelist',0)/1000.0, args.budget_import)]
+        for label,cmd,budget in commands:
+            run(cmd)
+            results.append((label, best_of(lambda: run(cmd),1,args.repeat), budget))
+
+    failed = False
+    print(f"importtime {args.file} (best of {args.repeat})")
+    for label,msec,budget in results:
+        status = 'ok' if msec <= budget else 'OVER BUDGET'
+        failed = failed or msec > budget
+        print(f"  {label:<16} {msec:10.3f} ms  budget {budget:8.1f} ms  {status}")
+
+    eager = [name for name in _lazy_modules if name in imports]
+    if eager:
+        failed = True
+        print(f"  imported by \"import namelist\", should be imported lazily: {', '.join(eager)}")
+
+    sys.exit(1 if failed else 0)
+#enddef bench_importtime
+
+##----------------------------------------------------------------------
+
+def bench_matrix(args):
+    '''Time N-way comparison against pairwise comparisons of "args.files" groups'''
+
+    devnull = open(os.devnull,'w')
+    stderr  = sys.stderr
+    sys.stderr = devnull
+    try:
+        fromFile = namelist.namelistGroup.fromFile
+        groups = [fromFile(args.file,args.separator,False,args.separator == ':') for _ in range(args.files)]
+    finally:
+        sys.stderr = stderr
+        devnull.close()
+
+    def pairwise():
+        for i in range(len(groups)):
+            for j in range(i+1,len(groups)):
+                namelist.namelistCMPGroup(groups[i],groups[j])
+
+    msec_matrix = best_of(lambda: namelist.namelistCMPMatrix(groups),1,args.repeat)
+    msec_pairs  = best_of(pairwise,1,args.repeat)
+
+    npairs = args.files*(args.files-1)//2
+    print(f"matrix {args.file} ({args.files} files, {npairs} pairs, best of {args.repeat})")
+    print(f"  {'N-way':<10} {msec_matrix:10.3f} ms")
+    print(f"  {'pairwise':<10} {msec_pairs:10.3f} ms")
+    print(f"  {'speedup':<10} {msec_pairs/msec_matrix:10.2f} x")
+#enddef bench_matrix
+
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+##
+## Entance Point
+##
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description="Benchmarks for namelist.py")
+    subparsers = parser.add_subparsers(dest='bench')
+    subparsers.required = True
+
+    pparse = subparsers.add_parser('parse', help="Time parsing of a namelist file")
+    pparse.add_argument("file", nargs='?', default=_default_nml, help="Namelist file, default: %(default)s")
+    pparse.add_argument("-d", "--separator", default='=',   help="Variable separator, default: '='")
+    pparse.add_argument("--ref",  default=None,             help="Reference copy of namelist.py to compare with")
+    pparse.add_argument("-n", "--number", type=int, default=200, help="Parses per timing, default: %(default)s")
+    pparse.add_argument("-r", "--repeat", type=int, default=5,   help="Number of timings, default: %(default)s")
+    pparse.set_defaults(func=bench_parse)
+
+    pmem = subparsers.add_parser('memory', help="Memory held by parsed namelist files")
+    pmem.add_argument("file", nargs='?', default=_default_nml, help="Namelist file, default: %(default)s")
+    pmem.add_argument("-d", "--separator", default='=',   help="Variable separator, default: '='")
+    pmem.add_argument("--ref",  default=None,             help="Reference copy of namelist.py to compare with")
+    pmem.add_argument("-c", "--copies", type=int, default=40, help="Number of parsed copies to hold, default: %(default)s")
+    pmem.set_defaults(func=bench_memory)
+
+    pdiff = subparsers.add_parser('diff', help="Time comparison of two namelist groups")
+    pdiff.add_argument("file", nargs='?', default=_default_nml, help="Namelist file, default: %(default)s")
+    pdiff.add_argument("-d", "--separator", default='=',   help="Variable separator, default: '='")
+    pdiff.add_argument("-s", "--strict", action="store_true", help="Strict comparison")
+    pdiff.add_argument("--ref",  default=None,             help="Reference copy of namelist.py to compare with")
+    pdiff.add_argument("-n", "--number", type=int, default=200, help="Comparisons per timing, default: %(default)s")
+    pdiff.add_argument("-r", "--repeat", type=int, default=5,   help="Number of timings, default: %(default)s")
+    pdiff.set_defaults(func=bench_diff)
+
+    pmrg = subparsers.add_parser('merge', help="Time merging a flat dict into a namelist group")
+    pmrg.add_argument("file", nargs='?', default=_default_nml, help="Namelist file, default: %(default)s")
+    pmrg.add_argument("-d", "--separator", default='=',   help="Variable separator, default: '='")
+    pmrg.add_argument("-s", "--step", type=int, default=20, help="Override every STEP-th variable, default: %(default)s")
+    pmrg.add_argument("--ref",  default=None,             help="Reference copy of namelist.py to compare with")
+    pmrg.add_argument("-n", "--number", type=int, default=500, help="Merges per timing, default: %(default)s")
+    pmrg.add_argument("-r", "--repeat", type=int, default=5,   help="Number of timings, default: %(default)s")
+    pmrg.set_defaults(func=bench_merge)
+
+    psrv = subparsers.add_parser('serve', help="Time fresh processes against a namelist.py server")
+    psrv.add_argument("nmlargs", nargs=argparse.REMAINDER, help="Arguments of namelist.py, default: the default namelist file")
+    psrv.add_argument("--file", default=_default_nml,        help=argparse.SUPPRESS)
+    psrv.add_argument("-n", "--number", type=int, default=10, help="Calls per timing, default: %(default)s")
+    psrv.add_argument("-r", "--repeat", type=int, default=3,  help="Number of timings, default: %(default)s")
+    psrv.set_defaults(func=bench_serve)
+
+    pimp = subparsers.add_parser('importtime', help="Check cold start time against budgets")
+    pimp.add_argument("file", nargs='?', default=_default_nml, help="Namelist file, default: %(default)s")
+    pimp.add_argument("--budget-import", type=float, default=30.0,  help="Budget of \"import namelist\" in ms, default: %(default)s")
+    pimp.add_argument("--budget-print",  type=float, default=150.0, help="Budget of printing FILE in a fresh process in ms, default: %(default)s")
+    pimp.add_argument("--budget-chknml", type=float, default=100.0, help="Budget of chknml.py FILE in a fresh process in ms, default: %(default)s")
+    pimp.add_argument("-r", "--repeat", type=int, default=5,   help="Number of timings, default: %(default)s")
+    pimp.set_defaults(func=bench_importtime)
+
+    pmtx = subparsers.add_parser('matrix', help="Time N-way comparison of namelist files")
+    pmtx.add_argument("file", nargs='?', default=_default_nml, help="Namelist file, default: %(default)s")
+    pmtx.add_argument("-d", "--separator", default='=',   help="Variable separator, default: '='")
+    pmtx.add_argument("-f", "--files", type=int, default=30, help="Number of files to compare, default: %(default)s")
+    pmtx.add_argument("-r", "--repeat", type=int, default=3, help="Number of timings, default: %(default)s")
+    pmtx.set_defaults(func=bench_matrix)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -1,15 +1,209 @@
 #!/usr/bin/env python3
+## ---------------------------------------------------------------------
+##
+## Check the files referred in namelist files, e.g. the fix files in
+## the "namsfc" block of input.nml.
+##
+## The "fn*" file names in the "namsfc" block, with "tileX" replaced by
+## the tile number (see "--tile"), and the path-like values (strings
+## containing "/") in all other namelist blocks are collected and
+## deduplicated, then they are checked concurrently
+## with a thread pool, because each stat may take tens of milliseconds
+## on a loaded parallel file system. Missing files, broken symbolic
+## links and zero-size files are reported.
+##
+## With "--scandir", each directory is listed only once with os.scandir
+## and the files are looked up in the listing, so that many files in one
+## fix directory cost one directory read (plus one stat for each symbolic
+## link or for the size check, see "--no-size").
+##
+## ---------------------------------------------------------------------
+##
+## Requirements:
+##
+##   o Python 3.6 or above
+##
+########################################################################
+
+import os, sys
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import namelist
-import sys,os
 
-nmlgrp = namelist.decode_namelist_file(sys.argv[1])
+##======================================================================
+## Collect path-like values
+##======================================================================
+
+def collect_paths(nmlgrp,basedir='.',tile=7):
+    '''Return {path: [(block, variable), ...]} of all path-like values in
+       namelist group "nmlgrp", relative paths are joined to "basedir".
+
+       All "fn*" strings in block "namsfc" are file names, even without
+       a "/", and "tileX" in them is replaced by "tile" as the model does.
+    '''
+
+    paths = {}
+    for nml_name in nmlgrp.keys():
+        nml_block = nmlgrp[nml_name]
+        for var,varvalue in nml_block.items():
+            try:
+                values = varvalue.value
+            except (TypeError, ValueError):
+                continue
+            if not isinstance(values,list): values = [values]
+
+            fixfile = nml_name == 'namsfc' and var.startswith('fn')
+            for value in values:
+                if not isinstance(value,str) or not value or any(c.isspace() for c in value):
+                    continue
+                if fixfile:
+                    value = value.replace('tileX',f'tile{tile}')
+                elif '/' not in value:
+                    continue
+                path = os.path.normpath(os.path.join(basedir,value))
+                paths.setdefault(path,[]).append((nml_name,var))
+
+    return paths
+#enddef collect_paths
+
+##======================================================================
+## Check paths
+##======================================================================
+
+def stat_path(path,checksize=True):
+    '''Return (status, size) of "path", status is
+       "good", "missing", "broken" (symbolic link to nowhere) or "empty"
+       size is None when the file is not found
+    '''
+    try:
+        fstat = os.stat(path)
+    except FileNotFoundError:
+        return ('broken' if os.path.islink(path) else 'missing', None)
+    except OSError:
+        return ('missing', None)
+
+    if checksize and fstat.st_size == 0 and not os.path.isdir(path):
+        return ('empty', 0)
+    return ('good', fstat.st_size)
+#enddef stat_path
+
+##----------------------------------------------------------------------
+
+def scan_directory(dirname,paths,checksize=True):
+    '''Check all "paths" in directory "dirname" with one os.scandir,
+       return [(path, status, size, seconds), ...]
+    '''
+    btime = time.perf_counter()
+    try:
+        with os.scandir(dirname) as entries:
+            listing = {entry.name: entry for entry in entries}
+    except OSError:
+        listing = {}
+
+    results = []
+    for path in paths:
+        entry = listing.get(os.path.basename(path))
+        size  = None
+        if entry is None:
+            status = 'missing'
+        elif entry.is_symlink() or checksize:
+            try:
+                size   = entry.stat().st_size     # follows symbolic links
+                status = 'empty' if checksize and size == 0 and not entry.is_dir() else 'good'
+            except OSError:
+                status = 'broken' if entry.is_symlink() else 'missing'
+        else:
+            status = 'good'
+        results.append((path,status,size,time.perf_counter()-btime))
+
+    return results
+#enddef scan_directory
+
+##----------------------------------------------------------------------
+
+def check_paths(paths,jobs=16,scandir=False,checksize=True):
+    '''Check "paths" concurrently with "jobs" threads
 
-for key in nmlgrp["namsfc"].keys():
-    value = getattr(nmlgrp["namsfc"],key)
-    if key.startswith("fn") and len(value) > 10:
-        if not os.path.lexists(value):
-            print(f"{key} = {value}, Not exist")
+       Return {path: (status, size, seconds)}, see stat_path for the status,
+       size is None when it is not checked.
+       The time of a path checked by "scan_directory" is the time used
+       for its directory until the path was looked up.
+    '''
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1,jobs)) as executor:
+        if scandir:
+            dirs = {}
+            for path in paths:
+                dirs.setdefault(os.path.dirname(path),[]).append(path)
+            futures = [executor.submit(scan_directory,dirname,dirpaths,checksize) for dirname,dirpaths in dirs.items()]
+            for future in futures:
+                for path,status,size,seconds in future.result():
+                    results[path] = (status,size,seconds)
         else:
-            print(f"{key} = Good")
-           
+            def timed_stat(path):
+                btime  = time.perf_counter()
+                status, size = stat_path(path,checksize)
+                return (path,status,size,time.perf_counter()-btime)
+
+            for path,status,size,seconds in executor.map(timed_stat,paths):
+                results[path] = (status,size,seconds)
+
+    return results
+#enddef check_paths
+
+##======================================================================
+## Parse command line arguments
+##======================================================================
+
+def parseArgv():
+    '''Parse command line arguments'''
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check files referred in namelist files")
+
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print all paths with their time, not only the problems")
+    parser.add_argument("-j", "--jobs",    type=int, default=16,  help="Number of threads, default: %(default)s")
+    parser.add_argument("-s", "--scandir", action="store_true", help="List each directory once instead of a stat for each file")
+    parser.add_argument("--no-size",       action="store_true", help="Do not check for zero-size files")
+    parser.add_argument("-d", "--separator",default='=',        help="Variable separator, default: '='")
+    parser.add_argument("-t", "--tile",    type=int, default=7,   help="Tile number for \"tileX\" in namsfc file names, default: %(default)s")
+    parser.add_argument("files", nargs='+', help="Namelist files, relative paths are relative to the directory of the file")
+
+    return parser.parse_args()
+#enddef parseArgv
+
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+##
+## Entance Point
+##
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+if __name__ == '__main__':
+
+    args = parseArgv()
+
+    paths = {}
+    for nmlfile in args.files:
+        nmlgrp = namelist.namelistGroup.fromFile(nmlfile,args.separator,dictionary=(args.separator == ':'))
+        for path,refs in collect_paths(nmlgrp,os.path.dirname(nmlfile),args.tile).items():
+            paths.setdefault(path,[]).extend(refs)
+
+    btime   = time.perf_counter()
+    results = check_paths(list(paths),args.jobs,args.scandir,not args.no_size)
+    elapsed = time.perf_counter()-btime
+
+    labels = {'good': 'Good', 'missing': 'Not exist', 'broken': 'Broken link', 'empty': 'Zero size'}
+    counts = {status: 0 for status in labels}
+    for path,refs in paths.items():
+        status,size,seconds = results[path]
+        counts[status] += 1
+        if status != 'good' or args.verbose:
+            names = ','.join(f"{nml_name}:{var}" for nml_name,var in refs)
+            print(f"{names} = {path}, {labels[status]} ({seconds*1000:.2f} ms)")
+
+    print(f"{len(paths)} paths checked in {elapsed*1000:.2f} ms: "
+          f"{counts['missing']} missing, {counts['broken']} broken links, {counts['empty']} zero size")
+
+    sys.exit(0 if counts['good'] == len(paths) else 1)
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+## ---------------------------------------------------------------------
+##
+## Decode, compare, merge diag_table files of the FV3 model and estimate
+## the size of the output they ask for.
+##
+## A diag_table has a title line, a base date line, then file lines and
+## field lines (the legacy FMS format, '#' for comments):
+##
+##   "fv3_history",  1,  "years",  1,  "hours",  "time"
+##   "gfs_dyn",  "ucomp",  "ugrd",  "fv3_history",  "all",  .false.,  "none",  2
+##
+## Each line is kept as a small record (DiagFile, DiagField, named tuples
+## with the repeated names interned), the comments are not kept. Missing
+## commas between quoted strings, which FMS accepts, are accepted too.
+##
+##   diagtable.py diag_table                        summary
+##   diagtable.py diag_table1 diag_table2           differences, as namelist.py
+##   diagtable.py -m diag_table2 -o out diag_table1 diag_table1 merged with
+##                                                  the files and fields of diag_table2
+##   diagtable.py -e -n input.nml -c model_configure diag_table
+##                                                  bytes written at each output time
+##
+## The estimate gives the bytes of each field at each output time, from the
+## grid size npx, npy, npz in input.nml (or nx, ny of the output grid in
+## model_configure for the files of the write component, fv3_history*), the
+## number of levels of the field and its packing. The write component
+## writes its files every "output_fh" hours of model_configure (1 without
+## "-c"), whatever their frequency in the diag_table. It is an upper bound,
+## compression (ideflate, nbits) is not taken into account. With
+## "--seconds-per-hour" (e.g. from fv3progress.py), the write rate needed
+## to keep up with the model is given too.
+##
+## The number of levels of a field is not in the diag_table. The fields in
+## _FIELDS_3D have "npz" levels (and the interface fields npz+1), the others
+## one level, "--levels NAME=N" changes it for a field. The vertical
+## coordinates (pk, bk, ...) are one column.
+##
+## ---------------------------------------------------------------------
+##
+## Requirements:
+##
+##   o Python 3.6 or above
+##   o namelist.py in the same directory (for input.nml and the output)
+##
+########################################################################
+
+import os, sys
+import re
+from collections import OrderedDict, namedtuple
+
+_token_re = re.compile(r'"[^"]*"|\'[^\']*\'|[^,\s]+')
+
+DiagFile  = namedtuple('DiagFile',  ['name', 'freq', 'freq_units', 'format', 'time_units', 'time_name', 'extra'])
+DiagField = namedtuple('DiagField', ['module', 'field', 'output', 'file', 'sampling', 'reduction', 'region', 'packing'])
+
+## The 3D fields of FV3 (gfs_dyn, dynamics and gfs_phys), with npz levels
+_FIELDS_3D = {
+    'ucomp', 'vcomp', 'temp', 'sphum', 'liq_wat', 'ice_wat', 'rainwat', 'snowwat', 'graupel', 'hailwat',
+    'o3mr', 'delp', 'delz', 'w', 'omga', 'pfhy', 'pfnh', 'cld_amt', 'sgs_tke',
+    'water_nc', 'ice_nc', 'rain_nc', 'snow_nc', 'grap_nc', 'hail_nc', 'grap_pv', 'hail_pv',
+    'refl_10cm', 'cldfra', 'diss_est',
+}
+_FIELDS_INTERFACE = {'zhalf', 'phalf'}     # npz+1 levels
+_FIELDS_VERTICAL  = {'pk', 'bk', 'hyam', 'hybm'}   # one column of npz+1 values
+
+_FREQ_HOURS = {'seconds': 1/3600.0, 'minutes': 1/60.0, 'hours': 1.0, 'days': 24.0,
+               'months': 24.0*30, 'years': 24.0*365}
+
+## bytes of a value for each FMS packing
+_PACKING_BYTES = {1: 8, 2: 4, 4: 2, 8: 1}
+
+##======================================================================
+## Decode a diag_table
+##======================================================================
+
+def decode_token(token):
+    ''' Return a token of a diag_table line as str, int, float or bool'''
+    if token[0] in ('"',"'"):
+        return sys.intern(token[1:-1])
+    lower = token.lower()
+    if lower in ('.true.', '.t.'):  return True
+    if lower in ('.false.', '.f.'): return False
+    try:
+        return int(token)
+    except ValueError:
+        pass
+    try:
+        return float(token)
+    except ValueError:
+        return sys.intern(token)
+
+def encode_token(value):
+    ''' Return the diag_table text of a value'''
+    if isinstance(value,bool): return '.true.' if value else '.false.'
+    if isinstance(value,str):  return f'"{value}"'
+    return str(value)
+
+def encode_line(record):
+    ''' Return the diag_table line of a DiagFile or DiagField'''
+    values = list(record[0:6])+list(record.extra) if isinstance(record,DiagFile) else record
+    return ', '.join(encode_token(value) for value in values)
+
+##======================================================================
+## diag_table
+##======================================================================
+
+class DiagTable:
+    '''
+    A diag_table file
+
+      title    : the title line
+      basedate : the base date line, e.g. "2022 05 11 00 0 0", kept as text
+                 because it is often a template with place holders
+      files    : {file name: DiagFile}
+      fields   : {(module, field, file, output): DiagField}, in the order of the file,
+                 a field may be written to a file more than once under other names
+    '''
+
+    def __init__(self,filename=None):
+        self.filename = filename
+        self.title    = ''
+        self.basedate = ''
+        self.files    = OrderedDict()
+        self.fields   = OrderedDict()
+    #enddef
+
+    ####################################################################
+
+    @classmethod
+    def fromFile(cls,filename):
+        ''' Read "filename" '''
+        with open(filename,'r') as fhdl:
+            return cls.fromLines(fhdl,filename)
+
+    @classmethod
+    def fromLines(cls,lines,filename=None):
+        '''Decode the lines of a diag_table
+
+           Raise ValueError for a line that is neither a file nor a field.
+        '''
+        table  = cls(filename)
+        header = []
+        for lineno,line in enumerate(lines,1):
+            text = line.strip()
+            if not text or text.startswith('#'): continue
+
+            if len(header) < 2:
+                header.append(text)
+                continue
+
+            values = [decode_token(token) for token in _token_re.findall(text)]
+            if len(values) >= 6 and isinstance(values[1],int) and not isinstance(values[1],bool):
+                dfile = DiagFile(*values[0:6],tuple(values[6:]))
+                table.files[dfile.name] = dfile
+            elif len(values) == 8:
+                field = DiagField(*values)
+                key   = (field.module,field.field,field.file,field.output)
+                if key in table.fields:
+                    print(f'WARNING: duplicated field line {lineno} in <{filename}>, use the last: {text}',file=sys.stderr)
+                table.fields[key] = field
+            else:
+                raise ValueError(f'Unknown diag_table line {lineno} in <{filename}>: {text}')
+
+        if len(header) == 2:
+            table.title, table.basedate = header
+        return table
+    #enddef fromLines
+
+    ####################################################################
+
+    def iter_lines(self):
+        ''' Yield the lines of the diag_table, the fields grouped by file'''
+        yield self.title
+        yield self.basedate
+        yield '#output files'
+        for dfile in self.files.values():
+            yield encode_line(dfile)
+
+        byfile = OrderedDict()
+        for field in self.fields.values():
+            byfile.setdefault(field.file,[]).append(field)
+        for filename,fields in byfile.items():
+            yield ''
+            yield f'# {filename}'
+            for field in fields:
+                yield ' '+encode_line(field)
+
+    def write_stream(self,fhdl):
+        for line in self.iter_lines():
+            fhdl.write(line)
+            fhdl.write('\n')
+
+    def __str__(self):
+        return ''.join(f"{line}\n" for line in self.iter_lines())
+
+    ####################################################################
+
+    def merge(self,other):
+        '''Add the files and fields of DiagTable "other", replacing those
+           with the same name (file) or the same module, field, file and
+           output name (field). The base date of "other" is taken if it has one.
+        '''
+        if other.basedate: self.basedate = other.basedate
+        self.files.update(other.files)
+        self.fields.update(other.fields)
+
+    ####################################################################
+
+    def problems(self):
+        ''' Return the list of fields written to files not defined in the table'''
+        return [f"Field {field.module}:{field.field} is written to undefined file \"{field.file}\""
+                for field in self.fields.values() if field.file not in self.files]
+
+    ####################################################################
+
+    @staticmethod
+    def records(tbl1,tbl2):
+        ''' Yield the differences of DiagTable "tbl1" and "tbl2" as dict records
+
+            {"type": "file", "side": "left"|"right", "file": name}            file only in one table
+            {"type": "file_changed", "file": name, "left": line, "right": line}
+            {"type": "only", "side": "left"|"right", "file": name, "module": module,
+             "field": field, "output": name, "value": line}                    field only in one table
+            {"type": "changed", "file": name, "module": module, "field": field,
+             "output": name, "left": line, "right": line}                      field with different values
+            {"type": "summary", "left": file, "right": file, "files": n, "fields": n,
+             "changed": n, "left_only": n, "right_only": n}
+
+            The records are keyed by names, so the order of the lines and the
+            comments do not matter.
+        '''
+        counts = {'files': 0, 'fields': 0, 'changed': 0, 'left_only': 0, 'right_only': 0}
+
+        for name,dfile in tbl1.files.items():
+            if name not in tbl2.files:
+                yield {'type': 'file', 'side': 'left', 'file': name}
+            else:
+                counts['files'] += 1
+                if dfile != tbl2.files[name]:
+                    yield {'type': 'file_changed', 'file': name, 'left': encode_line(dfile), 'right': encode_line(tbl2.files[name])}
+        for name in tbl2.files:
+            if name not in tbl1.files:
+                yield {'type': 'file', 'side': 'right', 'file': name}
+
+        for key,field in tbl1.fields.items():
+            other = tbl2.fields.get(key)
+            if other is None:
+                counts['left_only'] += 1
+                yield {'type': 'only', 'side': 'left', 'file': key[2], 'module': key[0], 'field': key[1], 'output': key[3],
+                       'value': encode_line(field)}
+                continue
+            counts['fields'] += 1
+            if field != other:
+                counts['changed'] += 1
+                yield {'type': 'changed', 'file': key[2], 'module': key[0], 'field': key[1], 'output': key[3],
+                       'left': encode_line(field), 'right': encode_line(other)}
+        for key,field in tbl2.fields.items():
+            if key not in tbl1.fields:
+                counts['right_only'] += 1
+                yield {'type': 'only', 'side': 'right', 'file': key[2], 'module': key[0], 'field': key[1], 'output': key[3],
+                       'value': encode_line(field)}
+
+        yield {'type': 'summary', 'left': tbl1.filename, 'right': tbl2.filename, **counts}
+    #enddef records
+
+#endclass
+
+##======================================================================
+## Output volume
+##======================================================================
+
+def grid_sizes(nmlgrp,config=None):
+    '''Return (nx, ny, npz, output nx, output ny) from "nmlgrp" (input.nml)
+       and "config" (ESMFConfig of model_configure, the output grid), the
+       output grid is the model grid when it is not known.
+
+       Raise ValueError when a size is not found or not valid, e.g. NPX.
+    '''
+    sizes = []
+    for var in ('npx', 'npy', 'npz'):
+        nml_name = nmlgrp.findblock(var,['fv_core_nml'])
+        try:
+            sizes.append(int(nmlgrp[nml_name][var].value))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'"{var}" is not found or not valid in fv_core_nml')
+    nx, ny, npz = sizes[0]-1, sizes[1]-1, sizes[2]
+
+    outnx, outny = nx, ny
+    if config is not None and 'nx' in config and 'ny' in config:
+        outnx, outny = config.get('nx'), config.get('ny')
+    return (nx, ny, npz, outnx, outny)
+#enddef grid_sizes
+
+##----------------------------------------------------------------------
+
+def field_levels(field,npz,levels=None):
+    ''' Number of levels of DiagField "field", "levels" is {name: levels}'''
+    if levels:
+        for name in (field.output, field.field):
+            if name in levels: return levels[name]
+    if field.field in _FIELDS_INTERFACE: return npz+1
+    if field.field in _FIELDS_3D:        return npz
+    return 1
+
+##----------------------------------------------------------------------
+
+def estimate(table,grid,levels=None,output_fh=None,nhours=None):
+    '''Return the output volume of DiagTable "table"
+
+       grid      : (nx, ny, npz, output nx, output ny), see grid_sizes
+       output_fh : output interval in hours of the write component files
+                   (fv3_history*, model_configure output_fh, 1 if None),
+                   their frequency in the diag_table is not used. The
+                   other files are written at their diag_table frequency.
+       nhours    : forecast hours, for the number of output times
+
+       Return (fields, files): fields is [(bytes, DiagField, levels)] at each
+       output time, the largest first; files is {file: {"bytes": at each
+       output time, "interval": hours or None, "times": number or None}}.
+    '''
+    nx, ny, npz, outnx, outny = grid
+
+    fields = []
+    files  = OrderedDict()
+    for field in table.fields.values():
+        nlev  = field_levels(field,npz,levels)
+        nbyte = _PACKING_BYTES.get(field.packing,4)
+        write = field.file.startswith('fv3_history')
+        if field.field in _FIELDS_VERTICAL:
+            size = (npz+1)*nbyte
+        else:
+            size = (outnx*outny if write else nx*ny)*nlev*nbyte
+        fields.append((size,field,nlev))
+
+        if field.file not in files:
+            interval = None
+            dfile = table.files.get(field.file)
+            if write:
+                interval = output_fh or 1.0
+            elif dfile is not None and dfile.freq > 0:
+                interval = dfile.freq*_FREQ_HOURS.get(dfile.freq_units,1.0)
+            times = None
+            if nhours is not None:
+                times = int(nhours/interval)+1 if interval else 1
+            files[field.file] = {'bytes': 0, 'interval': interval, 'times': times}
+        files[field.file]['bytes'] += size
+
+    fields.sort(key=lambda item: item[0],reverse=True)
+    return fields, files
+#enddef estimate
+
+##----------------------------------------------------------------------
+
+def human_size(nbytes):
+    ''' Return "nbytes" as text, e.g. 1.2 GB'''
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if abs(nbytes) < 1024.0 or unit == 'TB':
+            return f"{nbytes:.1f} {unit}" if unit != 'B' else f"{nbytes} B"
+        nbytes /= 1024.0
+
+##======================================================================
+## Parse command line arguments
+##======================================================================
+
+def parseArgv():
+    '''Parse command line arguments'''
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Decode, compare, merge diag_table files and estimate their output volume")
+
+    parser.add_argument("-m", "--merge",   default=None, metavar='FILE', help="Merge the files and fields of FILE into DIAG_TABLE")
+    parser.add_argument("-o", "--outfile", default=None, help="Write the merged table to OUTFILE, default: standard output")
+    parser.add_argument("-e", "--estimate",action="store_true", help="Estimate the bytes written at each output time")
+    parser.add_argument("-n", "--nml",     default='input.nml', help="input.nml for the grid size, default: %(default)s")
+    parser.add_argument("-c", "--config",  default=None, help="model_configure for the output grid, output_fh and nhours_fcst")
+    parser.add_argument("-l", "--levels",  action='append', default=[], metavar='NAME=N', help="Number of levels of field NAME, may be repeated")
+    parser.add_argument("-t", "--top",     type=int, default=20, help="Number of the largest fields printed, default: %(default)s")
+    parser.add_argument("-s", "--seconds-per-hour", type=float, default=None,
+                                           help="Wall seconds per forecast hour, for the write rate needed")
+    parser.add_argument("-f", "--format",  default='text', choices=['text','json','ndjson'], help="Format of the differences, default: %(default)s")
+    parser.add_argument("tables", nargs='+', help="diag_table files, two to compare them")
+
+    args = parser.parse_args()
+
+    if len(args.tables) > 2:
+        parser.error("one or two diag_table files")
+
+    levels = {}
+    for item in args.levels:
+        name, _, count = item.partition('=')
+        if not count.isdigit(): parser.error(f"wrong NAME=N \"{item}\"")
+        levels[name] = int(count)
+
+    return (args, levels)
+#enddef parseArgv
+
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+##
+## Entance Point
+##
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+if __name__ == '__main__':
+
+    args, levels = parseArgv()
+
+    try:
+        tables = [DiagTable.fromFile(filename) for filename in args.tables]
+    except ValueError as err:
+        print(f"ERROR: {err}", file=sys.stderr)
+        sys.exit(2)
+
+    ##
+    ## Compare two tables
+    ##
+    if len(tables) == 2:
+        import namelist
+
+        records = DiagTable.records(*tables)
+        if args.format != 'text':
+            try:
+                namelist.namelistCMPGroup.output_records(sys.stdout,records,args.format)
+            except BrokenPipeError:   ## the reader exits early
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, sys.stdout.fileno())
+            sys.exit(0)
+
+        ndiff = 0
+        for record in records:
+            if record['type'] == 'file':
+                ndiff += 1
+                print(f"File \"{record['file']}\" only in {args.tables[0 if record['side'] == 'left' else 1]}")
+            elif record['type'] == 'file_changed':
+                ndiff += 1
+                print(f"File \"{record['file']}\":\n  < {record['left']}\n  > {record['right']}")
+            elif record['type'] == 'only':
+                ndiff += 1
+                print(f"{'<' if record['side'] == 'left' else '>'} {record['value']}")
+            elif record['type'] == 'changed':
+                ndiff += 1
+                print(f"{record['module']}:{record['field']} -> {record['output']} in \"{record['file']}\":\n  < {record['left']}\n  > {record['right']}")
+            else:
+                print(f"{record['fields']} fields in both, {record['changed']} changed, "
+                      f"{record['left_only']} only in {args.tables[0]}, {record['right_only']} only in {args.tables[1]}")
+        sys.exit(1 if ndiff else 0)
+
+    table = tables[0]
+
+    ##
+    ## Merge
+    ##
+    if args.merge is not None:
+        table.merge(DiagTable.fromFile(args.merge))
+        if args.outfile is not None:
+            import namelist
+            namelist.replace_file(args.outfile,str(table))
+        else:
+            try:
+                table.write_stream(sys.stdout)
+            except BrokenPipeError:   ## the reader exits early, e.g. head
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, sys.stdout.fileno())
+
+    ##
+    ## Estimate the output volume
+    ##
+    elif args.estimate:
+        import namelist
+
+        config = output_fh = nhours = None
+        if args.config is not None:
+            import esmfconfig
+            config = esmfconfig.ESMFConfig.fromFile(args.config)
+            try:
+                fhs = config.get('output_fh') or []
+                output_fh = fhs[0] if fhs and fhs[0] > 0 and (len(fhs) == 1 or fhs[1] == -1) else None
+                nhours = config.get('nhours_fcst')
+            except ValueError as err:
+                print(f"WARNING: {err}", file=sys.stderr)
+
+        try:
+            grid = grid_sizes(namelist.namelistGroup.fromFile(args.nml,'='),config)
+        except ValueError as err:
+            print(f"ERROR: {args.nml}: {err}", file=sys.stderr)
+            sys.exit(2)
+
+        fields, files = estimate(table,grid,levels,output_fh,nhours)
+
+        nx, ny, npz, outnx, outny = grid
+        print(f"Grid {nx}x{ny}x{npz}, output grid {outnx}x{outny}")
+        print(f"\n{'Bytes':>10}  {'Levels':>6}  {'Pack':>4}  Field")
+        for size,field,nlev in fields[:args.top]:
+            print(f"{human_size(size):>10}  {nlev:>6}  {field.packing:>4}  {field.module}:{field.field} -> {field.file}:{field.output}")
+
+        print(f"\n{'Bytes':>10}  {'Interval':>8}  {'Times':>5}  {'Total':>10}  File")
+        total = 0
+        hourly = 0.0
+        for filename,info in files.items():
+            interval = f"{info['interval']:g} h" if info['interval'] else 'once'
+            times    = info['times'] if info['times'] is not None else '-'
+            volume   = info['bytes']*info['times'] if info['times'] is not None else None
+            if volume is not None: total += volume
+            if info['interval']: hourly += info['bytes']/info['interval']
+            print(f"{human_size(info['bytes']):>10}  {interval:>8}  {times:>5}  "
+                  f"{human_size(volume) if volume is not None else '-':>10}  {filename}")
+
+        print(f"\n{human_size(hourly)} per forecast hour" + (f", {human_size(total)} for {nhours} hours" if nhours else ''))
+        if args.seconds_per_hour:
+            print(f"{human_size(hourly/args.seconds_per_hour)}/s write rate at {args.seconds_per_hour:g} s per forecast hour")
+
+    ##
+    ## Summary
+    ##
+    else:
+        counts = OrderedDict((name,0) for name in table.files)
+        for field in table.fields.values():
+            counts[field.file] = counts.get(field.file,0)+1
+        print(f"{table.title}\n{table.basedate}")
+        for name,count in counts.items():
+            dfile = table.files.get(name)
+            freq  = f"every {dfile.freq} {dfile.freq_units}" if dfile is not None else 'undefined'
+            print(f"  {name:<20} {count:>4} fields, {freq}")
+
+    problems = table.problems()
+    for problem in problems:
+        print(f"WARNING: {problem}", file=sys.stderr)
@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+## ---------------------------------------------------------------------
+##
+## Read, check and update ESMF configuration files, i.e. model_configure
+## and nems.configure of the UFS weather model.
+##
+## The file is kept as its list of lines, with an index from each key to
+## its line, so that getting or setting a key does not search the file
+## and the file is written back without decoding it again. Only the value
+## of a changed key is rewritten, in the same column; comments (also
+## after a value, "dx: 3000.0  # x-direction grid length"), blank
+## lines, the order of the keys and tables like
+##
+##   runSeq::
+##     ATM
+##   ::
+##
+## are written as they are read.
+##
+## The values of the known model_configure keys (_SCHEMA: members, run
+## dates, write component, output grid) are decoded and checked with their
+## type. The PE count (PE_MEMBER01) is checked against the layout in
+## input.nml and the write component, e.g.
+##
+##   esmfconfig.py -n input.nml model_configure
+##   esmfconfig.py -s PE_MEMBER01=1008 -s write_groups=2 -i model_configure
+##
+## instead of "sed -i -e s/NPES/.../" on the templates.
+##
+## ---------------------------------------------------------------------
+##
+## Requirements:
+##
+##   o Python 3.6 or above
+##   o namelist.py in the same directory (for input.nml and "--inline")
+##
+########################################################################
+
+import os, sys
+import re
+
+_line_re  = re.compile(r'^(\s*)([A-Za-z_][\w.%-]*)(::?)(\s*)(.*?)(\s*)$')
+_token_re = re.compile(r"'[^']*'|\"[^\"]*\"|\S+")
+_value_re = re.compile(r"""^((?:'[^']*'|"[^"]*"|[^'"#])*?)(\s*(?:#.*)?)$""")   # value, "  # comment"
+
+## key: (type, number of values, group), the number is None for any number
+_SCHEMA = {
+    'total_member':          ('int',   1,    'members'),
+    'PE_MEMBER01':           ('int',   1,    'members'),
+    'start_year':            ('int',   1,    'dates'),
+    'start_month':           ('int',   1,    'dates'),
+    'start_day':             ('int',   1,    'dates'),
+    'start_hour':            ('int',   1,    'dates'),
+    'start_minute':          ('int',   1,    'dates'),
+    'start_second':          ('int',   1,    'dates'),
+    'nhours_fcst':           ('int',   1,    'dates'),
+    'dt_atmos':              ('int',   1,    'dates'),
+    'restart_interval':      ('int',   None, 'dates'),
+    'calendar':              ('str',   1,    'dates'),
+    'RUN_CONTINUE':          ('bool',  1,    'run'),
+    'ENS_SPS':               ('bool',  1,    'run'),
+    'cpl':                   ('bool',  1,    'run'),
+    'print_esmf':            ('bool',  1,    'run'),
+    'memuse_verbose':        ('bool',  1,    'run'),
+    'atmos_nthreads':        ('int',   1,    'run'),
+    'output_1st_tstep_rst':  ('bool',  1,    'run'),
+    'quilting':              ('bool',  1,    'write'),
+    'write_groups':          ('int',   1,    'write'),
+    'write_tasks_per_group': ('int',   1,    'write'),
+    'write_dopost':          ('bool',  1,    'write'),
+    'num_files':             ('int',   1,    'write'),
+    'filename_base':         ('str',   None, 'write'),
+    'output_file':           ('str',   None, 'write'),
+    'output_fh':             ('float', None, 'write'),
+    'nsout':                 ('int',   1,    'write'),
+    'ideflate':              ('int',   1,    'write'),
+    'nbits':                 ('int',   1,    'write'),
+    'output_grid':           ('str',   1,    'grid'),
+    'cen_lon':               ('float', 1,    'grid'),
+    'cen_lat':               ('float', 1,    'grid'),
+    'stdlat1':               ('float', 1,    'grid'),
+    'stdlat2':               ('float', 1,    'grid'),
+    'nx':                    ('int',   1,    'grid'),
+    'ny':                    ('int',   1,    'grid'),
+    'lon1':                  ('float', 1,    'grid'),
+    'lat1':                  ('float', 1,    'grid'),
+    'dx':                    ('float', 1,    'grid'),
+    'dy':                    ('float', 1,    'grid'),
+}
+
+##======================================================================
+## Values
+##======================================================================
+
+def decode_token(token,vtype=None):
+    '''Decode one value of a configuration line as "vtype", guess the type if None
+
+       Raise ValueError if "token" is not a "vtype", e.g. a place holder.
+    '''
+    if token[0] in ("'",'"') and token[-1] == token[0] and len(token) > 1:
+        if vtype not in (None,'str'): raise ValueError(f'{token} is not a {vtype}')
+        return token[1:-1]
+
+    lower = token.lower()
+    if vtype == 'bool' or (vtype is None and lower in ('.true.', '.false.', 'true', 'false')):
+        if lower in ('.true.', 't', 'true', '.t.'):  return True
+        if lower in ('.false.', 'f', 'false', '.f.'): return False
+        raise ValueError(f'{token} is not a bool')
+
+    if vtype == 'int':   return int(token)
+    if vtype == 'float': return float(token)
+    if vtype == 'str':   return token
+
+    for convert in (int, float):
+        try:
+            return convert(token)
+        except ValueError:
+            pass
+    return token
+
+def encode_value(value):
+    ''' Return the configuration text of a Python value or list of values'''
+    if isinstance(value,(list,tuple)):
+        return ' '.join(encode_value(element) for element in value)
+    if isinstance(value,bool):
+        return '.true.' if value else '.false.'
+    if isinstance(value,str):
+        return f"'{value}'"
+    return str(value)
+
+##======================================================================
+## ESMF configuration file
+##======================================================================
+
+class ESMFConfig:
+    '''
+    ESMF configuration file as a list of lines
+
+      lines : each line is a string (comment, blank line, table line), or
+              [indent+key+colon+spaces, value text, tail] for a key line,
+              the tail is the spaces and the "# comment" after the value
+      index : {key: position in "lines"}
+      tables: {key: [lines]} for the "key::" tables, e.g. runSeq
+
+    The value text of a key is decoded only when it is asked for, with the
+    type of the key in _SCHEMA when it is known.
+    '''
+
+    def __init__(self,filename=None):
+        self.filename = filename
+        self.lines    = []
+        self.index    = {}
+        self.tables   = {}
+        self.column   = 25            # value column of the added keys
+    #enddef
+
+    ####################################################################
+
+    @classmethod
+    def fromFile(cls,filename):
+        ''' Read "filename" '''
+        with open(filename,'r') as fhdl:
+            return cls.fromLines(fhdl,filename)
+
+    @classmethod
+    def fromLines(cls,lines,filename=None):
+        ''' Decode the lines of a configuration file '''
+        config  = cls(filename)
+        table   = None
+        columns = {}
+        for line in lines:
+            line = line.rstrip('\n')
+            if table is not None:                    ## within a "key::" table
+                config.lines.append(line)
+                if line.strip() == '::':
+                    table = None
+                else:
+                    config.tables[table].append(line.strip())
+                continue
+
+            match = _line_re.match(line) if not line.lstrip().startswith('#') else None
+            if match is None:
+                config.lines.append(line)
+                continue
+
+            indent, key, colon, spaces, value, tail = match.groups()
+            split = _value_re.match(value)
+            if split is not None and split.group(2):      ## comment after the value
+                value, tail = split.group(1), split.group(2)+tail
+            if colon == '::':
+                table = key
+                config.tables[key] = []
+                config.lines.append(line)
+                continue
+
+            head = indent+key+colon+spaces
+            config.index[key] = len(config.lines)
+            config.lines.append([head, value, tail])
+            if value: columns[len(head)] = columns.get(len(head),0)+1
+
+        if columns: config.column = max(columns,key=columns.get)
+        return config
+    #enddef fromLines
+
+    ####################################################################
+
+    def __contains__(self,key):
+        return key in self.index
+
+    def keys(self):
+        return self.index.keys()
+
+    def text(self,key):
+        ''' Value text of "key" as in the file'''
+        return self.lines[self.index[key]][1]
+
+    def get(self,key,default=None):
+        '''Return the value of "key", a list if the key has more than one
+           value or is a list in _SCHEMA, "default" if not found
+
+           Raise ValueError if the value does not match its type in _SCHEMA.
+        '''
+        if key not in self.index: return default
+
+        vtype, count, group = _SCHEMA.get(key,(None,1,None))
+        tokens = _token_re.findall(self.text(key))
+        try:
+            values = [decode_token(token,vtype) for token in tokens]
+        except ValueError as err:
+            raise ValueError(f'Wrong value of "{key}" in <{self.filename}>: {err}')
+        if count is not None and len(values) != count:
+            raise ValueError(f'"{key}" in <{self.filename}> must have {count} value(s), got {len(values)}')
+
+        if count is None: return values
+        return values[0] if len(values) == 1 else values
+
+    def __getitem__(self,key):
+        if key not in self.index: raise KeyError(key)
+        return self.get(key)
+
+    ####################################################################
+
+    def set(self,key,value,add=True):
+        '''Set "key" to "value" (Python value, list of values or the text of
+           a value) in its line, a missing key is added at the end when "add"
+
+           A string is taken as the text of the value, except for the str
+           keys of _SCHEMA, which are quoted unless they are already.
+
+           Raise KeyError for a missing key without "add", ValueError if
+           "value" does not match its type in _SCHEMA.
+        '''
+        vtype = _SCHEMA.get(key,(None,1,None))[0]
+        if isinstance(value,str) and not (vtype == 'str' and value[:1] not in ("'",'"')):
+            text = value                                   ## text of the value, e.g. from the command line
+        else:
+            text = encode_value(value)
+
+        if vtype is not None:
+            for token in _token_re.findall(text):
+                try:
+                    decode_token(token,vtype)
+                except ValueError as err:
+                    raise ValueError(f'Wrong value of "{key}": {err}')
+
+        if key in self.index:
+            self.lines[self.index[key]][1] = text
+        elif add:
+            head = f"{key}:".ljust(self.column)
+            if head[-1] != ' ': head += ' '
+            self.index[key] = len(self.lines)
+            self.lines.append([head, text, ''])
+        else:
+            raise KeyError(key)
+
+    def __setitem__(self,key,value):
+        self.set(key,value)
+
+    def update(self,values,add=True):
+        ''' Set all {key: value} in "values" '''
+        for key,value in values.items():
+            self.set(key,value,add)
+
+    ####################################################################
+
+    def iter_lines(self):
+        ''' Yield the lines of the file, without the new line'''
+        for line in self.lines:
+            yield line if isinstance(line,str) else ''.join(line)
+
+    def write_stream(self,fhdl):
+        ''' Write the file to handle "fhdl" '''
+        for line in self.iter_lines():
+            fhdl.write(line)
+            fhdl.write('\n')
+
+    def __str__(self):
+        return ''.join(f"{line}\n" for line in self.iter_lines())
+
+    ####################################################################
+
+    def validate(self):
+        '''Return the list of problems: values not matching _SCHEMA (e.g. place
+           holders not replaced) and wrong run dates.
+        '''
+        problems = []
+        for key in self.index:
+            if key not in _SCHEMA: continue
+            try:
+                self.get(key)
+            except ValueError as err:
+                problems.append(str(err))
+
+        if not problems and all(key in self.index for key in ('start_year','start_month','start_day','start_hour')):
+            from datetime import datetime
+            try:
+                datetime(self.get('start_year'),self.get('start_month'),self.get('start_day'),
+                         self.get('start_hour'),self.get('start_minute',0),self.get('start_second',0))
+            except ValueError as err:
+                problems.append(f"Wrong start date in <{self.filename}>: {err}")
+
+        return problems
+
+    ####################################################################
+
+    def group(self,name):
+        ''' Return {key: value} of the keys in group "name" of _SCHEMA'''
+        return {key: self.get(key) for key in self.index if _SCHEMA.get(key,(None,1,None))[2] == name}
+
+#endclass
+
+##======================================================================
+## Cross check with input.nml
+##======================================================================
+
+def check_pes(config,nmlgrp=None):
+    '''Return the list of problems with the PE count of "config" (ESMFConfig)
+
+       PE_MEMBER01 must be layout_x*layout_y of "nmlgrp" (input.nml), plus
+       write_groups*write_tasks_per_group with quilting.
+    '''
+    problems = []
+    try:
+        npes    = config.get('PE_MEMBER01')
+        quilt   = config.get('quilting',False)
+        groups  = config.get('write_groups',1)
+        tasks   = config.get('write_tasks_per_group',0)
+    except ValueError as err:
+        return [str(err)]
+
+    nwrite = groups*tasks if quilt else 0
+    if quilt and nwrite <= 0:
+        problems.append(f"quilting without write tasks: write_groups = {groups}, write_tasks_per_group = {tasks}")
+
+    if nmlgrp is not None:
+        nml_name = nmlgrp.findblock('layout',['fv_core_nml'])
+        if nml_name is None:
+            problems.append("layout is not found in input.nml")
+        else:
+            try:
+                layout = nmlgrp[nml_name]['layout'].value
+                ncompute = layout[0]*layout[1]
+            except (TypeError, ValueError, IndexError):
+                problems.append(f"wrong layout in input.nml: {nmlgrp[nml_name]['layout']}")
+                ncompute = None
+            if ncompute is not None and npes is not None and npes != ncompute+nwrite:
+                problems.append(f"PE_MEMBER01 = {npes}, but layout {layout[0]}x{layout[1]} + "
+                                f"{groups if quilt else 0}x{tasks if quilt else 0} write tasks = {ncompute+nwrite}")
+
+    return problems
+#enddef check_pes
+
+##======================================================================
+## Parse command line arguments
+##======================================================================
+
+def parseArgv():
+    '''Parse command line arguments'''
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check and update ESMF configuration files (model_configure, nems.configure)")
+
+    parser.add_argument("-s", "--set",     action='append', default=[], metavar='KEY=VALUE', help="Set the value of KEY, added if not found, may be repeated")
+    parser.add_argument("-n", "--nml",     default=None, help="input.nml to check PE_MEMBER01 against its layout")
+    parser.add_argument("-g", "--group",   default=None, choices=sorted({group for vtype,count,group in _SCHEMA.values()}),
+                                           help="Print the decoded values of the keys in GROUP")
+    parser.add_argument("-i", "--inline",  action="store_true", help="Write the changes to FILE, a backup is kept")
+    parser.add_argument("-o", "--outfile", default=None, help="Write the file to OUTFILE, default: standard output with \"--set\"")
+    parser.add_argument("--backup-keep",   default=os.environ.get('NAMELIST_BACKUP_KEEP'), type=int, metavar='N',
+                                           help="With --inline, keep at most N backups of FILE, default: $NAMELIST_BACKUP_KEEP or all")
+    parser.add_argument("--backup-bytes",  default=os.environ.get('NAMELIST_BACKUP_BYTES'), type=int, metavar='BYTES',
+                                           help="With --inline, keep at most BYTES bytes of backups of FILE, default: $NAMELIST_BACKUP_BYTES or all")
+    parser.add_argument("file",            help="ESMF configuration file")
+
+    args = parser.parse_args()
+
+    values = {}
+    for item in args.set:
+        key, sep, value = item.partition('=')
+        if not sep: parser.error(f"wrong KEY=VALUE \"{item}\"")
+        values[key.strip()] = value.strip()
+
+    return (args, values)
+#enddef parseArgv
+
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+##
+## Entance Point
+##
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+if __name__ == '__main__':
+
+    args, values = parseArgv()
+
+    config = ESMFConfig.fromFile(args.file)
+    try:
+        config.update(values)
+    except ValueError as err:
+        print(f"ERROR: {err}", file=sys.stderr)
+        sys.exit(2)
+
+    if args.group is not None:
+        try:
+            group = config.group(args.group)
+        except ValueError as err:            ## e.g. place holders of a template
+            print(f"ERROR: {err}", file=sys.stderr)
+            sys.exit(2)
+        for key,value in group.items():
+            print(f"{key} = {value!r}")
+
+    if args.inline or args.outfile is not None:
+        import namelist
+        if args.inline:
+            namelist.write_inline(args.file,str(config),{'backup_keep': args.backup_keep, 'backup_bytes': args.backup_bytes})
+        else:
+            namelist.replace_file(args.outfile,str(config))
+    elif values and args.group is None:
+        config.write_stream(sys.stdout)
+
+    problems = config.validate()
+    if not problems and 'PE_MEMBER01' in config:
+        nmlgrp = None
+        if args.nml is not None:
+            import namelist
+            nmlgrp = namelist.namelistGroup.fromFile(args.nml,'=')
+        problems.extend(check_pes(config,nmlgrp))
+
+    for problem in problems:
+        print(f"ERROR: {problem}", file=sys.stderr)
+
+    sys.exit(1 if problems else 0)
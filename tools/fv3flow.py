@@ -0,0 +1,724 @@
+#!/usr/bin/env python3
+## ---------------------------------------------------------------------
+##
+## Workflow engine for the ICS -> LBCS -> forecast -> post pipeline of
+## run_fv3_Jet.sh and run_post.sh.
+##
+## Each step (make_ics, make_lbcs for each boundary hour, the forecast,
+## UPP and bufr for each forecast hour) is a node of a dependency graph.
+## The state of a node is given by the same marker files as today,
+##
+##   done.TAG, error.TAG  written by the job at the end,
+##   running.TAG          written by the job when it starts,
+##   queue.TAG            written when the job is submitted,
+##
+## e.g. INPUT/done.lbc_003 or postprd/queue.upp_012, so the engine can
+## be stopped and started again at any time, and it works together with
+## the shell scripts. A node is submitted as soon as the nodes it depends
+## on are done and its input files are ready (existing, large enough and
+## not changed for "--stable" seconds), within the concurrency limit of
+## its stage. So the boundary hours are processed as the GFS files come
+## in, and each forecast hour is post-processed as soon as the forecast
+## writes it, while the forecast is still running.
+##
+## The job scripts are made from the templates in run_templates_EMC as
+## the shell scripts do. The jobs are submitted with a backend,
+##
+##   slurm   sbatch in the work directory of the node (production),
+##   local   the job script run by bash in a subprocess, for testing with
+##           stand-in templates (see "--rootdir").
+##
+## The marker directories are watched with inotify when they are on a
+## local file system (see waitfile.py), otherwise checked every "--poll"
+## seconds. The exit status is 0 when all nodes are done, 1 when a node
+## failed and no other node can make progress.
+##
+## ---------------------------------------------------------------------
+##
+## Requirements:
+##
+##   o Python 3.6 or above
+##   o namelist.py, esmfconfig.py and waitfile.py in the same directory
+##
+########################################################################
+
+import os, sys
+import select
+import subprocess
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import esmfconfig
+import namelist
+import waitfile
+
+## Defaults of run_fv3_Jet.sh
+_JET_CONFIG = {
+    'rootdir':     '/lfs4/NAGAPE/hpc-wof1/ywang/regional_fv3/fv3lam.nssl',
+    'cycle':       '00',
+    'run':         'nssl',
+    'machine':     'jet',
+    'layout_x':    35,
+    'layout_y':    28,
+    'quilt_nodes': 2,
+    'quilt_ppn':   14,
+    'intvhour':    3,
+    'tophour':     60,
+    'gridno':      'C3359',
+    'npx':         1821,
+    'npy':         1093,
+    'out_nx':      1799,
+    'out_ny':      1059,
+    'out_lon1':    -122.719258,
+    'out_lat1':    21.138123,
+    'ics_dir':     '/public/data/grids/gfs/anl/netcdf',
+    'lbcs_dir':    '/public/data/grids/gfs/0p25deg/grib2',
+    'ics_size':    (13000000000, 340000000),    # atmanl, sfcanl
+    'lbcs_size':   700000000,
+    'sfhr':        0,
+}
+
+_STAGES = ('ics', 'lbcs', 'fcst', 'upp', 'bufr')
+
+##======================================================================
+## Nodes
+##======================================================================
+
+class Node:
+    '''
+    One step of the workflow
+
+      name     : unique name, e.g. lbc_003
+      stage    : one of _STAGES, for the concurrency limits
+      markers  : (directory, tag) of the marker files "done.tag", ...
+      workdir  : directory where the job is submitted
+      script   : job script, made by "prepare"
+      deps     : names of the nodes that must be done
+      after    : names of the nodes that must be submitted at least
+      inputs   : [(path, minimum size)] files that must be ready
+      prepare  : function called before submitting, makes the work
+                 directory and the job script
+      donefiles: other files that mean done, e.g. INPUT/done.lbcs
+    '''
+
+    def __init__(self,name,stage,markers,workdir,script,deps=(),after=(),inputs=(),prepare=None,donefiles=()):
+        self.name      = name
+        self.stage     = stage
+        self.markers   = markers
+        self.workdir   = workdir
+        self.script    = script
+        self.deps      = list(deps)
+        self.after     = list(after)
+        self.inputs    = list(inputs)
+        self.prepare   = prepare
+        self.donefiles = list(donefiles)
+    #enddef
+
+    def marker(self,kind):
+        ''' Path of marker file "kind" (done, error, running or queue)'''
+        return os.path.join(self.markers[0],f"{kind}.{self.markers[1]}")
+
+    def status(self,listing):
+        ''' Return done, error, running, queued or waiting from the marker files,
+            "listing" is {directory: set of file names}
+        '''
+        names = listing.get(self.markers[0],set())
+        tag   = self.markers[1]
+        if f"done.{tag}" in names:
+            return 'done'
+        for path in self.donefiles:
+            dirname = os.path.dirname(path)
+            if (os.path.basename(path) in listing[dirname]) if dirname in listing else os.path.exists(path):
+                return 'done'
+        if f"error.{tag}" in names:   return 'error'
+        if f"running.{tag}" in names: return 'running'
+        if f"queue.{tag}" in names:   return 'queued'
+        return 'waiting'
+
+    def __repr__(self):
+        return f"Node({self.name})"
+
+#endclass
+
+##----------------------------------------------------------------------
+
+def node_table(nodes):
+    ''' Return {name: node} in the order of "nodes", check the dependencies'''
+    table = OrderedDict()
+    for node in nodes:
+        if node.name in table: raise ValueError(f"duplicated node {node.name}")
+        table[node.name] = node
+    for node in nodes:
+        for dep in node.deps+node.after:
+            if dep not in table: raise ValueError(f"unknown dependency {dep} of {node.name}")
+    return table
+#enddef node_table
+
+##======================================================================
+## Job backends
+##======================================================================
+
+class SlurmBackend:
+    ''' Submit the job scripts with sbatch '''
+
+    def submit(self,node):
+        ''' Submit "node", return the job id'''
+        proc = subprocess.run(['sbatch',node.script],cwd=node.workdir,stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT,universal_newlines=True)
+        if proc.returncode != 0:
+            raise RuntimeError(f"sbatch {node.script} failed: {proc.stdout.strip()}")
+        return proc.stdout.strip().split()[-1]
+
+    def poll(self):
+        ''' The jobs report by the marker files, nothing to do '''
+        return []
+
+#endclass
+
+##----------------------------------------------------------------------
+
+class LocalBackend:
+    '''
+    Run the job scripts with bash in subprocesses, as a stand-in of Slurm
+    for testing. The output goes to "job.out" in the work directory. A job
+    that exits without writing its "done" marker gets an "error" marker.
+    '''
+
+    def __init__(self):
+        self.procs = {}            # node name: (node, Popen)
+
+    def submit(self,node):
+        with open(os.path.join(node.workdir,'job.out'),'w') as outhdl:
+            proc = subprocess.Popen(['bash',node.script],cwd=node.workdir,stdout=outhdl,stderr=subprocess.STDOUT)
+        self.procs[node.name] = (node,proc)
+        return str(proc.pid)
+
+    def poll(self):
+        ''' Return the names of the jobs finished since the last call'''
+        finished = []
+        for name,(node,proc) in list(self.procs.items()):
+            if proc.poll() is None: continue
+            del self.procs[name]
+            finished.append(name)
+            if not os.path.exists(node.marker('done')):
+                for kind in ('queue', 'running'):
+                    if os.path.exists(node.marker(kind)): os.unlink(node.marker(kind))
+                open(node.marker('error'),'w').close()
+        return finished
+
+#endclass
+
+_BACKENDS = {'slurm': SlurmBackend, 'local': LocalBackend}
+
+##----------------------------------------------------------------------
+
+def submit_node(backend,node):
+    ''' Prepare "node", write its queue marker and submit it with "backend", return the job id'''
+    if node.prepare is not None: node.prepare()
+    open(node.marker('queue'),'w').close()     # before the job can remove it
+    try:
+        return backend.submit(node)
+    except Exception:
+        os.unlink(node.marker('queue'))
+        raise
+#enddef submit_node
+
+##======================================================================
+## Scheduler
+##======================================================================
+
+class Scheduler:
+    '''
+    Submit the nodes as soon as they can run
+
+      backend : SlurmBackend, LocalBackend or an object with the same methods
+      limits  : {stage: maximum number of queued and running nodes}
+      poll    : seconds between checks when no inotify event comes
+      stable  : seconds an input file must be unchanged to be ready
+    '''
+
+    def __init__(self,nodes,backend,limits=None,poll=10.0,stable=20.0,verbose=False):
+        self.nodes   = node_table(nodes)
+        self.backend = backend
+        self.limits  = limits or {}
+        self.poll    = poll
+        self.stable  = stable
+        self.verbose = verbose
+        self._seen   = {}          # input path: ((size, mtime), time of the last change)
+        self._submitted = set()    # a job removes "queue" just before it writes "running"
+    #enddef
+
+    ####################################################################
+
+    def statuses(self):
+        ''' Return {node name: status}, each marker directory is listed once '''
+        listing = {}
+        for node in self.nodes.values():
+            dirname = node.markers[0]
+            if dirname not in listing:
+                try:
+                    listing[dirname] = set(os.listdir(dirname))
+                except OSError:
+                    listing[dirname] = set()
+        return {name: node.status(listing) for name,node in self.nodes.items()}
+
+    ####################################################################
+
+    def inputs_ready(self,node,now):
+        ''' Whether all inputs of "node" are ready, and the seconds until they may be'''
+        wakeup = None
+        for path,minsize in node.inputs:
+            try:
+                fstat = os.stat(path)
+            except OSError:
+                return False, None
+            signature = (fstat.st_size, fstat.st_mtime_ns)
+            if path not in self._seen or self._seen[path][0] != signature:
+                self._seen[path] = (signature, now)
+            if fstat.st_size < minsize:
+                return False, None
+            remaining = self._seen[path][1]+self.stable-now
+            if remaining > 0:
+                wakeup = remaining if wakeup is None else max(wakeup,remaining)
+        return wakeup is None, wakeup
+
+    ####################################################################
+
+    def blocked(self,status):
+        ''' Return the names of the waiting nodes that can never run because of a failed node'''
+        blocked = set()
+        changed = True
+        while changed:
+            changed = False
+            for name,node in self.nodes.items():
+                if name in blocked or status[name] != 'waiting': continue
+                if any(status.get(dep) == 'error' or dep in blocked for dep in node.deps+node.after):
+                    blocked.add(name)
+                    changed = True
+        return blocked
+
+    ####################################################################
+
+    def step(self):
+        ''' Submit all nodes that can run now
+
+            Return (status, seconds until an input may be ready or None)
+        '''
+        self.backend.poll()
+        status = self.statuses()
+        now    = time.monotonic()
+        for name in self._submitted:
+            if status[name] == 'waiting': status[name] = 'queued'
+
+        active = {}
+        for name,node in self.nodes.items():
+            if status[name] in ('queued', 'running'):
+                active[node.stage] = active.get(node.stage,0)+1
+
+        wakeup = None
+        for name,node in self.nodes.items():
+            if status[name] != 'waiting': continue
+            if any(status[dep] != 'done' for dep in node.deps): continue
+            if any(status[dep] == 'waiting' for dep in node.after): continue
+
+            limit = self.limits.get(node.stage)
+            if limit is not None and active.get(node.stage,0) >= limit: continue
+
+            ready, remaining = self.inputs_ready(node,now)
+            if not ready:
+                if remaining is not None:
+                    wakeup = remaining if wakeup is None else min(wakeup,remaining)
+                continue
+
+            jobid = submit_node(self.backend,node)
+            status[name] = 'queued'
+            self._submitted.add(name)
+            active[node.stage] = active.get(node.stage,0)+1
+            print(f"{time.strftime('%m-%d_%H:%M:%S')} submitted {name} ({jobid})", flush=True)
+
+        return status, wakeup
+
+    ####################################################################
+
+    def run(self,timeout=None):
+        ''' Run until all nodes are done, return 0, or 1 if a node failed and
+            nothing else can make progress or at "timeout" seconds.
+        '''
+        notify = None
+        try:
+            notify = waitfile.Inotify()
+        except OSError:
+            pass
+
+        watched = False
+        lastcounts = None
+        btime   = time.monotonic()
+        try:
+            while True:
+                status, wakeup = self.step()
+
+                if notify is not None and not watched:  ## the directories are made by the first nodes
+                    for dirname in {node.markers[0] for node in self.nodes.values()}:
+                        if os.path.isdir(dirname) and not waitfile.remote_filesystem(dirname):
+                            notify.add_watch(dirname)
+                    watched = all(os.path.isdir(node.markers[0]) for node in self.nodes.values())
+
+                counts = {}
+                for state in status.values(): counts[state] = counts.get(state,0)+1
+                if self.verbose and counts != lastcounts:
+                    print(f"{time.strftime('%m-%d_%H:%M:%S')} " + ', '.join(f"{state}: {count}" for state,count in sorted(counts.items())), flush=True)
+                lastcounts = counts
+
+                if counts.get('done',0) == len(status):
+                    return 0
+
+                blocked = self.blocked(status)
+                if not counts.get('queued') and not counts.get('running') and \
+                   counts.get('waiting',0) == len(blocked):
+                    failed = [name for name,state in status.items() if state == 'error']
+                    print(f"ERROR: failed {' '.join(failed)}, cannot run {len(blocked)} nodes", file=sys.stderr)
+                    return 1
+
+                delay = self.poll if wakeup is None else min(self.poll,wakeup+0.001)
+                if timeout is not None:
+                    left = btime+timeout-time.monotonic()
+                    if left <= 0:
+                        print(f"ERROR: not done after {timeout} s", file=sys.stderr)
+                        return 1
+                    delay = min(delay,left)
+
+                if notify is not None and notify.watches:
+                    events, _, _ = select.select([notify],[],[],delay)
+                    if events: notify.drain()
+                else:
+                    time.sleep(delay)
+        finally:
+            if notify is not None: notify.close()
+    #enddef run
+
+#endclass
+
+##======================================================================
+## The FV3 pipeline
+##======================================================================
+
+def fill_template(template,outfile,values):
+    ''' Write "template" with the place holders replaced by "values", as the sed commands'''
+    namelist.namelistTemplate(template,'text').render(outfile,values)
+
+def link(src,dst):
+    ''' ln -sf src dst '''
+    if os.path.lexists(dst): os.unlink(dst)
+    os.symlink(src,dst)
+
+##----------------------------------------------------------------------
+
+def build_pipeline(eventdir,eventdate,cfg):
+    '''Return the nodes of the pipeline in run_fv3_Jet.sh and run_post.sh
+
+       "cfg" is _JET_CONFIG updated by the command line
+    '''
+
+    rootdir      = cfg['rootdir']
+    template_dir = os.path.join(rootdir,'run_templates_EMC')
+    exedir       = os.path.join(rootdir,'exec')
+    run          = cfg['run']
+    mode         = run.upper()
+    cycle        = cfg['cycle']
+    inputdir     = os.path.join(eventdir,'INPUT')
+    postprd_dir  = os.path.join(eventdir,'postprd')
+    postbufr_dir = os.path.join(eventdir,'postbufr')
+    starttime    = datetime.strptime(eventdate+cycle,'%Y%m%d%H')
+    tophour      = cfg['tophour']
+    intvhour     = cfg['intvhour']
+    npes         = cfg['layout_x']*cfg['layout_y']+cfg['quilt_nodes']*cfg['quilt_ppn']
+
+    nodes = []
+
+    ## 1. initial conditions
+
+    ics_head = starttime.strftime('%y%j%H%M')
+    ics_work = os.path.join(inputdir,'tmp_ICS')
+    ics_job  = os.path.join(ics_work,f"run_ics_{eventdate}{cycle}.slurm")
+
+    def prepare_ics():
+        os.makedirs(ics_work,exist_ok=True)
+        fill_template(os.path.join(template_dir,'make_ics.slurm'),ics_job,
+                      {'WWWDDD': inputdir, 'EXEDDD': exedir, 'DATDDD': eventdate+cycle,
+                       'DDDHHH': eventdate[4:8], 'GFS_INPUT_DIR': cfg['ics_dir']})
+
+    nodes.append(Node('ics','ics',(inputdir,'ics'),ics_work,ics_job,
+                      inputs=[(os.path.join(cfg['ics_dir'],f"{ics_head}.gfs.t{cycle}z.atmanl.nc"),cfg['ics_size'][0]),
+                              (os.path.join(cfg['ics_dir'],f"{ics_head}.gfs.t{cycle}z.sfcanl.nc"),cfg['ics_size'][1])],
+                      prepare=prepare_ics))
+
+    ## 2. lateral boundary conditions, one node for each boundary hour
+
+    lbcs_head = starttime.strftime('%y%j%H')
+    lbcnames  = []
+    for hour in range(intvhour,tophour+1,intvhour):
+        fhr3d    = f"{hour:03d}"
+        lbc_work = os.path.join(inputdir,f"tmp_LBCS_{fhr3d}")
+        lbc_job  = os.path.join(lbc_work,f"run_lbcs_{eventdate}{cycle}_{fhr3d}.slurm")
+
+        def prepare_lbc(hour=hour,fhr3d=fhr3d,lbc_work=lbc_work,lbc_job=lbc_job):
+            os.makedirs(lbc_work,exist_ok=True)
+            fill_template(os.path.join(template_dir,'make_lbcs.slurm'),lbc_job,
+                          {'WWWDDD': inputdir, 'EXEDDD': exedir, 'DATDDD': eventdate+cycle,
+                           'HHHNNN': hour, 'DDDHHH': fhr3d, 'GFS_INPUT_DIR': cfg['lbcs_dir']})
+
+        nodes.append(Node(f"lbc_{fhr3d}",'lbcs',(inputdir,f"lbc_{fhr3d}"),lbc_work,lbc_job,
+                          inputs=[(os.path.join(cfg['lbcs_dir'],f"{lbcs_head}0000{hour:02d}"),cfg['lbcs_size'])],
+                          prepare=prepare_lbc,donefiles=[os.path.join(inputdir,'done.lbcs')]))
+        lbcnames.append(f"lbc_{fhr3d}")
+
+    ## 3. forecast
+
+    fcst_job = os.path.join(eventdir,f"run_fv3sar_{eventdate}{cycle}.slurm")
+    fcst_template = {'jet': 'run_on_Jet_EMC.job', 'odin': 'run_on_Odin_EMC.job'}[cfg['machine']]
+
+    def prepare_fcst():
+        open(os.path.join(inputdir,'done.lbcs'),'w').close()     # as run_fv3_Jet.sh
+
+        fix_lam = os.path.join(rootdir,'fix_lam')
+        fix_am  = os.path.join(rootdir,'fix_am')
+        gridno  = cfg['gridno']
+
+        link('gfs_data.tile7.halo0.nc', os.path.join(inputdir,'gfs_data.nc'))
+        link('sfc_data.tile7.halo0.nc', os.path.join(inputdir,'sfc_data.nc'))
+        for src,dst in ((f"{gridno}_grid.tile7.halo3.nc",        f"{gridno}_grid.tile7.halo3.nc"),
+                        (f"{gridno}_grid.tile7.halo4.nc",        'grid.tile7.halo4.nc'),
+                        (f"{gridno}_oro_data.tile7.halo0.nc",    'oro_data.nc'),
+                        (f"{gridno}_oro_data.tile7.halo4.nc",    'oro_data.tile7.halo4.nc'),
+                        (f"{gridno}_oro_data_ls.tile7.halo0.nc", 'oro_data_ls.nc'),
+                        (f"{gridno}_oro_data_ss.tile7.halo0.nc", 'oro_data_ss.nc'),
+                        (f"{gridno}_mosaic.halo3.nc",            'grid_spec.nc')):
+            link(os.path.join(fix_lam,src),os.path.join(inputdir,dst))
+
+        os.makedirs(os.path.join(eventdir,'RESTART'),exist_ok=True)
+
+        fixfiles = [('fd_nems.yaml', 'fd_nems.yaml')]
+        fixfiles += [(f"fix_clim/merra2.aerclim.2003-2014.m{m:02d}.nc", f"aeroclim.m{m:02d}.nc") for m in range(1,13)]
+        fixfiles += [('global_climaeropac_global.txt', 'aerosol.dat')]
+        fixfiles += [(f"fix_co2_proj/global_co2historicaldata_{yr}.txt", f"co2historicaldata_{yr}.txt") for yr in range(2010,2022)]
+        fixfiles += [('global_co2historicaldata_glob.txt', 'co2historicaldata_glob.txt'),
+                     ('co2monthlycyc.txt',                 'co2monthlycyc.txt'),
+                     ('global_albedo4.1x1.grb',            'global_albedo4.1x1.grb'),
+                     ('global_h2o_pltc.f77',               'global_h2oprdlos.f77'),
+                     ('ozprdlos_2015_new_sbuvO3_tclm15_nuchem.f77', 'global_o3prdlos.f77'),
+                     ('global_tg3clim.2.6x1.5.grb',        'global_tg3clim.2.6x1.5.grb'),
+                     ('global_zorclim.1x1.grb',            'global_zorclim.1x1.grb'),
+                     ('fix_clim/optics_BC.v1_3.dat',       'optics_BC.dat'),
+                     ('fix_clim/optics_DU.v15_3.dat',      'optics_DU.dat'),
+                     ('fix_clim/optics_OC.v1_3.dat',       'optics_OC.dat'),
+                     ('fix_clim/optics_SS.v3_3.dat',       'optics_SS.dat'),
+                     ('fix_clim/optics_SU.v1_3.dat',       'optics_SU.dat'),
+                     ('global_sfc_emissivity_idx.txt',     'sfc_emissivity_idx.txt'),
+                     ('global_solarconstant_noaa_an.txt',  'solarconstant_noaa_an.txt')]
+        for src,dst in fixfiles:
+            link(os.path.join(fix_am,src),os.path.join(eventdir,dst))
+
+        import shutil
+        shutil.copy(os.path.join(template_dir,'data_table'),     os.path.join(eventdir,'data_table'))
+        shutil.copy(os.path.join(template_dir,f'field_table_{mode}'), os.path.join(eventdir,'field_table'))
+        shutil.copy(os.path.join(template_dir,'nems.configure'), os.path.join(eventdir,'nems.configure'))
+
+        yyyy, mm, dd = eventdate[0:4], eventdate[4:6], eventdate[6:8]
+        namelist.namelistTemplate(os.path.join(template_dir,'diag_table'),'text').render(
+                  os.path.join(eventdir,'diag_table'), {'YYYY': yyyy, 'MM': mm, 'DD': dd})
+        namelist.namelistTemplate(os.path.join(template_dir,f'input.nml_{mode}'),'namelist').render(
+                  os.path.join(eventdir,'input.nml'),
+                  {'LAYOUTX': cfg['layout_x'], 'LAYOUTY': cfg['layout_y'], 'BC_UPDATE': intvhour,
+                   'FIX_AM': fix_am, 'FIX_LAM': fix_lam, 'GRIDNO': gridno, 'NPX': cfg['npx'], 'NPY': cfg['npy']})
+
+        config = esmfconfig.ESMFConfig.fromFile(os.path.join(template_dir,f'model_configure_{mode}'))
+        values = {'PE_MEMBER01': npes, 'start_year': int(yyyy), 'start_month': int(mm), 'start_day': int(dd),
+                  'nhours_fcst': tophour, 'write_groups': cfg['quilt_nodes'], 'write_tasks_per_group': cfg['quilt_ppn'],
+                  'nx': cfg['out_nx'], 'ny': cfg['out_ny'], 'lon1': cfg['out_lon1'], 'lat1': cfg['out_lat1']}
+        config.update({key: value for key,value in values.items() if key in config},add=False)
+        problems = config.validate() or esmfconfig.check_pes(config,
+                       namelist.namelistGroup.fromFile(os.path.join(eventdir,'input.nml'),'='))
+        if problems:
+            raise ValueError(f"model_configure of {eventdir}: {'; '.join(problems)}")
+        with open(os.path.join(eventdir,'model_configure'),'w') as outhdl:
+            config.write_stream(outhdl)
+
+        fill_template(os.path.join(template_dir,fcst_template),fcst_job,
+                      {'WWWDDD': eventdir, 'EXEPPP': os.path.join(exedir,'ufs_model'), 'NPES': npes, 'MODE': run})
+
+    nodes.append(Node('fcst','fcst',(eventdir,'fv3'),eventdir,fcst_job,
+                      deps=['ics']+lbcnames,prepare=prepare_fcst))
+
+    ## 4. post-processing, UPP and bufr for each forecast hour as soon as it is written
+
+    upp_template = {'jet': 'run_upp_on_Jet.job', 'odin': 'run_upp_on_Odin.job'}[cfg['machine']]
+    uppfix   = os.path.join(rootdir,'UPP_fix')
+    crtm_fix = os.path.join(rootdir,'CRTM_v2.2.3_fix')
+    do_bufr  = mode != 'NSSL_HRRR'
+    bufrnames = []
+
+    for hour in range(cfg['sfhr'],tophour+1):
+        fhr      = f"{hour:03d}"
+        log_file = os.path.join(eventdir,f"logf{fhr}")
+        upp_work = os.path.join(postprd_dir,fhr)
+        upp_job  = os.path.join(upp_work,f"run_upp_{fhr}.job")
+
+        def prepare_upp(hour=hour,fhr=fhr,upp_work=upp_work,upp_job=upp_job):
+            os.makedirs(upp_work,exist_ok=True)
+            posttime = starttime+timedelta(hours=hour)
+            with open(os.path.join(upp_work,'itag'),'w') as fhdl:
+                fhdl.write(f"&model_inputs\n"
+                           f"    fileName='{os.path.join(eventdir,f'dynf{fhr}.nc')}'\n"
+                           f"    IOFORM='netcdf'\n"
+                           f"    grib='grib2'\n"
+                           f"    DateStr='{posttime.strftime('%Y-%m-%d_%H:00:00')}'\n"
+                           f"    MODELNAME='FV3R'\n"
+                           f"    fileNameFlux='{os.path.join(eventdir,f'phyf{fhr}.nc')}'\n"
+                           f"/\n\n&NAMPGB\n    KPO=6,PO=1000.,925.,850.,700.,500.,250.,\n/\n")
+            for src,dst in (('nam_micro_lookup.dat',         'eta_micro_lookup.dat'),
+                            ('postxconfig-NT-fv3lam_2022.txt','postxconfig-NT.txt'),
+                            ('params_grib2_tbl_2022',        'params_grib2_tbl_new'),
+                            ('testbed_fields_bgdawp.txt',    'testbed_fields_bgdawp.txt')):
+                link(os.path.join(uppfix,src),os.path.join(upp_work,dst))
+            for src in _crtm_files():
+                link(os.path.join(crtm_fix,src),os.path.join(upp_work,os.path.basename(src)))
+            fill_template(os.path.join(template_dir,upp_template),upp_job,
+                          {'WWWDDD': upp_work, 'MMMMMM': mode, 'NNNNNN': 2, 'PPPPPP': 6, 'TTTTTT': 4,
+                           'EEEEEE': rootdir, 'DDDDDD': eventdate, 'HHHHHH': hour})
+
+        nodes.append(Node(f"upp_{fhr}",'upp',(postprd_dir,f"upp_{fhr}"),upp_work,upp_job,
+                          after=['fcst'],inputs=[(log_file,0)],prepare=prepare_upp))
+
+        if do_bufr:
+            bufr_work = os.path.join(postbufr_dir,fhr)
+            bufr_job  = os.path.join(bufr_work,f"exhiresw_bufr{fhr}.job")
+
+            def prepare_bufr(hour=hour,bufr_work=bufr_work,bufr_job=bufr_job):
+                os.makedirs(bufr_work,exist_ok=True)
+                profdat = os.path.join(postbufr_dir,'hiresw_profdat')
+                if not os.path.exists(profdat):
+                    import shutil
+                    shutil.copy(os.path.join(rootdir,'fix_am','hiresw_conusfv3_profdat'),profdat)
+                fill_template(os.path.join(template_dir,'exhiresw_bufr000.job'),bufr_job,
+                              {'WWWDDD': bufr_work, 'MMMMMM': mode, 'NNNNNN': 3, 'PPPPPP': 24, 'EEEEEE': rootdir,
+                               'DDDDDD': eventdate, 'HHHHHH': hour, 'HHHTOP': tophour})
+
+            nodes.append(Node(f"bufr_{fhr}",'bufr',(postbufr_dir,f"postbufr_{fhr}"),bufr_work,bufr_job,
+                              after=['fcst'],inputs=[(log_file,0)],prepare=prepare_bufr))
+            bufrnames.append(f"bufr_{fhr}")
+
+    if do_bufr:
+        hour     = tophour+1
+        last_job = os.path.join(postbufr_dir,f"exhiresw_bufr{hour:03d}.job")
+
+        def prepare_last():
+            fill_template(os.path.join(template_dir,'exhiresw_bufr061.job'),last_job,
+                          {'WWWDDD': postbufr_dir, 'MMMMMM': mode, 'EEEEEE': rootdir, 'DDDDDD': eventdate,
+                           'HHHHHH': hour, 'HHHTOP': tophour, 'NNNLEV': 65})
+
+        nodes.append(Node(f"bufr_{hour:03d}",'bufr',(postbufr_dir,f"postbufr_{hour:03d}"),postbufr_dir,last_job,
+                          deps=bufrnames,prepare=prepare_last))
+
+    ## the marker directories must exist for the queue markers
+    for dirname in (inputdir, postprd_dir, postbufr_dir):
+        os.makedirs(dirname,exist_ok=True)
+
+    return nodes
+#enddef build_pipeline
+
+##----------------------------------------------------------------------
+
+def _crtm_files():
+    ''' CRTM coefficient files linked for UPP, relative to CRTM_FIX, as in run_post.sh'''
+    endian = 'Big_Endian'
+    sensors = ['imgr_g15', 'imgr_g13', 'imgr_g12', 'imgr_g11', 'amsre_aqua', 'tmi_trmm',
+               'ssmi_f13', 'ssmi_f14', 'ssmi_f15', 'ssmis_f16', 'ssmis_f17', 'ssmis_f18', 'ssmis_f19', 'ssmis_f20',
+               'seviri_m10', 'imgr_mt2', 'imgr_mt1r', 'imgr_insat3d', 'abi_gr', 'ahi_himawari8']
+    files  = [f"SpcCoeff/{endian}/{sensor}.SpcCoeff.bin" for sensor in sensors]
+    files += [f"TauCoeff/ODPS/{endian}/{sensor}.TauCoeff.bin" for sensor in sensors]
+    files += [f"CloudCoeff/{endian}/CloudCoeff.bin", f"AerosolCoeff/{endian}/AerosolCoeff.bin",
+              f"EmisCoeff/IR_Land/SEcategory/{endian}/NPOESS.IRland.EmisCoeff.bin",
+              f"EmisCoeff/IR_Snow/SEcategory/{endian}/NPOESS.IRsnow.EmisCoeff.bin",
+              f"EmisCoeff/IR_Ice/SEcategory/{endian}/NPOESS.IRice.EmisCoeff.bin",
+              f"EmisCoeff/IR_Water/{endian}/Nalli.IRwater.EmisCoeff.bin",
+              f"EmisCoeff/MW_Water/{endian}/FASTEM6.MWwater.EmisCoeff.bin"]
+    return files
+
+##======================================================================
+## Parse command line arguments
+##======================================================================
+
+def parseArgv():
+    '''Parse command line arguments'''
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the FV3 pipeline (ICS, LBCS, forecast, UPP and bufr) as a dependency graph")
+
+    parser.add_argument("-n", "--show",    action="store_true", help="Show the nodes and their status only")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print the number of nodes in each state when it changes")
+    parser.add_argument("-r", "--run",     default=_JET_CONFIG['run'], help="FV3 configuration, emc/nssl, default: %(default)s")
+    parser.add_argument("-b", "--backend", default='slurm', choices=sorted(_BACKENDS), help="Job backend, default: %(default)s")
+    parser.add_argument("-m", "--machine", default=_JET_CONFIG['machine'], choices=['jet','odin'], help="Job templates of the machine, default: %(default)s")
+    parser.add_argument("-l", "--limit",   default=[], action='append', metavar='STAGE=N',
+                                           help=f"Maximum queued and running jobs of STAGE ({', '.join(_STAGES)}), may be repeated")
+    parser.add_argument("-p", "--poll",    type=float, default=10.0, help="Seconds between checks of the marker files, default: %(default)s")
+    parser.add_argument("-s", "--stable",  type=float, default=20.0, help="Seconds an input file must be unchanged, default: %(default)s")
+    parser.add_argument("-t", "--timeout", type=float, default=None, help="Give up after TIMEOUT seconds, default: wait forever")
+    parser.add_argument("--rootdir",       default=_JET_CONFIG['rootdir'], help="Root directory of exec/, fix_*/ and run_templates_EMC/, default: %(default)s")
+    parser.add_argument("--tophour",       type=int, default=_JET_CONFIG['tophour'],  help="Forecast length in hours, default: %(default)s")
+    parser.add_argument("--intvhour",      type=int, default=_JET_CONFIG['intvhour'], help="Boundary interval in hours, default: %(default)s")
+    parser.add_argument("--ics-dir",       default=_JET_CONFIG['ics_dir'],  help="Directory of the GFS analysis files, default: %(default)s")
+    parser.add_argument("--lbcs-dir",      default=_JET_CONFIG['lbcs_dir'], help="Directory of the GFS grib2 files, default: %(default)s")
+    parser.add_argument("--min-sizes",     default=None, metavar='ATM,SFC,LBC', help="Minimum sizes of the GFS files in bytes, default: the sizes in run_fv3_Jet.sh")
+    parser.add_argument("eventdate",       help="Case date YYYYMMDD")
+    parser.add_argument("workdir",         help="Work directory, the event directory is WORKDIR/RUN/YYYYMMDDHH")
+
+    args = parser.parse_args()
+
+    limits = {}
+    for item in args.limit:
+        stage, _, count = item.partition('=')
+        if stage not in _STAGES or not count.isdigit():
+            parser.error(f"wrong limit \"{item}\"")
+        limits[stage] = int(count)
+
+    cfg = dict(_JET_CONFIG, rootdir=args.rootdir, run=args.run, machine=args.machine, tophour=args.tophour,
+               intvhour=args.intvhour, ics_dir=args.ics_dir, lbcs_dir=args.lbcs_dir)
+    if args.min_sizes is not None:
+        sizes = [int(size) for size in args.min_sizes.split(',')]
+        cfg['ics_size']  = tuple(sizes[0:2])
+        cfg['lbcs_size'] = sizes[2]
+
+    return (args, cfg, limits)
+#enddef parseArgv
+
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+##
+## Entance Point
+##
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+if __name__ == '__main__':
+
+    args, cfg, limits = parseArgv()
+
+    eventdir = os.path.join(args.workdir,cfg['run'].upper(),f"{args.eventdate}{cfg['cycle']}")
+    os.makedirs(eventdir,exist_ok=True)
+
+    nodes = build_pipeline(eventdir,args.eventdate,cfg)
+    scheduler = Scheduler(nodes,_BACKENDS[args.backend](),limits,args.poll,args.stable,args.verbose)
+
+    if args.show:
+        status = scheduler.statuses()
+        for node in nodes:
+            deps = ','.join(node.deps) if len(node.deps) < 4 else f"{node.deps[0]},...,{node.deps[-1]}"
+            print(f"{node.name:<12} {node.stage:<5} {status[node.name]:<8} deps: {deps or '-'}"
+                  f"{'  after: '+','.join(node.after) if node.after else ''}"
+                  f"{'  inputs: '+' '.join(path for path,size in node.inputs) if node.inputs else ''}")
+        sys.exit(0)
+
+    print(f"---- Jobs started at {time.strftime('%m-%d_%H:%M:%S')} for Event: {args.eventdate} in {eventdir} ----", flush=True)
+    status = scheduler.run(args.timeout)
+    print(f"==== Jobs {'done' if status == 0 else 'stopped'} at {time.strftime('%m-%d_%H:%M:%S')} ====", flush=True)
+    sys.exit(status)
@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+## ---------------------------------------------------------------------
+##
+## Follow a running forecast, report each forecast hour as soon as it is
+## written and the model speed, optionally start its post-processing.
+##
+## A forecast hour is complete when the write component writes its
+## "logfHHH" file in the run directory (the file run_post.sh waits for).
+## The run directory is watched with inotify on a local file system
+## (see waitfile.py), otherwise it is listed every "--poll" seconds, one
+## directory read for all hours.
+##
+## The model standard output (fv3lam_*.out of run_on_Jet_EMC.job, or
+## "--stdout") is read incrementally: the byte offset is kept, so each
+## byte is read only once, and lines like
+##
+##   PASS: fcstRUN phase 1, n_atmsteps =      100 time is     1.234567
+##
+## give the wall time of each time step. For each hour, an event gives
+## the seconds of wall time per forecast hour, the average over the last
+## "--window" hours, the time step statistics and the expected end time.
+## An hour slower than "--slow" times the median of the previous hours is
+## reported as "slow", e.g. a slow node.
+##
+## For each hour, "--exec CMD" runs CMD ("{}" is replaced by the 3-digit
+## hour) and "--submit BACKEND" submits the UPP and bufr jobs of that
+## hour made from the run_templates_EMC templates, as fv3flow.py does.
+## With "--submit", the last bufr job (bufr_{tophour+1}) is submitted
+## once the bufr jobs of all hours are done, so the tool keeps running
+## after the forecast until then (see "--timeout").
+##
+## Examples:
+##
+##   fv3progress.py $eventdir
+##   fv3progress.py --format ndjson $eventdir > progress.json
+##   fv3progress.py -b 60 --submit slurm -r nssl --rootdir $FV3SARDIR $eventdir
+##
+## ---------------------------------------------------------------------
+##
+## Requirements:
+##
+##   o Python 3.6 or above
+##   o namelist.py, waitfile.py and fv3flow.py in the same directory
+##
+########################################################################
+
+import os, sys
+import glob
+import json
+import re
+import select
+import statistics
+import subprocess
+import time
+
+import namelist
+import waitfile
+
+_STEP_RE = re.compile(r'PASS:\s+fcstRUN phase 1,\s+n_atmsteps\s*=\s*(\d+)\s+time is\s+([0-9.Ee+-]+)')
+_LOGF_RE = re.compile(r'^logf(\d{3,})$')
+
+##======================================================================
+## Incremental reading
+##======================================================================
+
+class LogTail:
+    '''
+    Return the new complete lines of a growing file. The file is kept
+    open at its last position, it is opened again when it is replaced
+    (new inode) or truncated.
+    '''
+
+    def __init__(self,path):
+        self.path    = path
+        self.offset  = 0
+        self.partial = b''
+        self._fhdl   = None
+        self._inode  = None
+    #enddef
+
+    def lines(self):
+        ''' Return the lines written since the last call, without the new line'''
+        try:
+            fstat = os.stat(self.path)
+        except OSError:
+            return []
+
+        if fstat.st_ino != self._inode or fstat.st_size < self.offset:
+            self.close()
+            try:
+                self._fhdl = open(self.path,'rb')
+            except OSError:
+                return []
+            self._inode  = fstat.st_ino
+            self.offset  = 0
+            self.partial = b''
+
+        if fstat.st_size == self.offset:
+            return []
+
+        self._fhdl.seek(self.offset)
+        data = self._fhdl.read(fstat.st_size-self.offset)
+        self.offset += len(data)
+
+        *lines, self.partial = (self.partial+data).split(b'\n')
+        return [line.decode('utf-8','replace') for line in lines]
+
+    def close(self):
+        if self._fhdl is not None:
+            self._fhdl.close()
+            self._fhdl = None
+
+#endclass
+
+##======================================================================
+## Progress
+##======================================================================
+
+class ProgressTracker:
+    '''
+    Track the forecast in "rundir"
+
+      sfhr, tophour : first and last forecast hour
+      stdout        : model standard output, default: the newest fv3lam_*.out
+      window        : number of hours for the average speed
+      slow          : an hour slower than "slow" times the median is reported
+    '''
+
+    def __init__(self,rundir,sfhr=0,tophour=60,stdout=None,window=6,slow=1.5):
+        self.rundir  = rundir
+        self.sfhr    = sfhr
+        self.tophour = tophour
+        self.stdout  = stdout
+        self.window  = window
+        self.slow    = slow
+
+        self.hours   = {}          # forecast hour: completion time (mtime of logfHHH)
+        self.steps   = []          # (n_atmsteps, wall time) of the steps not in a reported hour
+        self.nsteps  = 0
+        self.tail    = None
+        self.dt_atmos = self.model_dt()
+    #enddef
+
+    ####################################################################
+
+    def model_dt(self):
+        ''' Time step in seconds from model_configure, None if not found'''
+        cfgfile = os.path.join(self.rundir,'model_configure')
+        if not os.path.exists(cfgfile): return None
+        cfggrp = namelist.namelistGroup.fromFile(cfgfile,':',dictionary=True)
+        nml_name = cfggrp.findblock('dt_atmos')
+        if nml_name is None: return None
+        try:
+            return float(cfggrp[nml_name]['dt_atmos'].value)
+        except (TypeError, ValueError):
+            return None
+
+    ####################################################################
+
+    def read_stdout(self):
+        ''' Read the new lines of the model standard output, keep the step times'''
+        path = self.stdout
+        if path is None:                       # the newest job output, e.g. after a restart
+            outfiles = glob.glob(os.path.join(self.rundir,'fv3lam_*.out'))
+            if not outfiles: return
+            path = max(outfiles,key=os.path.getmtime)
+
+        if self.tail is None or self.tail.path != path:
+            if self.tail is not None: self.tail.close()
+            self.tail = LogTail(path)
+
+        for line in self.tail.lines():
+            match = _STEP_RE.search(line)
+            if match:
+                self.nsteps = int(match.group(1))
+                self.steps.append((self.nsteps, float(match.group(2))))
+
+    ####################################################################
+
+    def new_hours(self):
+        ''' Return the events of the hours written since the last call, in order'''
+        self.read_stdout()
+
+        found = []
+        try:
+            with os.scandir(self.rundir) as entries:
+                for entry in entries:
+                    match = _LOGF_RE.match(entry.name)
+                    if match is None: continue
+                    hour = int(match.group(1))
+                    if hour in self.hours or hour < self.sfhr or hour > self.tophour: continue
+                    found.append((hour, entry.stat().st_mtime))
+        except OSError:
+            return []
+
+        events = []
+        for hour,mtime in sorted(found):
+            events.append(self.hour_event(hour,mtime,self.hour_steps(hour,len(found))))
+        return events
+
+    ####################################################################
+
+    def hour_steps(self,hour,nhours):
+        ''' Remove and return the (n_atmsteps, wall time) of the steps of "hour",
+            "nhours" hours are reported together.
+
+            Step n ends at forecast hour sfhr+n*dt_atmos/3600, so the steps
+            of several hours found at once (e.g. when catching up with a
+            running forecast) are split at the hour boundaries. Without
+            dt_atmos, the steps are kept only when one hour is reported.
+        '''
+        if self.dt_atmos:
+            laststep = (hour-self.sfhr)*3600.0/self.dt_atmos
+            steps = [step for step in self.steps if step[0] <= laststep]
+            self.steps = [step for step in self.steps if step[0] > laststep]
+            return steps
+
+        steps, self.steps = self.steps, []
+        return steps if nhours == 1 else []
+
+    ####################################################################
+
+    def hour_event(self,hour,mtime,steps=()):
+        ''' Record "hour" written at "mtime" after the time "steps", return its event'''
+        previous = [h for h in self.hours if h < hour]
+        event = {'event': 'hour', 'fhr': hour, 'time': mtime, 'nsteps': steps[-1][0] if steps else self.nsteps}
+
+        if previous:
+            last = max(previous)
+            event['seconds_per_hour'] = (mtime-self.hours[last])/(hour-last)
+
+        rates = self.rates()
+        self.hours[hour] = mtime
+
+        if 'seconds_per_hour' in event:
+            median = statistics.median(rates) if len(rates) >= 2 else 0.0
+            if median > 0 and event['seconds_per_hour'] > self.slow*median:   # hours found at once have no rate
+                event['slow'] = round(event['seconds_per_hour']/median,2)
+            recent = (rates+[event['seconds_per_hour']])[-self.window:]
+            event['average'] = sum(recent)/len(recent)
+            remaining = self.tophour-max(self.hours)
+            if remaining > 0: event['eta'] = time.time()+remaining*event['average']
+
+        if steps:
+            times = [seconds for nstep,seconds in steps]
+            event['step_mean'] = sum(times)/len(times)
+            event['step_max']  = max(times)
+            if self.dt_atmos:
+                event['model_seconds_per_hour'] = event['step_mean']*3600.0/self.dt_atmos
+
+        return event
+
+    ####################################################################
+
+    def rates(self):
+        ''' Wall seconds per forecast hour of the hours so far'''
+        hours = sorted(self.hours)
+        return [(self.hours[h2]-self.hours[h1])/(h2-h1) for h1,h2 in zip(hours[:-1],hours[1:])]
+
+    ####################################################################
+
+    def finished(self):
+        ''' Whether all hours are written, or the model stopped (done.fv3 or error.fv3)'''
+        if all(hour in self.hours for hour in range(self.sfhr,self.tophour+1)):
+            return True
+        return any(os.path.exists(os.path.join(self.rundir,f"{kind}.fv3")) for kind in ('done', 'error'))
+
+#endclass
+
+##======================================================================
+## Output
+##======================================================================
+
+def format_event(event,fmt):
+    ''' Return "event" as one line of text or JSON'''
+    if fmt == 'ndjson':
+        return json.dumps(event)
+
+    stamp = time.strftime('%m-%d_%H:%M:%S',time.localtime(event['time']))
+    if event['event'] != 'hour':
+        return f"{stamp} {event['event']} {event.get('message','')}"
+
+    line = f"{stamp} fhr {event['fhr']:03d} written"
+    if 'seconds_per_hour' in event:
+        line += f", {event['seconds_per_hour']:.1f} s/h (average {event['average']:.1f})"
+    if 'step_mean' in event:
+        line += f", step {event['step_mean']:.3f} s mean {event['step_max']:.3f} s max"
+    if 'eta' in event:
+        line += f", end at {time.strftime('%H:%M:%S',time.localtime(event['eta']))}"
+    if 'slow' in event:
+        line += f"  SLOW ({event['slow']}x median)"
+    return line
+
+##======================================================================
+## Post-processing
+##======================================================================
+
+class PostSubmitter:
+    '''
+    Submit the UPP and bufr jobs of each hour as fv3flow.py does
+
+    The last bufr job (bufr_{tophour+1}), which collects the bufr files
+    of all hours, is submitted by "submit_last" once the bufr jobs of all
+    hours are done, "pending" is True until then.
+    '''
+
+    def __init__(self,rundir,eventdate,backend,cfg):
+        import fv3flow
+
+        self.fv3flow = fv3flow
+        self.backend = fv3flow._BACKENDS[backend]()
+        self.nodes   = {node.name: node for node in fv3flow.build_pipeline(rundir,eventdate,cfg)
+                        if node.stage in ('upp', 'bufr')}
+        self.last    = self.nodes.get(f"bufr_{cfg['tophour']+1:03d}")
+        self.pending = self.last is not None
+    #enddef
+
+    def status(self,node):
+        dirname = node.markers[0]
+        return node.status({dirname: set(os.listdir(dirname))})
+
+    def submit(self,hour):
+        ''' Submit the jobs of "hour" that are not done, queued or running, return their names'''
+        self.backend.poll()
+        submitted = []
+        for name in (f"upp_{hour:03d}", f"bufr_{hour:03d}"):
+            node = self.nodes.get(name)
+            if node is None or node is self.last: continue
+            if self.status(node) != 'waiting': continue
+            self.fv3flow.submit_node(self.backend,node)
+            submitted.append(name)
+        return submitted
+
+    def submit_last(self):
+        ''' Submit the last bufr job when the bufr jobs of all hours are done, return
+            its name in a list. Raise RuntimeError if a bufr job failed.
+        '''
+        self.backend.poll()
+        if not self.pending: return []
+
+        if self.status(self.last) != 'waiting':       # submitted before, e.g. by fv3flow.py
+            self.pending = False
+            return []
+
+        dirname = self.last.markers[0]
+        listing = {dirname: set(os.listdir(dirname))}
+        status  = {name: self.nodes[name].status(listing) for name in self.last.deps}
+        failed  = [name for name,state in status.items() if state == 'error']
+        if failed:
+            self.pending = False
+            raise RuntimeError(f"{self.last.name} not submitted, failed {' '.join(failed)}")
+        if any(state != 'done' for state in status.values()):
+            return []
+
+        self.fv3flow.submit_node(self.backend,self.last)
+        self.pending = False
+        return [self.last.name]
+
+#endclass
+
+##======================================================================
+## Parse command line arguments
+##======================================================================
+
+def parseArgv():
+    '''Parse command line arguments'''
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Follow a running forecast and report each forecast hour as soon as it is written")
+
+    parser.add_argument("-s", "--sfhr",    type=int,   default=0,    help="First forecast hour, default: %(default)s")
+    parser.add_argument("-b", "--tophour", type=int,   default=60,   help="Last forecast hour, default: %(default)s")
+    parser.add_argument("-o", "--stdout",  default=None, help="Model standard output, default: the newest fv3lam_*.out in RUNDIR")
+    parser.add_argument("-w", "--window",  type=int,   default=6,    help="Number of hours for the average speed, default: %(default)s")
+    parser.add_argument("--slow",          type=float, default=1.5,  help="Report hours slower than SLOW times the median, default: %(default)s")
+    parser.add_argument("-p", "--poll",    type=float, default=10.0, help="Seconds between checks on network file systems, default: %(default)s")
+    parser.add_argument("-t", "--timeout", type=float, default=None, help="Give up after TIMEOUT seconds, default: wait until the forecast ends")
+    parser.add_argument("-f", "--format",  default='text', choices=['text','ndjson'], help="Event format, default: %(default)s")
+    parser.add_argument("-e", "--exec",    default=None, metavar='CMD', help="Run shell command CMD for each hour, \"{}\" is replaced by the 3-digit hour")
+    parser.add_argument("--submit",        default=None, metavar='BACKEND', choices=['slurm','local'],
+                                           help="Submit the UPP and bufr jobs of each hour with BACKEND (slurm or local)")
+    parser.add_argument("-r", "--run",     default='nssl', help="FV3 configuration for --submit, default: %(default)s")
+    parser.add_argument("-m", "--machine", default='jet', choices=['jet','odin'], help="Job templates for --submit, default: %(default)s")
+    parser.add_argument("--rootdir",       default=None, help="Root directory of run_templates_EMC/, UPP_fix/ etc. for --submit")
+    parser.add_argument("-d", "--date",    default=None, help="Case date YYYYMMDD for --submit, default: from the name of RUNDIR")
+    parser.add_argument("rundir",          help="Run directory of the forecast (the event directory)")
+
+    args = parser.parse_args()
+
+    if args.submit is not None:
+        if args.date is None:
+            basename = os.path.basename(os.path.normpath(args.rundir))
+            if not re.match(r'^\d{10}$',basename):
+                parser.error("the case date is not known, use --date")
+            args.date = basename[0:8]
+        if args.rootdir is None:
+            parser.error("--submit needs --rootdir")
+
+    return args
+#enddef parseArgv
+
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+##
+## Entance Point
+##
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+if __name__ == '__main__':
+
+    args = parseArgv()
+
+    tracker = ProgressTracker(args.rundir,args.sfhr,args.tophour,args.stdout,args.window,args.slow)
+
+    submitter = None
+    if args.submit is not None:
+        import fv3flow
+        cfg = dict(fv3flow._JET_CONFIG, rootdir=args.rootdir, run=args.run, machine=args.machine,
+                   tophour=args.tophour, sfhr=args.sfhr)
+        submitter = PostSubmitter(args.rundir,args.date,args.submit,cfg)
+
+    notify = None
+    try:
+        if not waitfile.remote_filesystem(args.rundir):
+            notify = waitfile.Inotify()
+            if not notify.add_watch(args.rundir):
+                notify.close()
+                notify = None
+    except OSError:
+        notify = None
+
+    procs   = []
+    failed  = []
+    status  = 0
+    btime   = time.monotonic()
+    try:
+        while True:
+            finished = tracker.finished()        # before the check, not to miss the last hours
+
+            for event in tracker.new_hours():
+                print(format_event(event,args.format), flush=True)
+                fhr = f"{event['fhr']:03d}"
+                if args.exec is not None:
+                    procs.append((fhr,subprocess.Popen(args.exec.replace('{}',fhr),shell=True)))
+                if submitter is not None:
+                    for name in submitter.submit(event['fhr']):
+                        print(format_event({'event': 'submitted', 'time': time.time(), 'message': name},args.format), flush=True)
+
+            if submitter is not None and submitter.pending:
+                try:
+                    for name in submitter.submit_last():
+                        print(format_event({'event': 'submitted', 'time': time.time(), 'message': name},args.format), flush=True)
+                except RuntimeError as err:
+                    print(f"ERROR: {err}", file=sys.stderr)
+                    status = 2
+
+            for fhr,proc in list(procs):
+                if proc.poll() is None: continue
+                procs.remove((fhr,proc))
+                if proc.returncode != 0: failed.append(fhr)
+
+            if finished:
+                missing = [hour for hour in range(args.sfhr,args.tophour+1) if hour not in tracker.hours]
+                if missing:
+                    print(f"ERROR: forecast stopped, hours not written: {' '.join(f'{h:03d}' for h in missing)}", file=sys.stderr)
+                    status = 1
+                    break
+                if submitter is None or not submitter.pending:
+                    break
+
+            if finished:                         # waiting for the bufr jobs, not in the run directory
+                delay = args.poll
+            else:
+                delay = args.poll if notify is None else max(args.poll,60.0)   # safety check
+            if args.timeout is not None:
+                left = btime+args.timeout-time.monotonic()
+                if left <= 0:
+                    print(f"ERROR: forecast not finished after {args.timeout} s", file=sys.stderr)
+                    status = 1
+                    break
+                delay = min(delay,left)
+
+            if notify is not None:
+                events, _, _ = select.select([notify],[],[],delay)
+                if events: notify.drain()
+            else:
+                time.sleep(delay)
+    except KeyboardInterrupt:
+        status = 130
+    except BrokenPipeError:           ## the reader exits early, e.g. head
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        status = 1
+    finally:
+        if notify is not None: notify.close()
+
+    for fhr,proc in procs:
+        if proc.wait() != 0: failed.append(fhr)
+    if failed:
+        print(f"ERROR: command failed for hours {' '.join(sorted(failed))}", file=sys.stderr)
+        status = status or 2
+
+    sys.exit(status)
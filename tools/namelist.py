@@ -19,17 +19,92 @@
 ##
 ##   o Python 3.6 or above
 ##
+## Only the modules needed to decode and print a namelist file are imported
+## at module level, others are imported by the functions that need them,
+## so that a simple print, or a script importing this module, starts fast.
+## "bench_namelist.py importtime" checks the start time.
+##
 ########################################################################
 
-import filecmp
-from itertools import zip_longest
-import re, sys
-import shutil
+import os, re, sys
+import time
+from collections import OrderedDict
 from collections.abc import MutableSequence
-import tempfile
+
+##======================================================================
+## Tokenizer for the variable lines within a namelist block
+##======================================================================
+
+_NML_TOKEN_PATTERN = r'''
+      (?P<comment>[!\#].*)                              # trailing comment, ends the line
+    | (?P<string>'(?:[^']|'')*'?|"(?:[^"]|"")*"?)       # quoted string, may contain separators
+    | (?P<name>[A-Za-z_]\w*(?:\s*\([^)]*\))?)\s*{varsep} # var, var(1), var(:,2) followed by separator
+    | (?P<value>[^\s{valsep}'"!\#]+)                    # bare value, number, boolean etc.
+'''
+
+_NML_SIMPLE_LINE_PATTERN = r'''
+    ([A-Za-z_]\w*)\s*{varsep}\s*                       # var =
+    ('(?:[^']|'')*'|"(?:[^"]|"")*"|[^\s{valsep}'"!\#]+)  # one value
+    \s*{valsep}?\s*$                                    # optional trailing separator
+'''
+
+_nml_tokenizers = {}
+
+def _nml_tokenizer(varsep):
+    '''Return the compiled tokenizer for separator "varsep" as a tuple of
+
+         o "match" method for the most common line "var = value," which
+           returns the (var, value) groups,
+         o "finditer" method to decode any line. It yields match objects
+           for one text line, the token kind is given by "lastgroup"
+           (comment, string, name or value), value separators and blanks
+           are skipped.
+    '''
+    tokenizer = _nml_tokenizers.get(varsep)
+    if tokenizer is None:
+        valsep = r'\s' if varsep == ':' else ','
+        seps = {'varsep': re.escape(varsep), 'valsep': valsep}
+        simple_re = re.compile(_NML_SIMPLE_LINE_PATTERN.format(**seps),re.VERBOSE)
+        token_re  = re.compile(_NML_TOKEN_PATTERN.format(**seps),re.VERBOSE)
+        tokenizer = (simple_re.match, token_re.finditer)
+        _nml_tokenizers[varsep] = tokenizer
+
+    return tokenizer
+#enddef _nml_tokenizer
 
 ##%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 
+_NOTSET = object()          # marker of a value not decoded yet
+
+_float_re      = re.compile(r'^[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?$')
+_float_like_re = re.compile(r'[\d.+Eeg\-]+')
+_repeat_re     = re.compile(r'^(\d+)\*(.*)$')        # Fortran repeat count, 3*0.0
+_holder_re     = re.compile(r'^[A-Z][A-Z0-9_]*$')    # place holder of a template, NPX
+
+_NUMPY_MIN_SIZE = 256       # arrays compared with NumPy (if available) from this size
+
+def _expand_repeats(elements):
+    ''' Expand the Fortran repeat counts in "elements", "3*0.0" is 3 elements "0.0"
+        and "3*" is 3 null (empty) elements.
+    '''
+    expanded = []
+    for el in elements:
+        match = _repeat_re.match(el) if '*' in el else None
+        if match:
+            expanded.extend([match.group(2)]*int(match.group(1)))
+        else:
+            expanded.append(el)
+    return expanded
+#enddef _expand_repeats
+
+def _isclose(el1,el2,rtol,atol):
+    ''' Compare two decoded elements, numbers (not booleans) with tolerance '''
+    if type(el1) in (int,float) and type(el2) in (int,float):
+        import math
+        return math.isclose(el1,el2,rel_tol=rtol,abs_tol=atol)
+    return el1 == el2
+#enddef _isclose
+
 class VariableValue(MutableSequence):
     """
     Extend the list built-in for namelist variable values
@@ -43,9 +118,24 @@ class VariableValue(MutableSequence):
     All variable values are converted into a string and wrapped in a list,
     even for value of one element.
 
+    The Python value and the datatype are decoded on first access and
+    cached, the cache is reset when the value list is modified. With
+    "strict", the value is decoded immediately and a warning is issued
+    for invalid value.
+
+    The canonical form (see "canonical") and its hash are cached as well,
+    so that non-strict comparison of two values is a hash comparison
+    in most cases. "array" gives the shape-aware form of the value for
+    element by element comparison, see "diff_elements".
+
+    Instances have no __dict__ to keep memory footprint low when many
+    namelist files are held in memory.
+
     """
 
-    def __init__(self,alist,var_name='',separator=',',comment=None):
+    __slots__ = ('_inner_list', '_sep', 'varname', 'comment', '_value', '_datatype', '_canon', '_digest', '_array')
+
+    def __init__(self,alist,var_name='',separator=',',comment=None,strict=False):
         super().__init__()
 
         if not isinstance(alist,list):
@@ -57,32 +147,71 @@ class VariableValue(MutableSequence):
         self._sep        = separator         # delimiter between values
         self.varname = var_name
         self.comment = comment
-        self.data = self._inner_list
-        try:
-            self.unpack(self.data)
-        except TypeError or ValueError:
-            print(f'WARNING: Invalid value for \"{var_name}\": {self.data}',file=sys.stderr)
+        self._value    = _NOTSET             # cached unpacked value
+        self._datatype = _NOTSET             # cached datatype
+        self._canon    = _NOTSET             # cached canonical form
+        self._digest   = _NOTSET             # cached hash of the canonical form
+        self._array    = _NOTSET             # cached (shape, elements)
+        if strict:
+            self.validate()
+
+    @property
+    def data(self):
+        ''' The value list in internal format of this module '''
+        return self._inner_list
 
     def __len__(self):
         return len(self._inner_list)
 
     def __delitem__(self, index):
         self._inner_list.__delitem__(index)
+        self._invalidate()
 
     def insert(self, index, value):
         self._inner_list.insert(index, value)
+        self._invalidate()
 
     def __setitem__(self, index, value):
         self._inner_list.__setitem__(index, value)
+        self._invalidate()
 
     def __getitem__(self, index):
         return self._inner_list.__getitem__(index)
 
     def append(self,value):
         self._inner_list.append(value)
+        self._invalidate()
 
     def extend(self,value):
         self._inner_list.extend(value)
+        self._invalidate()
+
+    def __reduce__(self):
+        ''' Pickle the value list only, not the cached value and datatype '''
+        return (self.__class__, (self._inner_list, self.varname, self._sep, self.comment))
+
+    def clone(self):
+        ''' Return a copy that does not share the value list with this instance,
+            the cached value and datatype are kept.
+        '''
+        alist = [list(el) if isinstance(el,list) else el for el in self._inner_list]
+        newvalue = self.__class__(alist, self.varname, self._sep, self.comment)
+        newvalue._value    = self._value
+        newvalue._datatype = self._datatype
+        newvalue._canon    = self._canon
+        newvalue._digest   = self._digest
+        newvalue._array    = self._array
+        return newvalue
+
+    def _invalidate(self):
+        ''' Reset the cached value and datatype after the value list is changed.
+            Must be called after changing an element of 2D value in place.
+        '''
+        self._value    = _NOTSET
+        self._datatype = _NOTSET
+        self._canon    = _NOTSET
+        self._digest   = _NOTSET
+        self._array    = _NOTSET
 
     def __repr__(self):
         return repr(self._inner_list)
@@ -107,19 +236,20 @@ class VariableValue(MutableSequence):
           get rid of list symbol for single value
       '''
 
-      if len(self._inner_list) > 1:
-          newvalue = []
-
-          for valel in self._inner_list:
-             newel = self.unpack(valel)
-             newvalue.append(newel)
-
-      else:
+      newvalue = self._value
+      if newvalue is _NOTSET:
+          if isinstance(self._inner_list[0],list):     # 3*0.0 is 0.0,0.0,0.0
+              elements = [_expand_repeats(row) for row in self._inner_list]
+          else:
+              elements = _expand_repeats(self._inner_list)
+          if len(elements) > 1:
+              newvalue = self.unpack(elements)
+          else:
+              newvalue = self.unpack(elements[0])
+          self._value = newvalue
 
-          #assert(len(self._inner_list[0])==1)
-          valnml = self._inner_list[0]
-          #print valnml
-          newvalue = self.unpack(valnml)
+      if isinstance(newvalue,list):     # do not hand out the cached list
+          return [list(el) if isinstance(el,list) else el for el in newvalue]
 
       return newvalue
 
@@ -131,6 +261,9 @@ class VariableValue(MutableSequence):
            Detect the value type as:
            int, str, float, bool, arrayofint1d, listint2d, ...
         '''
+        if self._datatype is not _NOTSET:
+            return self._datatype
+
         outtyp = ''
 
         dim = 0
@@ -158,31 +291,170 @@ class VariableValue(MutableSequence):
           outtyp += 'bool'
         elif valnml.isdigit():
           outtyp += 'int'
-        elif re.match(r'[\d.+Eeg\-]+',valnml):
+        elif _float_like_re.match(valnml):
           outtyp += 'float'
         else:
           raise TypeError("Invalid namelist variable value <%s>."%valnml)
 
+        self._datatype = outtyp
         return outtyp
 
     ####################################################################
 
+    def validate(self):
+        '''
+           Decode the value and issue a warning if it is invalid.
+
+           = False  invalid value
+           = True   valid value
+        '''
+        try:
+            self.value
+        except (TypeError, ValueError):
+            print(f'WARNING: Invalid value for \"{self.varname}\": {self.data}',file=sys.stderr)
+            return False
+        return True
+
+    ####################################################################
+
+    @property
+    def canonical(self):
+        '''
+           Normalized form of the value for non-strict comparison, a tuple
+           of the decoded elements (a tuple for each row of 2D value), e.g.
+           ".T." and ".true." are both True, "1.0" and "1." are both 1.0,
+           "3*0.0" is 0.0, 0.0, 0.0.
+           Elements that can not be decoded, e.g. place holders, are kept.
+        '''
+
+        if self._canon is _NOTSET:
+
+            def elkey(el):
+                try:
+                    return self.unpack(el)
+                except TypeError:
+                    return el
+
+            if isinstance(self._inner_list[0],list):
+                self._canon = tuple(tuple(elkey(el) for el in _expand_repeats(row)) for row in self._inner_list)
+            else:
+                self._canon = tuple(elkey(el) for el in _expand_repeats(self._inner_list))
+
+        return self._canon
+
+    @property
+    def digest(self):
+        ''' Hash of the canonical form, equal values have the same digest '''
+
+        if self._digest is _NOTSET:
+            self._digest = hash(self.canonical)
+        return self._digest
+
+    ####################################################################
+
+    @property
+    def array(self):
+        '''
+           (shape, elements) of the canonical form, "shape" is (n,) or (ni, nj)
+           for var(ni,nj), "elements" is a tuple in Fortran order (first index
+           varies fastest). Short rows of a 2D value are padded with None.
+        '''
+
+        if self._array is _NOTSET:
+            canon = self.canonical
+            if isinstance(self._inner_list[0],list):
+                ni = max(len(row) for row in canon)
+                elements = tuple(el for row in canon for el in row+(None,)*(ni-len(row)))
+                self._array = ((ni,len(canon)), elements)
+            else:
+                self._array = ((len(canon),), canon)
+
+        return self._array
+
+    ####################################################################
+
+    def diff_elements(self,varvalue,rtol=1e-6,atol=0.0):
+        '''
+           Compare with "varvalue" element by element, numbers are compared
+           with relative tolerance "rtol" and absolute tolerance "atol".
+
+           Return [(index, left, right), ...] of the elements that differ,
+           "index" is the Fortran index tuple (i,) or (i, j), a missing element
+           is None. Large numeric arrays are compared with NumPy if available.
+        '''
+
+        shape1, elements1 = self.array
+        shape2, elements2 = varvalue.array
+
+        def index(pos,shape):
+            if len(shape) == 1: return (pos+1,)
+            return (pos%shape[0]+1, pos//shape[0]+1)
+
+        if shape1 != shape2:                    ## compare by index
+            indexed1 = {index(pos,shape1): el for pos,el in enumerate(elements1)}
+            indexed2 = {index(pos,shape2): el for pos,el in enumerate(elements2)}
+            diffs = []
+            for idx in sorted(set(indexed1) | set(indexed2), key=lambda idx: idx[::-1]):
+                el1 = indexed1.get(idx)
+                el2 = indexed2.get(idx)
+                if not _isclose(el1,el2,rtol,atol):
+                    diffs.append((idx,el1,el2))
+            return diffs
+
+        positions = None
+        if len(elements1) >= _NUMPY_MIN_SIZE and all(type(el) in (int,float) for el in elements1+elements2):
+            try:
+                import numpy
+            except ImportError:
+                numpy = None
+            if numpy is not None:
+                array1 = numpy.array(elements1,dtype=float)
+                array2 = numpy.array(elements2,dtype=float)
+                tol    = numpy.maximum(rtol*numpy.maximum(numpy.abs(array1),numpy.abs(array2)),atol)
+                positions = numpy.nonzero(numpy.abs(array1-array2) > tol)[0].tolist()
+
+        if positions is None:
+            positions = [pos for pos,(el1,el2) in enumerate(zip(elements1,elements2)) if not _isclose(el1,el2,rtol,atol)]
+
+        return [(index(pos,shape1),elements1[pos],elements2[pos]) for pos in positions]
+
+    ####################################################################
+
+    def cmpkey(self,strictcmp):
+        '''
+           Return a hashable key of this value, two values have the same
+           key when they are equal by "isequal" with the same "strictcmp".
+        '''
+
+        if not strictcmp:
+            return self.canonical
+
+        def elkey(el):
+            return tuple(el) if isinstance(el,list) else el
+
+        return tuple(elkey(el) for el in self._inner_list)
+
+    ####################################################################
+
     def isequal(self,varvalue,strictcmp):
         '''
            compare itself with "varvalue"
 
            = False  Not equal
            = True   equal
+
+           Values are compared as the value lists in strict mode, otherwise
+           by the digests first and the canonical forms when the digests
+           are the same.
         '''
 
-        lenself = len(self)
-        lenin   = len(varvalue)
+        if strictcmp:
+            return self._inner_list == varvalue.data
 
-        if lenself > lenin or lenself < lenin:
-            iret = False
-        else:
-            iret = self.valueCMPList(self.data,varvalue.data,strictcmp)
-        return iret
+        if self.digest != varvalue.digest:
+            return False
+
+        return self.canonical == varvalue.canonical
 
     ##==================================================================
     @classmethod
@@ -213,7 +485,7 @@ class VariableValue(MutableSequence):
         if valnml.isdigit():
             return int(valnml)
 
-        if re.match(r'^[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?$',valnml):
+        if _float_re.match(valnml):
             return float(valnml)
 
         raise TypeError("Invalid variable value <%s>."%valnml)
@@ -236,6 +508,8 @@ class VariableValue(MutableSequence):
             for el in valuein:
                 newel = cls.pack(el)
                 newvalue.append(newel)
+        elif type(valuein) is bool :         ## Python boolean to Fortran logical
+            newvalue = '.true.' if valuein else '.false.'
         elif type(valuein) in [int,float] :  ## number should be converted to string
             newvalue =str(valuein)
         elif cls.isastring(valuein) :        ## str should be double wrapped
@@ -327,6 +601,11 @@ class VariableValue(MutableSequence):
                 else :
                     ret = True
             else :
+                if not strictcmp:               # 3*0.0 is 0.0,0.0,0.0
+                    list1 = _expand_repeats(list1)
+                    list2 = _expand_repeats(list2)
+                    if len(list1) != len(list2): return False
+
                 for el1,el2 in zip(list1,list2):
 
                     if strictcmp:
@@ -348,12 +627,14 @@ class VariableValue(MutableSequence):
 
 ##%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 
+_index_re = re.compile(r'([\w_ ]+)\(([\d:]{1,2})(,(\d{1,2})){0,2}\)')   # var(1), var(:,2)
+
 class namelistBlock(dict) :
     """
     Extend the dict built-in for namelist handling
     Added features are:
 
-      o Ordered keys
+      o Ordered keys, in the order of insertion
       o Comment for this namelist block
       o Append method, should be used to add new key
 
@@ -373,22 +654,22 @@ class namelistBlock(dict) :
     String representation:
         1. str()  To get Fortran namelist file output (readable)
         2. repr() To get internal representation, for debugging etc.
+
+    Only the attributes in __slots__ are real attributes of the instance.
+    "_owner" is (namelistGroup, block name) when this block is in a group,
+    new variables are then added to the variable index of the group.
     """
 
+    __slots__ = ('_name', '_sep', '_comment', '_owner')
+
     def __init__(self,name='',separator='=',comment=None) :
       dict.__init__(self)
-      self._order   = []
       self._name    = name
       self._sep     = separator
       self._comment = comment
+      self._owner   = None
  #  enddef
 
-    ####################################################################
-
-    def keys(self) :
-      return self._order
-    #enddef
-
     ######################################################################
 
     def getComment(self,key=None) :
@@ -400,10 +681,11 @@ class namelistBlock(dict) :
 
     ######################################################################
 
-    def append(self,key,value,valsep,comment=None) :
+    def append(self,key,value,valsep,comment=None,strict=False) :
         '''
             "value" must be a list, all elements in the list must be string
             string value is extra wrapped within ' and '
+            "strict" validates the value of a new variable (see VariableValue).
 
             It only append values to existing key or create new (key, value) pair.
             To replace value of existing key, use either
@@ -412,12 +694,13 @@ class namelistBlock(dict) :
                o the attribute notation, self.key = value
                  value will be in normal Fortran format.
 
+            Return the key of the variable, var(1,2) is stored as var.
         '''
         multidim = False   ## maximum to process 2 dimensions
         indx1 = 0
         #print 'Adding key :',key
         #                        1            2       3 4
-        regroups = re.match(r'([\w_ ]+)\(([\d:]{1,2})(,(\d{1,2})){0,2}\)',key)
+        regroups = _index_re.match(key) if '(' in key else None
         if  regroups:
             key = (regroups.group(1)).strip()
             if regroups.group(2) == ':': indx1 = 0
@@ -432,6 +715,7 @@ class namelistBlock(dict) :
                   self[key].append(value)
                 else :
                   self[key][indx2-1].extend(value)
+                  self[key]._invalidate()
             else :
                 if indx1 > 1: assert indx1-1 == len(self[key])
                 self[key].extend(value)
@@ -442,10 +726,11 @@ class namelistBlock(dict) :
                 if indx1 > 1: key = '%s(%d)' % (key, indx1)
                 valuelist = value
 
-            varvalue = VariableValue(valuelist,key,valsep,comment)
+            varvalue = VariableValue(valuelist,key,valsep,comment,strict)
 
             self.__setitem__(key,varvalue)
-            self._order.append(key)
+
+        return key
     #enddef
 
     ####################################################################
@@ -456,6 +741,8 @@ class namelistBlock(dict) :
     ####################################################################
 
     def __getattr__(self, key):
+      if key.startswith('__'):         ## special attributes looked up by pickle, copy etc.
+          raise AttributeError(key)
       try:
           return self[key].value
       except KeyError as key_error:
@@ -465,21 +752,24 @@ class namelistBlock(dict) :
     ####################################################################
 
     def __setattr__(self, key, value):
-      if key in ['_comment', '_order', '_sep', '_keycomments', '_name']:
+      if key in namelistBlock.__slots__:
           super().__setattr__(key,value)
       else:
           valnml = VariableValue.pack2list(value)
+          valsep = ' ' if self._sep == ':' else ','
 
           if key in self.keys():
-              self[key] = VariableValue(valnml,key)
+              self[key] = VariableValue(valnml,key,valsep)
           else:
-              self.append(key,valnml,'new variable')
+              self.append(key,valnml,valsep,'new variable')
 
     ####################################################################
 
     def __setitem__(self, key, value):
 
         if isinstance(value,VariableValue):
+            if self._owner is not None and key not in self:
+                self._owner[0]._index_variable(key,self._owner[1])
             super().__setitem__(key, value)
         else:
             raise ValueError('''Value "%s" is not an instance of class VariableValue.'''%value)
@@ -522,32 +812,68 @@ class namelistBlock(dict) :
     def __str__(self):
       ''' print or str()'''
 
+      return ''.join(self.iter_lines())
+
+    ######################################################################
+
+    def iter_lines(self):
+      ''' Generate the readable output line by line, see str()'''
+
       if self._sep == '=':
-          outstr = '&%s\n'%self._name
-      else:
-          outstr = ''
+          yield f'&{self._name}\n'
 
       for var_name in self.keys() :
-          outstr += f"  {self.item(var_name)}\n"
+          yield f"  {self.item(var_name)}\n"
 
-      if self._sep == '=': outstr += '/\n\n'
+      if self._sep == '=': yield '/\n\n'
 
-      return outstr
+    ######################################################################
+
+    def write_stream(self,fhdl):
+      ''' Write the readable output to a file-like object "fhdl" line by line'''
+
+      fhdl.writelines(self.iter_lines())
+
+    ##==================================================================
+
+    def cmpkeys(self,strictcmp=False):
+      ''' Return {var: comparison key} of this block (see VariableValue.cmpkey),
+          two blocks are equal when they return equal dicts
+      '''
+      return {key: value.cmpkey(strictcmp) for key,value in dict.items(self)}
+
+    ##==================================================================
+
+    def __reduce__(self):
+      ''' Pickle support, dict items are restored through __setitem__ '''
+      return (self.__class__, (self._name, self._sep, self._comment), None, None, iter(dict.items(self)))
+
+    ######################################################################
+
+    def clone(self):
+      ''' Return a copy with each variable value copied (see VariableValue.clone)'''
+
+      nmlblk = self.__class__(self._name, self._sep, self._comment)
+      for key,value in dict.items(self):
+          dict.__setitem__(nmlblk,key,value.clone())
+
+      return nmlblk
 
     ##==================================================================
 
     @classmethod
-    def clone_from_dict(cls,dictin):
+    def clone_from_dict(cls,dictin,separator='='):
       '''
          Create a namelistBlock from "dict"
       '''
 
-      nmlblk = cls('indict','Namelist block from python dictionary')
+      nmlblk = cls('indict',separator,'Namelist block from python dictionary')
+      valsep = ' ' if separator == ':' else ','
 
       for key,value in dictin.items():
           #nmlblk.__setattr__(key, value)
           nmlval = VariableValue.pack2list(value)
-          nmlblk.append(key,nmlval)
+          nmlblk.append(key,nmlval,valsep)
 
       return nmlblk
 
@@ -562,12 +888,27 @@ class namelistGroup(dict) :
     Added features:
       _order : list to return ordered keys, i.e. namelist block names,
       value  : is the namelist block corresponding to this name.
+
+    Variable index, built on first use by merge1dict (see "varindex"):
+      _varindex : {var: [names of the blocks that contain var]},
+                  kept up to date when blocks or variables are added.
+
+    Source index, when read from a file with "srcindex" (see fromFile):
+      _srctext  : text of the source file,
+      _srcindex : {block name: (offset of block end line, {var: (spans, original data)})}
+                  "spans" is a tuple of (name start, value start, value end)
+                  offsets in "_srctext" for each assignment of the variable.
     '''
 
     def __init__(self,filename=None) :
       dict.__init__(self)
       self._order   = []
       self._srcfile = filename
+      self._srcsep   = '='
+      self._srcdict  = False
+      self._srctext  = None
+      self._srcindex = {}
+      self._varindex = None
       self.merge    = self.merge1dict    # to keep backward compatible
       self.outblocks = None
     #enddef
@@ -581,12 +922,78 @@ class namelistGroup(dict) :
     ######################################################################
 
     def __setitem__(self,key,value) :
+        if key in self:                   ## variables of the replaced block
+            self._varindex = None
+        else:
+            self._order.append(key)
         dict.__setitem__(self,key,value)
-        self._order.append(key)
+        if isinstance(value,namelistBlock):
+            value._owner = (self,key)
+            if self._varindex is not None:
+                for var in value.keys():
+                    self._index_variable(var,key)
     #enddef
 
     ######################################################################
 
+    @property
+    def varindex(self):
+        ''' {var: [names of the blocks that contain var]} in block order '''
+
+        if self._varindex is None:
+            self._varindex = {}
+            for _nml_name in self._order:
+                for var in self[_nml_name].keys():
+                    self._varindex.setdefault(var,[]).append(_nml_name)
+        return self._varindex
+
+    def _index_variable(self,var,nml_name):
+        if self._varindex is not None:
+            self._varindex.setdefault(var,[]).append(nml_name)
+
+    def findblock(self,var,blknames=None):
+        ''' Return the name of the first block that contains "var",
+            searching only blocks in "blknames" if it is given.
+            None if not found.
+        '''
+
+        candidates = self.varindex.get(var)
+        if not candidates: return None
+
+        for _nml_name in (candidates if blknames is None else blknames):
+            if _nml_name in candidates and var in self.get(_nml_name,()):
+                return _nml_name
+        return None
+    #enddef findblock
+
+    ######################################################################
+
+    def __reduce__(self):
+        ''' Pickle support, "merge" is bound again by __init__ '''
+
+        state = {key: value for key,value in self.__dict__.items() if key not in ('merge','_order','outblocks','_varindex')}
+        return (self.__class__, (self._srcfile,), state, None, iter(dict.items(self)))
+
+    ######################################################################
+
+    def clone(self):
+        ''' Return a copy of this namelist group, that can be changed
+            without affecting this group. The source text and the source
+            index are never changed, so they are shared.
+        '''
+
+        nmlgrp = self.__class__(self._srcfile)
+        for key,value in self.__dict__.items():
+            if key not in ('merge','_order','outblocks','_varindex'):
+                nmlgrp.__dict__[key] = value
+
+        for _nml_name in self.keys():
+            nmlgrp[_nml_name] = self[_nml_name].clone()
+
+        return nmlgrp
+
+    ######################################################################
+
     def __repr__(self):
         '''repr() for debugging, formally representation of the object'''
 
@@ -604,14 +1011,29 @@ class namelistGroup(dict) :
     def __str__(self):
         ''' print or str(), for readable output'''
 
+        return ''.join(self.iter_lines())
+
+    ######################################################################
+
+    def iter_lines(self):
+        ''' Generate the readable output of the namelist blocks in
+            "self.outblocks" (all blocks by default) line by line
+        '''
+
         if self.outblocks is None:
             self.outblocks = self.keys()
 
-        outstr = ''
         for _nml_bname in self.outblocks:
-            outstr += str(self[_nml_bname])
+            yield from self[_nml_bname].iter_lines()
 
-        return outstr
+    ######################################################################
+
+    def write_stream(self,fhdl):
+        ''' Write the readable output to a file-like object "fhdl" line by line
+            without rendering the whole file in memory
+        '''
+
+        fhdl.writelines(self.iter_lines())
 
     ######################################################################
 
@@ -622,32 +1044,26 @@ class namelistGroup(dict) :
         Merge the give varaibles in a dict (indict) into this namelsit group.
         all keys in indict must exists in the namelist variables, otherwise
         a warning is issued.
+
+        Each variable goes to the first block that contains it (in "nblkname"
+        if it is given), which is looked up in the variable index, so the
+        cost depends on the size of "indict" only.
         '''
 
         if isinstance(indict,namelistBlock):
           inblk = indict
         else:
-          inblk = namelistBlock.clone_from_dict(indict)
+          inblk = namelistBlock.clone_from_dict(indict,self._srcsep)
           #print inblk
 
-        set1 = set(inblk.keys())
-
-        if nblkname is None:
-            nmlblocks = self.keys()
-        else:
-            nmlblocks = nblkname
-
-        for _nml_name in nmlblocks :       ## loop over all namelist blocks
-            _nml_block = self[_nml_name]
-            set0 = set(_nml_block.keys())      ## variable set of this namelist block
-            setc = set0.intersection(set1)     ## Keys to be updated
-            if len(setc) > 0 :                 ## this block contains variable to be merged
-                for var in setc :
-                    _nml_block[var] = inblk[var]
-                    #print "%s -> <%s>" % (var, _nml_block[var])
-
-            set1 = set1.difference(setc)      ## Keys left to be merged with other namelis block
-            if len(set1) <= 0 : break
+        set1 = []                              ## Keys not found in any namelist block
+        for var,value in inblk.items():
+            _nml_name = self.findblock(var,nblkname)
+            if _nml_name is None:
+                set1.append(var)
+            else:
+                self[_nml_name][var] = value
+                #print "%s -> <%s>" % (var, _nml_block[var])
 
         #
         # extra variables from input dict
@@ -659,7 +1075,7 @@ class namelistGroup(dict) :
                         sys.stderr.write('WARNING: Unknown variables \"%s\" while merging namelist <%s>. Adding...\n'%(','.join(set1),inblk._name))
                         for var in set1:
                             newvalue = inblk[var]
-                            self[nmlname].append(var,newvalue,'New from %s'%inblk._name)
+                            self[nmlname].append(var,newvalue.data,newvalue._sep,'New from %s'%inblk._name)
 
                             #print >> sys.stderr, self[nmlname].getComment(var)
             else:
@@ -669,6 +1085,33 @@ class namelistGroup(dict) :
 
     ######################################################################
 
+    def merge_many(self,indicts,nblkname=None,forceadd=False):
+        '''
+        Merge a sequence of 1-level dictionaries (or namelistBlocks) to this
+        group in one pass, later dictionaries take precedence, the same as
+        calling "merge1dict" for each of them in order.
+        '''
+
+        indicts = list(indicts)
+        if not indicts: return
+        if len(indicts) == 1:
+            self.merge1dict(indicts[0],nblkname,forceadd)
+            return
+
+        names = []
+        inblk = namelistBlock('',self._srcsep)
+        for indict in indicts:
+            if not isinstance(indict,namelistBlock):
+                indict = namelistBlock.clone_from_dict(indict,self._srcsep)
+            names.append(indict._name)
+            dict.update(inblk,indict)
+        inblk._name = ','.join(names)
+
+        self.merge1dict(inblk,nblkname,forceadd)
+    #enddef
+
+    ######################################################################
+
     def merge2dict(self,indict,blknames=None,forceadd=False):
         '''
         Merge 2-level dictionary to this file.
@@ -696,7 +1139,7 @@ class namelistGroup(dict) :
                     if key in _nml_block.keys():         # make sure variable is valid
                         _nml_block[key] = value
                     elif forceadd:
-                        _nml_block.append(key,value.data)
+                        _nml_block.append(key,value.data,value._sep)
                         sys.stderr.write('WARNING: Variables \"%s\" in namelist <%s> is not in the namelist file <%s>. Adding...\n'%(
                                           key, _nml_name,self._srcfile))
                     else:
@@ -710,6 +1153,46 @@ class namelistGroup(dict) :
 
     ######################################################################
 
+    def substitute(self,mapping):
+        '''
+        Replace place holders in variable values with their values in "mapping".
+
+        It works like a chain of "sed s/KEY/VALUE/g" over the values, but all
+        place holders are replaced in one pass with one compiled pattern,
+        and names and comments in the file are never changed.
+        "mapping" is {place holder: value}, longer place holders are matched
+        first, so that "YYYYMMDD" is not spoiled by "MM" or "DD".
+
+        Return the number of variables changed.
+        '''
+
+        if not mapping: return 0
+
+        replace = {key: str(value) for key,value in mapping.items()}
+        pattern = re.compile('|'.join(re.escape(key) for key in sorted(replace,key=len,reverse=True)))
+        subfunc = lambda match: replace[match.group(0)]
+
+        nchanged = 0
+        for _nml_name in self.keys():
+            for varvalue in self[_nml_name].values():
+                changed = False
+                for i,el in enumerate(varvalue):
+                    if isinstance(el,list):              ## 2D variable
+                        newel = [pattern.sub(subfunc,el1) for el1 in el]
+                    else:
+                        newel = pattern.sub(subfunc,el)
+                    if newel != el:
+                        varvalue.data[i] = newel
+                        changed = True
+                if changed:
+                    varvalue._invalidate()
+                    nchanged += 1
+
+        return nchanged
+    #enddef substitute
+
+    ######################################################################
+
     def writeToFile(self,filein, blks=None):
         '''Write a run-time namelist file.'''
 
@@ -718,9 +1201,9 @@ class namelistGroup(dict) :
 
         if isinstance(filein, str):
             with open(filein,'w') as nml_file:
-                nml_file.write(str(self))
+                self.write_stream(nml_file)
         else :
-            filein.write(str(self))
+            self.write_stream(filein)
 
     #enddef writeToFile
 
@@ -738,120 +1221,66 @@ class namelistGroup(dict) :
            The purpose of this method is to keep the comments and format in
            the original file, but replace variable values with those in
            this namelist Group.
+
+           The source lines and the variable spans recorded by "fromFile"
+           are patched in memory, only values that were changed are
+           replaced, all other text is written as it is.
         '''
 
+        if self._srctext is None:        ## index the source file, the values are not changed
+            srcgrp = self.fromFile(self._srcfile,self._srcsep,dictionary=self._srcdict,srcindex=True)
+            self._srctext  = srcgrp._srctext
+            self._srcindex = srcgrp._srcindex
+
         if blks is not None:
             self.outblocks = blks
         else:
             self.outblocks = self.keys()
 
-        inmlblock = False
-        var_names = []                   # var processed so far, to avoid duplication
-        var_pend = False                 # var pending for output
-        var_found= None
-
-        # Inner function to process one text line
-        def find_var_one_line():
-
-            nonlocal line
-
-            value    = ''
-            if debug : print(f'\n--- {line}')
-
-            linelist = line.split(',')      ## variable line
-            str_con  = False
+        text  = self._srctext
+        edits = []                       # (start, end, new text)
 
-            for i,element in enumerate(linelist) :
+        for nml_name in self.outblocks:
+            if nml_name not in self._srcindex: continue
 
-                if element == ''           : continue     ## skip empty element
-                if element.startswith('!') : break        ## ignore all following elements
+            nml_block = self[nml_name]
+            endpos, varindex = self._srcindex[nml_name]
 
-                if debug: print(f'\n= {i}: {element}', end='')
+            for var, (spans, orgdata) in varindex.items():
+                if var not in nml_block: continue
 
-                if str_con :                       ## value is still not complete
-                    value += ",%s" % element
-                    if value.endswith("'") :
-                        str_con = False
+                varvalue = nml_block[var]
+                if tuple(tuple(el) if isinstance(el,list) else el for el in varvalue) == orgdata:
                     continue
 
-                element = element.strip()
-
-                if element.find('=') > 0:       ## find a variable
-
-                    [var_new,value] = element.split('=',1)
-                    var_new = var_new.strip()
-
-                    regroups1 = re.match(r'([\w_]+)\s*\([:\d]+\)',var_new)
-                    regroups2 = re.match(r'[:\d]+\)',var_new)
-                    if regroups1 :
-                        var_found = regroups1.group(1).lower()
-                        if var_found not in self[nml_name].keys():
-                            var_found = var_new.lower()
-                    elif regroups2:
-                        pass
-                        # use var_found with last element
-                    else :
-                        var_found = var_new.lower()
-
-                    var_pend = True
-                    if debug : print (f'\n    Found variable "{var_found}"')
-
-                    value = value.strip()
-                    if value.startswith("'") and not value.endswith("'") :  ## string value to be continued
-                        str_con = True
-                else :
-                    regroups = re.match(r'([\w_]+)\s*\([:\d]+',element)
-                    if regroups :       ## handle 2D variable, var(1,
-                        var_found = regroups.group(1).lower()
-                        var_pend = True   ## 2. Found new variable
-                        continue
+                if debug : print(f'    Writing variable "{var} = {varvalue}" ...')
+                if len(spans) == 1 and not isinstance(varvalue[0],list):
+                    _, start, end = spans[0]
+                    edits.append((start,end,varvalue._sep.join(varvalue)))
+                else:                    ## 2D variable or multiple assignments, replace them all
+                    start, _, end = spans[0]
+                    indent = text[text.rfind('\n',0,start)+1:start]
+                    if indent.strip(): indent = ''
+                    newtext = f'\n{indent}'.join(nml_block.item(var).rstrip('\n').split('\n'))
+                    edits.append((start,end,newtext))
+                    for start, _, end in spans[1:]:
+                        linestart = text.rfind('\n',0,start)+1
+                        lineend   = text.find('\n',end)
+                        if lineend < 0: lineend = len(text)
+                        if not text[linestart:start].strip() and not text[end:lineend].strip():
+                            start, end = linestart, lineend+1     ## remove the whole line
+                        edits.append((start,end,''))
 
-                    if element.startswith("'") and not element.endswith("'") :
-                        str_con = True
-
-                if var_pend and var_found not in var_names :
-                                                 ## 1. WRITE previous variable found
-                    if debug : print(f'    Writing variable "{var_found} = {self[nml_name][var_found]}" ...')
-                    #self.writevar(outfhdl,nml_name,var_found)
-                    outfhdl.write(f'  {self[nml_name].item(var_found)}\n')
-                    var_names.append(var_found)
-                    var_pend = False
-            return
-        # end of inner function
-
-        # go throught the namelist file line by line to find variables
-        with open(self._srcfile) as fp:
-            for txtline in fp:
-                line = txtline.strip()
-                if line.startswith('!')  :      ## comment ignore
-                    outfhdl.write(f'{line}\n')   ## just print
-                elif line.startswith('&') and line[1:4] != 'end' :    ## start a namelist block
-                    nml_name = line[1:]
-                    inmlblock = True if nml_name in self.outblocks else False
-                    var_names = []
-                    var_found = None
-                    outfhdl.write(f'{line}\n')        ## print namelist block name
-                elif line.startswith('/') or line[:4] == '&end' :    ## close a namelist block
-                    if var_pend and var_found not in var_names :   ## 2. WRITE at last within namelist block
-                        outfhdl.write(f'  {self[nml_name].item(var_found)}\n')
-                        var_pend = False
-
-                    if forceadd:
-                        set1 = set(self[nml_name].keys())
-                        set1 = set1.difference(set(var_names))
-                        for var_name_in in set1:
-                            outfhdl.write(f'  {self[nml_name].item(var_name_in)}\n')
-
-                    inmlblock = False
-                    outfhdl.write('/\n')
-                else :
-                    if not inmlblock :            ## everything outside a namelist block
-                        outfhdl.write(f'{txtline}')
-                        continue
-
-                    if not line : continue        ## ignore blank lines
+            if forceadd:
+                newvars = ''.join(f'  {nml_block.item(var)}\n' for var in nml_block.keys() if var not in varindex)
+                if newvars: edits.append((endpos,endpos,newvars))
 
-                    find_var_one_line()
+        pos = 0
+        for start, end, newtext in sorted(edits,key=lambda edit: edit[:2]):
+            outfhdl.write(text[pos:start])
+            outfhdl.write(newtext)
+            pos = end
+        outfhdl.write(text[pos:])
 
     #enddef writeToFileWithComments
 
@@ -880,23 +1309,53 @@ class namelistGroup(dict) :
     ########################################################################
     ##
     @classmethod
-    def fromFile(cls,file_name,varsep,debug=False,dictionary=False) :
+    def fromFile(cls,file_name,varsep,debug=False,dictionary=False,strict=False,srcindex=False,cache=False,data=None) :
         '''read and parse a namelist file
 
            note that each variable is a string
            value is also string, but enclosed within a list
            string wrapped within ' and '.
 
+           Each line inside a namelist block is decoded in one pass by the
+           precompiled tokenizer (see _nml_tokenizer), which handles
+
+              o. var = value,
+              o. var(1,2) = value,
+              o. var1 = value1, var2 = value2, .....
+              o. var = 'string, value',    # "," within string
+              o. value1, value2, ...       # to complete earlier line
+              o. var = value   ! comment
+
+           Variable values are decoded lazily, "strict" decodes all values
+           while parsing and issues warnings for invalid values.
+
+           Variable names and value strings are interned, so that many
+           groups parsed from similar files share them in memory.
+
+           With "srcindex", the source text and the location of each
+           variable are kept, so that "writeToFileWithComments" patches
+           the text without reading and decoding the file again.
+
+           With "cache", the group is taken from "nml_cache" when the file
+           was decoded before with the same options (see namelistCache).
+           The returned group is always a copy that can be changed freely.
+
+           "data" is the content of the file when it was read already, as
+           bytes, so that the file is not read again.
+
            return a namelistGroup object
         '''
+        if cache:
+            return nml_cache.load(cls,file_name,varsep,debug,dictionary,strict,srcindex)
+
         nml_grp = cls(file_name)  ## Contain the whole namelist file
 
-        #debug = False
         if dictionary:
             nml_name = 'global'
             nml_block = namelistBlock(name=file_name, separator = varsep)
             inmlblock = True
         else :
+            nml_name = None
             inmlblock = False
 
         if varsep == ':':         # variable and value(s) delimiter
@@ -904,189 +1363,147 @@ class namelistGroup(dict) :
         else:
             valsep = ','
 
-        var_name   = ''          # working array
-        value_list = None        # we are sure one variable is completed only when
-        var_next   = False       # Found next variable name, so current variable is ready to be added
-        var_comment = ''
+        simple_line, tokenize = _nml_tokenizer(varsep)
+        intern = sys.intern
 
-        variables    = {}          # Collect all variables and values for output
+        var_name   = None        # current variable, it is completed when next variable
+        value_list = None        # or the end of the namelist block is found
+        var_span   = None        # [name start, value start, value end] offsets of current variable
+
+        variables    = {}        # Collect all variables and values for output
         varcomments  = {}
+        varspans     = {}        # variable name: list of spans of its assignments
 
         blkcomments = []
+        srclines    = []
+        nextpos     = 0          # offset of next line in the file
 
         # Inner function  add_one_variable
         def add_one_variable():
             '''Added variable/value to the variables dict for current namelist block'''
 
-            nonlocal var_name, value_list
-            nonlocal variables
+            nonlocal var_name, value_list, var_span
 
-            if var_name in variables.keys():
+            if var_name in variables:
                 print(f"WARNING: duplicated variable \"{var_name}\" found, use the last value {value_list}.",file=sys.stderr)
 
-            variables[var_name.lower()]   = value_list
-            varcomments[var_name.lower()] = var_comment
+            variables[var_name] = value_list
+            varcomments.setdefault(var_name,'')
+            if srcindex: varspans.setdefault(var_name,[]).append(tuple(var_span))
             if debug : print(f'\n    adding "{var_name} = {value_list}" to namelist block <{nml_name}>', end='')
 
             # get ready for next variable
-            value_list  = None
+            var_name   = None
+            value_list = None
+            var_span   = None
         # end of inner function add_one_variables
 
-        # Inner function decode_one_line
-        def decode_one_line():
-            '''
-               Decode one source line, this line can be
-                  o. var = value,
-                  o. var(1,2) = value,
-                  o. var1 = value1, var2 = value2, .....
-                  o. var = 'string, value',    # "," within string
-                  o. value1, value2, ...       # to complete earlier line
-
-                Variable inherited from the caller and may be update in this method:
-                    var_name,value_list,var_next     # current variable and status
+        # Inner function  add_block_variables
+        def add_block_variables(endpos):
+            '''Added all variables in current namelist block to "nml_block"
+               and record their source spans in the namelist group
             '''
+            varindex = {}
+            for varname,varval in variables.items():
+                key = nml_block.append(varname, varval,valsep, varcomments[varname],strict)
+                if srcindex:
+                    varindex.setdefault(key,[]).extend(varspans[varname])
 
-            nonlocal line
-            nonlocal var_next, var_name, value_list, var_comment
-
-            var_no   = 0                    ## how many variables contained in one line?
-            var_pre  = ''                   ## prefix for unfinished variable name
-            str_con  = False                ## in case , is within a string
-            multidim = False
-
-            #debug = (nml_name == 'jobname')
-            if debug : print(f'\n\n--- {line}', end='')
-
-            linelist = line.split(valsep)      ## variable line
-
-            # filter out empty elements and comments
-            valid_list = []
-            for i,element in enumerate(linelist):
-                newele = element.strip()
-                if newele == '' or newele == ' ':
-                    continue
-                elif newele.startswith('#') or newele.startswith('!'):
-                    var_comment = valsep.join(linelist[i:])
-                    break
-                else:
-                    valid_list.append(newele)
-
-            # go through each element in this line
-            for i,element in enumerate(valid_list):
-
-                if debug: print(f'\n= {i}: {element}', end='')
-
-                if str_con :                           ## value is still not complete
-                    value += f",{element}"
-                    if value.endswith("'") :
-                        if value_list is None :
-                          value_list = [value]         ## initialize the variable value list
-                        else :
-                          value_list.append(value)
-
-                        str_con = False
-                    if debug: print(f'Appened to value string as: {value}', end='')
-                    continue
-
-                element = element.strip()
-                #if element == '' or element == ' ':  continue           ## skip empty element
-                #if element.startswith('!') or element.startswith('#'):
-                #    var_comment = element
-                #    continue                                            ## skip all following elements
-
-                if element.find(varsep) > 0:         ## find a variable
-                    if var_no > 0 or var_next:       ## Already find a variable before, so save it to "nmlblock"
-                        add_one_variable()
-                        var_next    = False
-
-                    [var_name,value] = element.split(varsep,1)
-                    var_name = var_name.strip()
-                    var_no += 1
-                    var_next = True
-
-                    if var_pre :                    ## prepend "var(1," (decoded early) to "1)" (current)
-                        var_name = var_pre + ',' + var_name
-                        var_pre = ''
-                        multidim = False
-                    if debug: print(f'\n    Found new variable name: {var_name}', end='')
-
-                    value = value.strip()
-                    if element.startswith("'") and not element.endswith("'") :  ## string value to be continued
-                        str_con = True
-                    else:
-                        if value == '':
-                            value_list = []
-                        else:
-                            value_list = [value]      ## initialize the variable value list
-                    if debug: print(f' and value: {value} -> {value_list}')
-                else :                             ## pure value part, or multiple dimension variable names
-                    regroups = re.match(r'[\w_]+\([:\d]+',element)
-                    if regroups :
-                        multidim = True
-                        var_pre  = element            ## handle 2D variable, var(1,
-                        continue
-
-                    regroups = re.match(r'\d+',element)
-                    if regroups and multidim :
-                        var_pre += ','+element
-                    else :
-                        if element.startswith("'") and not element.endswith("'") :
-                            ## string value to be continued
-                            str_con = True
-                            value = element
-                        elif element.startswith('!') or element.startswith('#'):
-                            var_comment += element
-                        else:
-                            value_list.append(element)     ## append variable values
-
-            return
-        # end of inner function decode_one_line
-
+            if srcindex:
+                for key,spans in varindex.items():
+                    orgdata = tuple(tuple(el) if isinstance(el,list) else el for el in nml_block[key].data)
+                    varindex[key] = (tuple(spans), orgdata)
+                nml_grp._srcindex[nml_name] = (endpos,varindex)
+        # end of inner function add_block_variables
 
         # Go through the namelist file line by line
-        with open(file_name) as fp:
+        if data is None:
+            fp = open(file_name)
+        else:
+            import io
+            fp = io.TextIOWrapper(io.BytesIO(data))    # decoded as open() does
+        with fp:
             for txtline in fp:
+                linepos  = nextpos
+                nextpos += len(txtline)
+                if srcindex: srclines.append(txtline)
+
                 line = txtline.strip()
-                if line.startswith('!')  :      ## comment ignore
-                    #pass  ## do nothing at present
+                if not line: continue
+
+                if line[0] == '!'  :            ## comment line
                     blkcomments.append(line)
-                elif line.startswith('&') and line[1:4] != 'end' :    ## start a namelist block
+                elif line[0] == '&' and line[1:4] != 'end' :    ## start a namelist block
                     nml_name = line[1:]
                     blkcommentstr = '\n'.join(blkcomments)
                     nml_block = namelistBlock(name=nml_name, separator = varsep, comment=blkcommentstr )
                     inmlblock = True
                     blkcomments = []
-                elif line.startswith('/') or line[:4] == '&end' :    ## close a namelist block
-                    if var_next:                                     ## process the last variable before close this namelist block
+                elif line[0] == '/' or line[:4] == '&end' :    ## close a namelist block
+                    if var_name is not None:                  ## process the last variable before close this namelist block
                         add_one_variable()
-                        var_next = False
 
-                    for varname,varval in variables.items():
-                        nml_block.append(varname, varval,valsep, varcomments[varname])
+                    add_block_variables(linepos)
 
                     nml_grp[nml_name] = nml_block
                     if debug : print(f'\n+++ adding namelist block <{nml_name}>')
                     inmlblock = False
 
-                    variables = {}         # Clear current namelist block for new one
+                    variables   = {}       # Clear current namelist block for new one
+                    varcomments = {}
+                    varspans    = {}
 
-                else :
-                    if not inmlblock or not line: continue
-                                                    ## ignore everything outside a namelist block
-                                                    ## and blank line inside a namelist block
-                    decode_one_line()
+                elif inmlblock:               ## ignore everything outside a namelist block
+                    if debug : print(f'\n\n--- {line}', end='')
+
+                    offset = linepos + len(txtline) - len(txtline.lstrip())   ## offset of "line" in the file
+
+                    simple = simple_line(line)
+                    if simple:                    ## fast path, "var = value," only
+                        if var_name is not None:
+                            add_one_variable()
+                        var_name, value = simple.groups()
+                        var_name   = intern(var_name.lower())
+                        value_list = [intern(value)]
+                        var_span   = [offset+simple.start(1), offset+simple.start(2), offset+simple.end(2)]
+                        continue
+
+                    line_var = None
+                    for token in tokenize(line):
+                        kind = token.lastgroup
+                        if kind == 'name':                ## find a variable
+                            if var_name is not None:
+                                add_one_variable()
+                            var_name   = intern(''.join(token.group(kind).split()).lower())
+                            value_list = []
+                            var_span   = [offset+token.start(), None, offset+token.end()]
+                            line_var   = var_name
+                            if debug: print(f'\n    Found new variable name: {var_name}', end='')
+                        elif kind == 'comment':
+                            if line_var is not None:
+                                varcomments[line_var] = token.group(kind)
+                            break
+                        elif value_list is not None:      ## string or bare value
+                            value_list.append(intern(token.group(kind)))
+                            if var_span[1] is None:
+                                var_span[1] = offset+token.start()
+                            var_span[2] = offset+token.end()
+                        else:
+                            print(f'WARNING: value "{token.group(kind)}" without a variable in namelist block <{nml_name}>. Ignored.',file=sys.stderr)
 
         if dictionary :    ## contain only var = value pairs
-            if var_next:
+            if var_name is not None:
                 add_one_variable()
-                var_next    = False
 
-            for varname,varval in variables.items():
-                nml_block.append(varname, varval, valsep, varcomments[varname])
-                if debug : print(f'\n+++ adding "{varname} = {varval}" from a dictionay.',end='')
+            add_block_variables(nextpos)
+            if debug : print(f'\n+++ adding {len(variables)} variables from a dictionay.',end='')
 
             nml_grp[nml_name] = nml_block
 
+        nml_grp._srcsep  = varsep
+        nml_grp._srcdict = dictionary
+        if srcindex: nml_grp._srctext = ''.join(srclines)
+
         return nml_grp
     #enddef
 
@@ -1094,10 +1511,166 @@ class namelistGroup(dict) :
 
 ##%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
 
+class namelistCache:
+    '''
+    Cache of decoded namelist files, used by namelistGroup.fromFile(..., cache=True)
+
+    Entries are kept in memory in LRU order (at most "maxsize" files) and,
+    if "cachedir" is set, also pickled on disk to be shared between
+    processes. An entry is valid when the file path and decoding options
+    are the same and either the stamp (modification time, size, inode and
+    change time), or the content hash are the same. A file changed within
+    "granularity" seconds has no stamp and is always hashed, because it
+    may change again without changing its modification time.
+
+    Every hit returns a clone of the cached group, so that changes made
+    by the caller never reach the cache.
+
+    stats() returns the counters:
+      hits       : groups returned from memory
+      disk_hits  : groups loaded from the disk cache
+      misses     : files decoded
+      bytes_read : bytes of the files decoded
+      bytes_saved: bytes of the files not decoded because of a hit
+    '''
+
+    granularity = 2.0      # seconds, the modification time resolution of FAT is 2 s
+
+    def __init__(self,maxsize=32,cachedir=None) :
+        self.maxsize  = maxsize
+        self.cachedir = cachedir
+        self._entries = OrderedDict()    # key: (stamp, size, digest, namelistGroup)
+        self.clear_stats()
+    #enddef
+
+    ######################################################################
+
+    def clear(self):
+        ''' Remove all entries in memory, the disk cache is kept'''
+        self._entries.clear()
+
+    def clear_stats(self):
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'bytes_read': 0, 'bytes_saved': 0}
+
+    def stats(self):
+        ''' Return a copy of the counters and the number of entries in memory'''
+        stats = dict(self._stats)
+        stats['entries'] = len(self._entries)
+        return stats
+
+    ######################################################################
+
+    def load(self,cls,file_name,varsep,debug=False,dictionary=False,strict=False,srcindex=False):
+        ''' Return a clone of the cached namelistGroup of "file_name",
+            decode the file with cls.fromFile if it is not in the cache.
+        '''
+        import hashlib
+
+        key = (os.path.abspath(file_name), varsep, dictionary, strict, srcindex)
+
+        entry = self._entries.get(key)
+        stamp = self._stamp(os.stat(file_name))
+        if entry is not None and stamp is not None and entry[0] == stamp:
+            return self._hit(key,entry,'hits')
+
+        with open(file_name,'rb') as fp:
+            stamp = self._stamp(os.fstat(fp.fileno()))
+            data  = fp.read()
+        digest = hashlib.sha1(data).hexdigest()
+
+        if entry is not None and entry[2] == digest:     ## touched only
+            entry = (stamp, len(data)) + entry[2:]
+            self._entries[key] = entry
+            return self._hit(key,entry,'hits')
+
+        diskfile = None
+        if self.cachedir:
+            diskfile = os.path.join(self.cachedir, hashlib.sha1(repr(key).encode()).hexdigest()+'.pkl')
+            entry = self._read_disk(diskfile,digest)
+            if entry is not None:
+                entry = (stamp, len(data)) + entry[2:]
+                return self._hit(key,entry,'disk_hits')
+
+        nmlgrp = cls.fromFile(file_name,varsep,debug,dictionary,strict,srcindex,data=data)
+        self._stats['misses']     += 1
+        self._stats['bytes_read'] += len(data)
+
+        entry = (stamp, len(data), digest, nmlgrp)
+        self._store(key,entry)
+        if diskfile: self._write_disk(diskfile,entry)
+
+        return nmlgrp.clone()
+    #enddef load
+
+    ######################################################################
+
+    def _stamp(self,fstat):
+        ''' Return the stamp of a file from its stat, or None when the file
+            was changed within "granularity" seconds, since another change in
+            the same clock tick would not change the stamp.
+        '''
+        if time.time()*1e9-fstat.st_mtime_ns < self.granularity*1e9:
+            return None
+        return (fstat.st_mtime_ns, fstat.st_size, fstat.st_ino, fstat.st_ctime_ns)
+
+    def _hit(self,key,entry,counter):
+        self._stats[counter]       += 1
+        self._stats['bytes_saved'] += entry[1]
+        self._store(key,entry)
+        return entry[3].clone()
+
+    def _store(self,key,entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    ######################################################################
+
+    @staticmethod
+    def _read_disk(diskfile,digest):
+        ''' Return the entry in "diskfile" if its content hash is "digest"'''
+        import pickle
+        try:
+            with open(diskfile,'rb') as fp:
+                entry = pickle.load(fp)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+
+        if entry[2] != digest: return None
+        return entry
+
+    @staticmethod
+    def _write_disk(diskfile,entry):
+        ''' Write "entry" to "diskfile" atomically, ignore any error'''
+        import pickle, tempfile
+        try:
+            os.makedirs(os.path.dirname(diskfile),exist_ok=True)
+            with tempfile.NamedTemporaryFile('wb',dir=os.path.dirname(diskfile),delete=False) as fp:
+                pickle.dump(entry,fp,pickle.HIGHEST_PROTOCOL)
+            os.replace(fp.name,diskfile)
+        except OSError as oserr:
+            print(f'WARNING: cannot write cache file {diskfile}: {oserr}',file=sys.stderr)
+
+#endclass
+
+nml_cache = namelistCache(cachedir=os.environ.get('NAMELIST_CACHE_DIR'))
+
+##%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
 class namelistCMPGroup(dict) :
+    '''
+    Comparison of two namelist groups.
+
+    With "tolerance" (semantic comparison), values that are not equal are
+    compared element by element (see VariableValue.diff_elements), numbers
+    with relative tolerance "tolerance", and only the elements that differ
+    are reported for arrays.
+    '''
 
-    def __init__(self,nmlgrpL,nmlgrpR,strict=False) :
+    def __init__(self,nmlgrpL,nmlgrpR,strict=False,tolerance=None) :
       dict.__init__(self)
+      self.tolerance = tolerance
       self.__setitem__('namelistL',[])
       self.__setitem__('namelistR',[])
       self.__setitem__('namelistC',{})
@@ -1116,6 +1689,16 @@ class namelistCMPGroup(dict) :
         self['namelistR'].extend(set1)
 
       for nml_name in setC :  ## loop over all common namelist blocks
+        self['namelistC'][nml_name] = self.compare_blocks(nmlgrpL[nml_name],nmlgrpR[nml_name],strict,tolerance)
+    #enddef
+
+    ######################################################################
+
+    @staticmethod
+    def compare_blocks(nmlL,nmlR,strict=False,tolerance=None) :
+        ''' Compare two namelist blocks, return {'varL': [...], 'varR': [...], 'varC': [...], 'varS': [...]},
+            the variables only in left, only in right, different and the same
+        '''
 
         nmlC = { 'varL': [],
                  'varR': [],
@@ -1123,8 +1706,9 @@ class namelistCMPGroup(dict) :
                  'varS': []
                 }
 
-        nmlL = nmlgrpL[nml_name]
-        nmlR = nmlgrpR[nml_name]
+        if nmlL.cmpkeys(strict) == nmlR.cmpkeys(strict):
+            nmlC['varS'].extend(nmlL.keys())     ## identical blocks, no need to check each variable
+            return nmlC
 
         varL = set(nmlL.keys())
         varR = set(nmlR.keys())
@@ -1145,16 +1729,126 @@ class namelistCMPGroup(dict) :
             valueR = nmlR[var]
             if valueL.isequal(valueR,strict):
                 nmlC['varS'].append(var)
+            elif tolerance is not None and not strict and not valueL.diff_elements(valueR,tolerance):
+                nmlC['varS'].append(var)
             else :
                 nmlC['varC'].append(var)
 
-        self['namelistC'][nml_name] = nmlC
+        return nmlC
+    #enddef
+
+    ######################################################################
+
+    @classmethod
+    def records(cls,grp1,grp2,strict=False,nmlblknames=None,tolerance=None) :
+        ''' Yield the differences as dict records, one block is compared at a time,
+            so that the records are available as soon as the block is compared.
+
+            {"type": "block", "side": "left"|"right", "block": name}              block only in one file
+            {"type": "only", "side": "left"|"right", "block": name, "var": var,
+             "value": text, "typed": value}                                       variable only in one file
+            {"type": "changed", "block": name, "var": var, "left": text, "right": text,
+             "left_typed": value, "right_typed": value}                           variable with different values
+            {"type": "summary", "left": file, "right": file, "blocks": n, "identical_blocks": n,
+             "changed": n, "left_only": n, "right_only": n, "left_blocks": n, "right_blocks": n}
+
+            "typed" values are the decoded values (see VariableValue.value), None if not valid.
+            With "tolerance", "changed" records of arrays contain also the elements that differ,
+            "elements": [{"index": [i, j], "left": value, "right": value}, ...]
+        '''
+
+        def typed(varvalue):
+            try:
+                return varvalue.value
+            except (TypeError, ValueError):
+                return None
+
+        def only(side,nml_name,var,varvalue):
+            return {'type': 'only', 'side': side, 'block': nml_name, 'var': var,
+                    'value': str(varvalue), 'typed': typed(varvalue)}
+
+        counts = {'blocks': 0, 'identical_blocks': 0, 'changed': 0, 'left_only': 0, 'right_only': 0,
+                  'left_blocks': 0, 'right_blocks': 0}
+
+        blknamesL = [nml for nml in grp1.keys() if nmlblknames is None or nml in nmlblknames]
+        blknamesR = [nml for nml in grp2.keys() if nmlblknames is None or nml in nmlblknames]
+
+        for nml_name in blknamesL:
+            if nml_name not in grp2:
+                counts['left_blocks'] += 1
+                yield {'type': 'block', 'side': 'left', 'block': nml_name}
+                continue
+
+            nmlL = grp1[nml_name]
+            nmlR = grp2[nml_name]
+            nmlC = cls.compare_blocks(nmlL,nmlR,strict,tolerance)
+            counts['blocks'] += 1
+            if not (nmlC['varL'] or nmlC['varR'] or nmlC['varC']):
+                counts['identical_blocks'] += 1
+                continue
+
+            varC = set(nmlC['varC'])
+            for var in nmlL.keys():              # variable order in the base file
+                if var in varC:
+                    counts['changed'] += 1
+                    record = {'type': 'changed', 'block': nml_name, 'var': var,
+                              'left':  str(nmlL[var]), 'right': str(nmlR[var]),
+                              'left_typed': typed(nmlL[var]), 'right_typed': typed(nmlR[var])}
+                    if tolerance is not None and cls.isarray(nmlL[var],nmlR[var]):
+                        record['elements'] = [{'index': list(index), 'left': el1, 'right': el2}
+                                              for index,el1,el2 in nmlL[var].diff_elements(nmlR[var],tolerance)]
+                    yield record
+
+            varL = set(nmlC['varL'])
+            for var in nmlL.keys():
+                if var in varL:
+                    counts['left_only'] += 1
+                    yield only('left',nml_name,var,nmlL[var])
+
+            varR = set(nmlC['varR'])
+            for var in nmlR.keys():
+                if var in varR:
+                    counts['right_only'] += 1
+                    yield only('right',nml_name,var,nmlR[var])
+
+        for nml_name in blknamesR:
+            if nml_name not in grp1:
+                counts['right_blocks'] += 1
+                yield {'type': 'block', 'side': 'right', 'block': nml_name}
+
+        yield {'type': 'summary', 'left': grp1._srcfile, 'right': grp2._srcfile, **counts}
+    #enddef
+
+    ######################################################################
+
+    @staticmethod
+    def output_records(ofile,records,fmt='ndjson') :
+        ''' Write "records" to "ofile" as they come, one JSON object per line for "ndjson",
+            or a JSON array with one record per line for "json"
+        '''
+        import json
+
+        def default(value):                      # e.g. complex values
+            return str(value)
+
+        if fmt == 'json':
+            sep = '['
+            for record in records:
+                ofile.write(sep+json.dumps(record,default=default))
+                ofile.flush()
+                sep = ',\n '
+            ofile.write(']\n' if sep != '[' else '[]\n')
+        else:
+            for record in records:
+                ofile.write(json.dumps(record,default=default)+'\n')
+                ofile.flush()
     #enddef
 
     ######################################################################
 
     def output(self,ofile,grp1,grp2,nmlblknames=None,color=True) :
         ''' Print the comparison results '''
+        from itertools import zip_longest
 
         if color :
             cprint = self.colorprint
@@ -1164,7 +1858,7 @@ class namelistCMPGroup(dict) :
         left  = cprint("left ",'magenta')
         right = cprint("right",'cyan')
 
-        print(' ')
+        print(' ', file = ofile)
         print('='*100, file = ofile)
         leftstr  = f"{left} : {grp1._srcfile}"
         rightstr = f"{right} : {grp2._srcfile}"
@@ -1231,7 +1925,14 @@ class namelistCMPGroup(dict) :
                 if len(nmlC['varC']) > 0:              ## these are the command variables that have difference
                     #for var in nmlC['varC']:    # to keep variable order in the base file
                     for var in grp1[nml].keys():
-                        if var in nmlC['varC']:
+                        if var in nmlC['varC'] and self.tolerance is not None and self.isarray(grp1[nml][var],grp2[nml][var]):
+                            for index,el1,el2 in grp1[nml][var].diff_elements(grp2[nml][var],self.tolerance):
+                                varidx   = f"{var}({','.join(str(i) for i in index)})"
+                                ioffset  = len(varidx)-14 if len(varidx)>14 else 0
+                                strleft  = cprint(self.element_str(el1),'magenta',38-ioffset)
+                                strright = cprint(self.element_str(el2),'cyan',38)
+                                print(f'  {varidx.ljust(14)} {grp1[nml]._sep} {strleft} ; {strright}', file = ofile)
+                        elif var in nmlC['varC']:
                             valleft  = str(grp1[nml][var])
                             valright = str(grp2[nml][var])
                             if len(valleft) < 40 and len(valright) < 40:
@@ -1251,6 +1952,24 @@ class namelistCMPGroup(dict) :
 
     ##====================================================================
 
+    @staticmethod
+    def isarray(valueL,valueR):
+        ''' Whether either value has more than one element or is 2D '''
+        shapeL, elementsL = valueL.array
+        shapeR, elementsR = valueR.array
+        return len(shapeL) > 1 or len(shapeR) > 1 or len(elementsL) > 1 or len(elementsR) > 1
+
+    @staticmethod
+    def element_str(element):
+        ''' Format an element from VariableValue.diff_elements '''
+        if element is None:
+            return '-'
+        if isinstance(element,bool):
+            return '.true.' if element else '.false.'
+        return str(element)
+
+    ##====================================================================
+
     @staticmethod
     def colorprint(field, color = 'white',length=None, ):
       """Return the 'field' in collored terminal form"""
@@ -1296,44 +2015,799 @@ class namelistCMPGroup(dict) :
 
 #endclass
 
+##%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+class namelistTemplate:
+    '''
+    A run-time file template with place holders, e.g. input.nml, model_configure
+    or diag_table in a run directory template.
+
+    The template is read and decoded only once, each "render" fills the place
+    holders and writes one output file, so that many member or date
+    directories are generated from one parse of the template. With
+    "cache", the decoded template is taken from "nml_cache".
+
+    Formats:
+      namelist : Fortran namelist file, place holders in values are replaced,
+                 comments and format are kept (see writeToFileWithComments)
+      config   : ESMF configuration file (":" separator), as namelist
+      text     : any other text file, all place holders are replaced
+    '''
+
+    formats = ('namelist', 'config', 'text')
+
+    def __init__(self,filename,fmt=None,cache=False) :
+        self.filename = filename
+        self.format   = fmt if fmt is not None else self.guess_format(filename)
+
+        if self.format not in self.formats:
+            raise ValueError(f'Unknown template format "{self.format}" for file <{filename}>.')
+
+        if self.format == 'text':
+            with open(filename,'r') as fhdl:
+                self.text = fhdl.read()
+            self.nmlgrp = None
+        else:
+            varsep = ':' if self.format == 'config' else '='
+            self.text   = None
+            self.nmlgrp = namelistGroup.fromFile(filename,varsep,dictionary=(varsep == ':'),srcindex=True,cache=cache)
+
+        ## variables with place holders, checked by "render" with "strict"
+        self.holders = self.place_holders(self.nmlgrp) if self.nmlgrp is not None else {}
+    #enddef
+
+    ######################################################################
+
+    @staticmethod
+    def guess_format(filename):
+        ''' Guess template format from the file name '''
+
+        basename = os.path.basename(filename)
+        if basename.startswith(('model_configure','nems.configure')):
+            return 'config'
+        elif basename.startswith(('diag_table','field_table','data_table')):
+            return 'text'
+        return 'namelist'
+
+    ######################################################################
+
+    @staticmethod
+    def place_holders(nmlgrp,varnames=None):
+        ''' Return {(block, var): set of place holders} of "nmlgrp", only
+            the variables in "varnames" if it is given.
+
+            A place holder is a bare word in capitals that can not be
+            decoded as a value, e.g. NPX or LAYOUTX. Place holders within
+            quoted strings are not found.
+        '''
+
+        if varnames is None:
+            varnames = [(_nml_name,var) for _nml_name in nmlgrp.keys() for var in nmlgrp[_nml_name].keys()]
+
+        holders = {}
+        for _nml_name,var in varnames:
+            for el in nmlgrp[_nml_name][var]:
+                for el1 in (el if isinstance(el,list) else [el]):
+                    if _holder_re.match(el1) and not VariableValue.isbool(el1):
+                        holders.setdefault((_nml_name,var),set()).add(el1)
+        return holders
+
+    ######################################################################
+
+    def render(self,outfile,values,variables=None,strict=False):
+        '''
+        Write the template to "outfile" (file name or file-like object)
+
+        "values"    : {place holder: value}
+        "variables" : variable values to be set after the place holders are
+                      replaced, {var: value} or {block: {var: value}} for
+                      namelist, {var: value} for config. It is ignored for text.
+        "strict"    : raise ValueError for a variable not in the template or
+                      a place holder left in the output (see place_holders),
+                      instead of a warning. Nothing is written then.
+        '''
+
+        outname = outfile if isinstance(outfile, str) else self.filename
+        if self.format == 'text':
+            text = self.text
+            if values:
+                replace = {key: str(value) for key,value in values.items()}
+                pattern = re.compile('|'.join(re.escape(key) for key in sorted(replace,key=len,reverse=True)))
+                text = pattern.sub(lambda match: replace[match.group(0)],text)
+            if variables:
+                if strict:
+                    raise ValueError(f'variables {",".join(variables)} for text template <{self.filename}>.')
+                sys.stderr.write(f'WARNING: variables for text template <{self.filename}> ignored.\n')
+        else:
+            nmlgrp = self.nmlgrp.clone()
+            nmlgrp.substitute(values)
+            if variables:
+                blkvars  = {key: value for key,value in variables.items() if isinstance(value,dict)}
+                flatvars = {key: value for key,value in variables.items() if not isinstance(value,dict)}
+                if strict:
+                    unknown  = [var for var in flatvars if nmlgrp.findblock(var) is None]
+                    unknown += [f'{blkname}.{var}' for blkname,blkdict in blkvars.items()
+                                for var in blkdict if var not in nmlgrp.get(blkname,())]
+                    if unknown:
+                        raise ValueError(f'unknown variables {",".join(unknown)} for <{outname}> from template <{self.filename}>.')
+                if blkvars:  nmlgrp.merge2dict(blkvars)
+                if flatvars: nmlgrp.merge1dict(flatvars)
+            if strict and self.holders:
+                left = set()
+                for words in self.place_holders(nmlgrp,self.holders).values():
+                    left.update(words)
+                left.difference_update(values or ())     ## replaced by itself
+                if left:
+                    raise ValueError(f'place holders {",".join(sorted(left))} are not replaced in <{outname}>.')
+
+        if isinstance(outfile, str):
+            with open(outfile,'w') as outhdl:
+                if self.format == 'text': outhdl.write(text)
+                else:                     nmlgrp.writeToFileWithComments(outhdl)
+        else:
+            if self.format == 'text': outfile.write(text)
+            else:                     nmlgrp.writeToFileWithComments(outfile)
+    #enddef render
+
+#endclass
+
+##======================================================================
+## Render run directories from templates
+##======================================================================
+def render_templates(spec,debug=False,cache=False):
+    '''Render templates into a set of run directories in one pass
+
+       "spec" is a dict (e.g. decoded from a JSON file) like
+
+         {"templates": {"input.nml":       "run_templates_EMC/input.nml_NSSL",
+                        "model_configure": {"file": "run_templates_EMC/model_configure_NSSL",
+                                            "format": "config",
+                                            "values": {"NPES": 600}},
+                        "diag_table":      "run_templates_EMC/diag_table"},
+          "values":    {"LAYOUTX": 20, "LAYOUTY": 30, "YYYY": 2022},
+          "variables": {"input.nml": {"fv_core_nml": {"k_split": 2}}},
+          "runs":      [{"dir": "mem01", "values": {"GRIDNO": "C3359"}},
+                        {"dir": "mem02", "values": {"GRIDNO": "C3359"},
+                         "variables": {"model_configure": {"nhours_fcst": 6}}}]
+         }
+
+       The place holder values are merged in order: "values" at top level,
+       "values" of the template and "values" of each run. "variables" are
+       keyed by the output file name. Without "runs", the files are written
+       to the current directory.
+
+       Each template is decoded only once for all runs.
+       Return the list of files written.
+    '''
+
+    templates = {}
+    for outname,tmpl in spec['templates'].items():
+        if isinstance(tmpl,str):
+            tmpl = {'file': tmpl}
+        templates[outname] = (namelistTemplate(tmpl['file'],tmpl.get('format'),cache), tmpl.get('values',{}))
+
+    outfiles = []
+    for run in spec.get('runs',[{'dir': '.'}]):
+        rundir = run.get('dir','.')
+        os.makedirs(rundir,exist_ok=True)
+        for outname,(template,tmplvalues) in templates.items():
+            values = dict(spec.get('values',{}))
+            values.update(tmplvalues)
+            values.update(run.get('values',{}))
+            variables = dict(spec.get('variables',{}).get(outname,{}))
+            variables.update(run.get('variables',{}).get(outname,{}))
+
+            outfile = os.path.join(rundir,outname)
+            if debug: print(f'Rendering {template.filename} -> {outfile} ...',file=sys.stderr)
+            template.render(outfile,values,variables)
+            outfiles.append(outfile)
+
+    return outfiles
+#enddef render_templates
+
+##======================================================================
+## Render many members from one template with a process pool
+##======================================================================
+
+_batch_template = None                  # template in each worker process
+
+def _batch_init(template):
+    global _batch_template
+    _batch_template = template
+
+def _batch_render(job):
+    outfile, values, variables = job
+    btime = time.perf_counter()
+    os.makedirs(os.path.dirname(outfile) or '.',exist_ok=True)
+    _batch_template.render(outfile,values,variables,strict=True)
+    return (outfile, time.perf_counter()-btime)
+
+##----------------------------------------------------------------------
+
+def _decode_cell(text):
+    ''' Decode a table cell to Python value, "1,2" is a list '''
+
+    def decode1(eltext):
+        eltext = eltext.strip()
+        try:
+            return VariableValue.unpack(eltext)
+        except TypeError:               ## bare word, take it as a string
+            return eltext
+
+    if ',' in text and "'" not in text and '"' not in text:
+        return [decode1(el) for el in text.split(',')]
+    return decode1(text)
+
+##----------------------------------------------------------------------
+
+def read_batch_table(filename):
+    '''Read the per-member overrides for "render_batch"
+
+       JSON: a list of runs (or {"runs": [...]}), each run is
+             {"dir": ..., "values": {...}, "variables": {...}}
+             as in "render_templates".
+
+       CSV:  one run per row, the column "dir" is the output directory,
+             "$KEY"      columns are place holder values,
+             "block.var" columns are variables in namelist block "block",
+             other columns are variables to be merged by name.
+
+       Return a list of runs.
+    '''
+
+    import json, csv
+
+    with open(filename,'r',newline='') as fhdl:
+        text = fhdl.read()
+
+    if text.lstrip().startswith(('[','{')):
+        runs = json.loads(text)
+        if isinstance(runs,dict):
+            runs = runs['runs']
+        return runs
+
+    runs = []
+    for row in csv.DictReader(text.splitlines()):
+        run = {'dir': row.pop('dir','.') or '.', 'values': {}, 'variables': {}}
+        for column,cell in row.items():
+            if column is None or cell is None or cell == '':
+                continue
+            column = column.strip()
+            if column.startswith('$'):
+                run['values'][column[1:]] = cell
+            elif '.' in column:
+                blkname, var = column.split('.',1)
+                run['variables'].setdefault(blkname,{})[var] = _decode_cell(cell)
+            else:
+                run['variables'][column] = _decode_cell(cell)
+        runs.append(run)
+
+    return runs
+#enddef read_batch_table
+
+##----------------------------------------------------------------------
+
+def render_batch(template,runs,outname,values=None,jobs=None):
+    '''Render "template" (a namelistTemplate) once for each run in "runs"
+
+       Each run writes "outname" in its directory "dir", with the place
+       holder "values" updated by the run values and the run "variables"
+       merged (see namelistTemplate.render). A variable not in the
+       template or a place holder left in a file raises ValueError.
+
+       The template is decoded only once and passed to each worker process
+       once, the runs are distributed over "jobs" processes (default is
+       the number of CPUs, 1 renders in this process).
+
+       Return a list of (file written, seconds used), in the order of runs.
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+
+    jobs_list = []
+    for run in runs:
+        runvalues = dict(values or {})
+        runvalues.update(run.get('values',{}))
+        outfile = os.path.join(run.get('dir','.'),outname)
+        jobs_list.append((outfile,runvalues,run.get('variables',{})))
+
+    if jobs is None: jobs = os.cpu_count() or 1
+    jobs = min(jobs,len(jobs_list))
+
+    if jobs <= 1:
+        _batch_init(template)
+        return [_batch_render(job) for job in jobs_list]
+
+    chunksize = max(1,len(jobs_list)//(jobs*4))
+    with ProcessPoolExecutor(max_workers=jobs,initializer=_batch_init,initargs=(template,)) as executor:
+        return list(executor.map(_batch_render,jobs_list,chunksize=chunksize))
+#enddef render_batch
+
+##%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%%
+
+class namelistCMPMatrix:
+    '''
+    Compare N namelist groups at once.
+
+    Each group is visited only once. Each variable value is mapped to a
+    value ID, the index of its distinct value among all files (see
+    VariableValue.cmpkey), so that
+
+      table  : {block: {var: [value ID of each file, None if missing]}}
+      values : {block: {var: [distinct VariableValue for each value ID]}}
+
+    and a variable differs when its ID list contains more than one ID or
+    None. The cost grows linearly with the number of files, instead of
+    comparing each pair of files.
+    '''
+
+    def __init__(self,nmlgrps,strict=False) :
+        self.groups = nmlgrps
+        self.table  = {}
+        self.values = {}
+        self.seps   = {}                # variable separator of each block
+
+        nfiles = len(nmlgrps)
+        for ifile,nmlgrp in enumerate(nmlgrps):
+            for nml_name in nmlgrp.keys():
+                blktable  = self.table.setdefault(nml_name,{})
+                blkvalues = self.values.setdefault(nml_name,{})
+                self.seps.setdefault(nml_name,nmlgrp[nml_name]._sep)
+                for var,varvalue in nmlgrp[nml_name].items():
+                    if var not in blktable:
+                        blktable[var]  = [None]*nfiles
+                        blkvalues[var] = ({},[])
+                    valueids, distinct = blkvalues[var]
+                    key = varvalue.cmpkey(strict)
+                    if key not in valueids:
+                        valueids[key] = len(distinct)
+                        distinct.append(varvalue)
+                    blktable[var][ifile] = valueids[key]
+
+        for blkvalues in self.values.values():        ## drop the key maps
+            for var,(valueids,distinct) in blkvalues.items():
+                blkvalues[var] = distinct
+    #enddef
+
+    ######################################################################
+
+    def differences(self,nmlblknames=None):
+        ''' Generate (block, var, value IDs, distinct values) of the
+            variables that differ among the files, or missing in some files
+        '''
+
+        for nml_name in (self.table.keys() if nmlblknames is None else nmlblknames):
+            if nml_name not in self.table: continue
+            blkvalues = self.values[nml_name]
+            for var,ids in self.table[nml_name].items():
+                if len(blkvalues[var]) > 1 or None in ids:
+                    yield (nml_name, var, ids, blkvalues[var])
+
+    ######################################################################
+
+    def output(self,ofile,nmlblknames=None,color=True) :
+        ''' Print the comparison matrix, one column for each file and one
+            row for each variable that differs. The distinct values are
+            labeled by letters, "-" is missing.
+        '''
+
+        cprint = namelistCMPGroup.colorprint if color else namelistCMPGroup.nprint
+        labels = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+        colors = ['magenta','cyan','green','blue','red','white']
+
+        def label(valueid):
+            if valueid is None: return '-'
+            if valueid < len(labels): return labels[valueid]
+            return '*'
+
+        nfiles = len(self.groups)
+        print('='*100, file = ofile)
+        for ifile,nmlgrp in enumerate(self.groups):
+            print(f"  {ifile:>4} : {nmlgrp._srcfile}", file = ofile)
+        print('#'*100, file = ofile)
+
+        blkmissing = [(nml_name,[i for i,nmlgrp in enumerate(self.groups) if nml_name not in nmlgrp])
+                      for nml_name in self.table.keys()]
+        for nml_name,files in blkmissing:
+            if files:
+                print(f"  ++++ namelist {cprint(nml_name,'red')} missing in file(s) {','.join(map(str,files))}", file = ofile)
+
+        header = ''.join(str(ifile%10) for ifile in range(nfiles))
+        lastblk = None
+        for nml_name, var, ids, distinct in self.differences(nmlblknames):
+            if nml_name != lastblk:
+                if lastblk is not None and self.seps[lastblk] != ':':
+                    print(cprint('/','yellow'), file = ofile)
+                if self.seps[nml_name] != ':':
+                    print(f"\n&{cprint(nml_name,'yellow')}", file = ofile)
+                print(f"  {' ':<24} {header}", file = ofile)
+                lastblk = nml_name
+
+            row = ''.join('-' if i is None else cprint(label(i),colors[i%len(colors)]) for i in ids)
+            print(f"  {var:<24} {row}", file = ofile)
+            for valueid,varvalue in enumerate(distinct):
+                files = ','.join(str(ifile) for ifile,i in enumerate(ids) if i == valueid)
+                print(f"  {' ':<24}   {label(valueid)} = {varvalue}  [{files}]", file = ofile)
+
+        if lastblk is not None and self.seps[lastblk] != ':':
+            print(cprint('/','yellow'), file = ofile)
+    #enddef
+
+#endclass
+
+##======================================================================
+## Compare two run directories
+##======================================================================
+
+_TREE_FILE_PATTERNS = ('input.nml*', '*.nml', 'model_configure*', 'nems.configure*',
+                       'diag_table*', 'data_table*', 'field_table*')
+
+_tree_skip_re = re.compile(r'\.bak\d*$|\.bakidx$')      # backups of --inline
+
+def find_config_files(topdir):
+    ''' Return the sorted relative paths of the configuration files under "topdir" '''
+    import fnmatch
+
+    relpaths = []
+    for dirpath, dirnames, filenames in os.walk(topdir):
+        dirnames.sort()
+        for filename in filenames:
+            if _tree_skip_re.search(filename): continue
+            if any(fnmatch.fnmatch(filename,pattern) for pattern in _TREE_FILE_PATTERNS):
+                relpaths.append(os.path.relpath(os.path.join(dirpath,filename),topdir))
+    return sorted(relpaths)
+#enddef find_config_files
+
+##----------------------------------------------------------------------
+
+def _same_file_contents(file1,file2):
+    ''' Cheap check of identical files, sizes first and content hashes only for the same sizes '''
+    import hashlib
+
+    if os.path.getsize(file1) != os.path.getsize(file2):
+        return False
+
+    digests = []
+    for filename in (file1, file2):
+        with open(filename,'rb') as fp:
+            digests.append(hashlib.sha1(fp.read()).digest())
+    return digests[0] == digests[1]
+#enddef _same_file_contents
+
+##----------------------------------------------------------------------
+
+def _tree_diff_file(job):
+    ''' Compare one pair of files for "diff_trees" in a worker process
+
+        Return (relpath, equal, text or records)
+    '''
+    relpath, file1, file2, strict, tolerance, nmlblknames, fmt, color = job
+
+    fileformat = namelistTemplate.guess_format(file1)
+    if fileformat == 'text':
+        import difflib
+        with open(file1,'r') as fhdl: lines1 = fhdl.readlines()
+        with open(file2,'r') as fhdl: lines2 = fhdl.readlines()
+        difflines = list(difflib.unified_diff(lines1,lines2,file1,file2))
+        if fmt != 'text':
+            return (relpath, not difflines, [{'type': 'text', 'file': relpath, 'diff': difflines}] if difflines else [])
+        return (relpath, not difflines, ''.join(difflines))
+
+    varsep  = ':' if fileformat == 'config' else '='
+    dictfmt = fileformat == 'config'
+    nmlgrp1 = namelistGroup.fromFile(file1,varsep,dictionary=dictfmt)
+    nmlgrp2 = namelistGroup.fromFile(file2,varsep,dictionary=dictfmt)
+
+    if fmt != 'text':
+        records = []
+        for record in namelistCMPGroup.records(nmlgrp1,nmlgrp2,strict,nmlblknames,tolerance):
+            record['file'] = relpath
+            records.append(record)
+        return (relpath, len(records) == 1, records[:-1] if len(records) == 1 else records)
+
+    nmlcmp = namelistCMPGroup(nmlgrp1,nmlgrp2,strict,tolerance)
+    equal  = not (nmlcmp['namelistL'] or nmlcmp['namelistR'] or
+                  any(nmlC['varL'] or nmlC['varR'] or nmlC['varC'] for nml_name,nmlC in nmlcmp['namelistC'].items()
+                      if nmlblknames is None or nml_name in nmlblknames))
+    if equal: return (relpath, True, '')
+
+    import io
+    outhdl = io.StringIO()
+    nmlcmp.output(outhdl,nmlgrp1,nmlgrp2,nmlblknames,color)
+    return (relpath, False, outhdl.getvalue())
+#enddef _tree_diff_file
+
+##----------------------------------------------------------------------
+
+def diff_trees(dir1,dir2,ofile,strict=False,tolerance=None,nmlblknames=None,fmt='text',color=True,jobs=None):
+    '''Compare the configuration files (see _TREE_FILE_PATTERNS) in two directory trees
+
+       Byte-identical files are skipped after a size and a content hash check,
+       the other files are decoded and compared (namelist blocks "nmlblknames"
+       only, if given) in "jobs" worker processes
+       (default is the number of CPUs), with separator ":" for ESMF config
+       files, "=" for namelist files and line by line for the text tables.
+       The results are written to "ofile" in the order of the file paths as
+       they become available.
+
+       For "json" and "ndjson", the records of namelistCMPGroup.records have also
+       "file", plus {"type": "file", "side": "left"|"right", "file": path} for files
+       in one tree only, {"type": "text", "file": path, "diff": [lines]} for the text
+       files and a final {"type": "tree_summary", ...}.
+
+       Return the number of files that differ or are in one tree only.
+    '''
+    from concurrent.futures import ProcessPoolExecutor
+
+    files1 = find_config_files(dir1)
+    files2 = find_config_files(dir2)
+    set1, set2 = set(files1), set(files2)
+    only1  = [relpath for relpath in files1 if relpath not in set2]
+    only2  = [relpath for relpath in files2 if relpath not in set1]
+    common = [relpath for relpath in files1 if relpath in set2]
+
+    counts = {'files': len(common), 'identical': 0, 'equal': 0, 'differ': 0,
+              'left_files': len(only1), 'right_files': len(only2)}
+
+    jobs_list = []
+    for relpath in common:
+        file1 = os.path.join(dir1,relpath)
+        file2 = os.path.join(dir2,relpath)
+        if _same_file_contents(file1,file2):
+            counts['identical'] += 1
+        else:
+            jobs_list.append((relpath,file1,file2,strict,tolerance,nmlblknames,fmt,color))
+
+    if jobs is None: jobs = os.cpu_count() or 1
+    jobs = min(jobs,len(jobs_list))
+
+    def results():
+        if jobs <= 1:
+            yield from map(_tree_diff_file,jobs_list)
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                yield from executor.map(_tree_diff_file,jobs_list)
+
+    def records():
+        for side,relpaths in (('left',only1),('right',only2)):
+            for relpath in relpaths:
+                yield {'type': 'file', 'side': side, 'file': relpath}
+        for relpath,equal,filerecords in results():
+            counts['equal' if equal else 'differ'] += 1
+            yield from filerecords
+        yield {'type': 'tree_summary', 'left': dir1, 'right': dir2, **counts}
+
+    if fmt != 'text':
+        namelistCMPGroup.output_records(ofile,records(),fmt)
+    else:
+        cprint = namelistCMPGroup.colorprint if color else namelistCMPGroup.nprint
+        for relpath in only1:
+            print(f"++++ only in {cprint('left ','magenta')}: {relpath}", file = ofile)
+        for relpath in only2:
+            print(f"++++ only in {cprint('right','cyan')}: {relpath}", file = ofile)
+
+        for relpath,equal,text in results():
+            counts['equal' if equal else 'differ'] += 1
+            if equal: continue
+            print(f"\n{cprint(relpath,'yellow')}", file = ofile)
+            ofile.write(text)
+            ofile.flush()
+
+        print(f"\n{counts['files']} files in both trees: {counts['identical']} identical, "
+              f"{counts['equal']} with the same values, {counts['differ']} different; "
+              f"{counts['left_files']} only in left, {counts['right_files']} only in right", file = ofile)
+
+    return counts['differ']+counts['left_files']+counts['right_files']
+#enddef diff_trees
+
 ##======================================================================
 ## Create a backup file
 ##======================================================================
-def create_a_backup_file(filename):
+
+def _backup_index(filename):
+    '''Return the backups of "filename" as an OrderedDict in the order of use,
+       {backup_name: [digest, size, mtime_ns]}.
+
+       The backup directory is listed once with os.scandir, the content hashes
+       are read from the sidecar index file "filename.bakidx" and only the
+       backups not in the index, or changed since, are hashed again.
+    '''
+    import hashlib, json
+
+    dirname  = os.path.dirname(filename) or '.'
+    basename = os.path.basename(filename)
+    bakre    = re.compile(re.escape(basename)+r'\.bak(\d*)$')
+
+    try:
+        with open(f"{filename}.bakidx",'r') as fp:
+            cached = json.load(fp)
+    except (OSError, ValueError):
+        cached = []
+
+    found = {}
+    with os.scandir(dirname) as entries:
+        for entry in entries:
+            if bakre.match(entry.name) and entry.is_file(follow_symlinks=False):
+                fstat = entry.stat(follow_symlinks=False)
+                found[entry.name] = (fstat.st_size, fstat.st_mtime_ns)
+
+    index = OrderedDict()
+    for name,digest,size,mtime in cached:                      # keep the order of use
+        if found.get(name) == (size,mtime):
+            index[name] = [digest,size,mtime]
+
+    for name in sorted(set(found)-set(index), key=lambda name: int(bakre.match(name).group(1) or 0)):
+        with open(os.path.join(dirname,name),'rb') as fp:
+            digest = hashlib.sha1(fp.read()).hexdigest()
+        index[name] = [digest,*found[name]]
+        index.move_to_end(name,last=False)                     # unknown backups are the oldest
+
+    return index
+#enddef _backup_index
+
+##----------------------------------------------------------------------
+
+def create_a_backup_file(filename,keep=None,maxbytes=None):
     '''Create a backup file and backup the file passed in
        Return the backup file name
+
+       The backups are "filename.bak", "filename.bak01", ... Nothing is
+       copied if a backup with the same contents already exists, that
+       backup is returned instead. The oldest backups (the least recently
+       returned) are removed to keep at most "keep" backups and
+       "maxbytes" bytes of backups, the one returned is always kept.
     '''
+    import hashlib, json, shutil, tempfile
+
+    index = _backup_index(filename)
+
+    with open(filename,'rb') as fp:
+        digest = hashlib.sha1(fp.read()).hexdigest()
 
-    bakfile = f"{filename}.bak"
-    if os.path.lexists(bakfile):                      # find a valid backup file name
-        bakfile_base = bakfile
-        bakfile1     = bakfile
-        bi = 1
-        bakfile = f"{bakfile_base}{bi:02d}"
-        while os.path.lexists(bakfile):
-            bi += 1
-            bakfile1 = bakfile
-            bakfile = f"{bakfile_base}{bi:02d}"
-
-        if not filecmp.cmp(filename, bakfile1):        # do not backup duplicate contents
-            shutil.copy(filename,bakfile)
+    dirname = os.path.dirname(filename)
+    bakname = next((name for name,entry in index.items() if entry[0] == digest), None)
+    if bakname is None:                                        # do not backup duplicate contents
+        basename = os.path.basename(filename)
+        numbers  = [int(name[len(basename)+4:] or 0) for name in index]
+        if not numbers:
+            bakname = f"{basename}.bak"
         else:
-            bakfile = bakfile1
-    else:
+            bakname = f"{basename}.bak{max(numbers)+1:02d}"
+        bakfile = os.path.join(dirname,bakname)
         shutil.copy(filename,bakfile)
+        fstat = os.stat(bakfile)
+        index[bakname] = [digest,fstat.st_size,fstat.st_mtime_ns]
+    index.move_to_end(bakname)
+
+    totalbytes = sum(entry[1] for entry in index.values())
+    while len(index) > 1 and ((keep is not None and len(index) > keep) or
+                              (maxbytes is not None and totalbytes > maxbytes)):
+        name,entry = index.popitem(last=False)
+        totalbytes -= entry[1]
+        try:
+            os.unlink(os.path.join(dirname,name))
+        except FileNotFoundError:
+            pass
 
-    return bakfile
+    idxfile = f"{filename}.bakidx"
+    try:
+        fd, tmpfile = tempfile.mkstemp(prefix=f".{os.path.basename(idxfile)}.",dir=dirname or '.')
+        try:
+            with os.fdopen(fd,'w') as fp:
+                json.dump([[name,*entry] for name,entry in index.items()],fp)
+            os.chmod(tmpfile,_new_file_mode())
+            os.replace(tmpfile,idxfile)
+        except BaseException:
+            os.unlink(tmpfile)
+            raise
+    except OSError as oserr:
+        print(f'WARNING: cannot write backup index {idxfile}: {oserr}',file=sys.stderr)
+
+    return os.path.join(dirname,bakname)
 #enddef create_a_backup_file
 
+##----------------------------------------------------------------------
+
+def _new_file_mode():
+    '''Return the mode of a new file, 0666 without the bits of the umask'''
+    umask = os.umask(0)           ## the umask can only be read by setting it
+    os.umask(umask)
+    return 0o666 & ~umask
+#enddef _new_file_mode
+
+def replace_file(filename,text,before=None):
+    '''Replace the contents of "filename" with "text" atomically
+       Return False if the file already contains "text" and is not written
+
+       "before" is called without arguments when the file is changed,
+       before it is replaced, e.g. to back it up.
+
+       "text" is written to a temporary file in the same directory, which
+       is synced and renamed to "filename", so that the file is never seen
+       partially written, and no copy crosses file systems. If "filename"
+       is a symbolic link, the file it points to is replaced.
+    '''
+    import tempfile
+
+    target = os.path.realpath(filename)
+    data   = text.encode()
+
+    try:
+        fstat = os.stat(target)
+        if fstat.st_size == len(data):
+            with open(target,'rb') as fp:
+                if fp.read() == data: return False
+        mode = fstat.st_mode & 0o7777
+    except FileNotFoundError:
+        mode = _new_file_mode()      # as open() would create it, not 0600 of mkstemp
+
+    if before is not None: before()
+
+    dirname,basename = os.path.split(target)
+    fd, tmpfile = tempfile.mkstemp(prefix=f".{basename}.",dir=dirname)
+    try:
+        with os.fdopen(fd,'wb') as fp:
+            fp.write(data)
+            fp.flush()
+            os.fsync(fp.fileno())
+        os.chmod(tmpfile,mode)
+        os.replace(tmpfile,target)
+    except BaseException:
+        os.unlink(tmpfile)
+        raise
+
+    return True
+#enddef replace_file
+
+##======================================================================
+## Decode the place holder mapping from command line
+##======================================================================
+def decode_template_map(maps):
+    '''Decode the "--template" arguments into a template spec
+
+       Each argument is a JSON file, a JSON string or "KEY=VALUE,KEY=VALUE,..."
+       A JSON object without "templates" is taken as place holder values.
+    '''
+    import json
+
+    spec = {'values': {}}
+    for amap in maps:
+        if os.path.isfile(amap):
+            with open(amap,'r') as fhdl:
+                inspec = json.load(fhdl)
+        elif amap.lstrip().startswith('{'):
+            inspec = json.loads(amap)
+        else:
+            inspec = {'values': {}}
+            for pair in amap.split(','):
+                if not pair: continue
+                key, sep, value = pair.partition('=')
+                if not sep:
+                    raise ValueError(f'Place holder "{pair}" is not in format KEY=VALUE.')
+                inspec['values'][key.strip()] = value.strip()
+
+        if not any(key in inspec for key in ('templates','values','variables','runs')):
+            inspec = {'values': inspec}
+
+        for key,value in inspec.items():
+            if key in ('values','variables'):
+                spec.setdefault(key,{}).update(value)
+            else:
+                spec[key] = value
+
+    return spec
+#enddef decode_template_map
+
 ##======================================================================
 ## Parse command line arguments
 ##======================================================================
 
-def parseArgv() :
+def parseArgv(argv=None) :
     '''-------------------------------------------------------------------
     Parse command line arguments
     -------------------------------------------------------------------'''
 
+    import argparse
+
     version  = '6.0'
     lastdate = '2022.04.22'
 
@@ -1345,41 +2819,101 @@ def parseArgv() :
     parser.add_argument("-f", "--force", action="store_true", help="Add new variables from FILE2 if not exist in FILE1")
     parser.add_argument("-d", "--separator",default='=',      help="Variable separator, default: '=' for namelist, ':' for ESMF configuration")
     parser.add_argument("-r", "--strict",action="store_true", help="Strict comparison, two values (float, int, boolean, etc) are different even they have the same value but may be in different formats")
+    parser.add_argument("-e", "--semantic",action="store_true", help="Semantic comparison, compare arrays element by element, numbers with tolerance (see --rtol), and report only the elements that differ")
+    parser.add_argument("--rtol",        default=1e-6, type=float, help="Relative tolerance of numbers for --semantic, default: %(default)s")
+    parser.add_argument("-w", "--validate",action="store_true", help="Validate all variable values while reading and warn about invalid values")
     parser.add_argument("-o", "--output",default=None,        help="Ouput file name")
+    parser.add_argument("--format",      default='text', choices=['text','json','ndjson'],
+                                                              help="Output format of --diff, \"json\" and \"ndjson\" stream one record for each difference and a summary (see namelistCMPGroup.records), default: %(default)s")
+    parser.add_argument("--cachedir",    default=os.environ.get('NAMELIST_CACHE_DIR'),
+                                                              help="Directory to cache decoded namelist files between runs, default: $NAMELIST_CACHE_DIR")
     parser.add_argument("-i", "--inline",action="store_true", help="Write output inline to the original file, FILE1 (if --output is not given). It implicitly turns on -keep1")
+    parser.add_argument("--backup-keep", default=os.environ.get('NAMELIST_BACKUP_KEEP'), type=int, metavar='N',
+                                         help="With --inline, keep at most N backups of FILE1, default: $NAMELIST_BACKUP_KEEP or all")
+    parser.add_argument("--backup-bytes", default=os.environ.get('NAMELIST_BACKUP_BYTES'), type=int, metavar='BYTES',
+                                         help="With --inline, keep at most BYTES bytes of backups of FILE1, default: $NAMELIST_BACKUP_BYTES or all")
     parser.add_argument("-n", "--name",  default=None,nargs='+',help="Namelist block name(s), Operate with these namelist block(s) only")
 
     parser.add_argument("-p", "--print", action="store_true", help="Print namelist file, default for 1 file")
     parser.add_argument("-c", "--diff",  action="store_true", help="Compare two namelist files, FILE1 is the base, default for 2 files")
+    parser.add_argument("-x", "--matrix",action="store_true", help="Compare all files at once and print a matrix of the variables that differ, default for more than 2 files")
     parser.add_argument("-m", "--merge", action="store_true", help="Merge FILE2 to FILE1, FILE2 is a namelist file")
     parser.add_argument("-s", "--set",   action="store_true", help="Set FILE1 with values from FILE2. FILE2 contains variable \nand value pairs only, but not embeded within namelist blocks")
+    parser.add_argument("-t", "--template", default=None, action='append', metavar='MAP',
+                                          help="Fill place holders in FILE1 as a template. MAP is \"KEY=VALUE,...\", a JSON string or a JSON file, "
+                                               "FILE1 can be omitted when MAP contains \"templates\" to render a set of run directories (see render_templates)")
+
+    parser.add_argument("-b", "--batch", default=None, metavar='TABLE',
+                                          help="Render FILE1 as a template once for each member in TABLE (CSV or JSON, see read_batch_table) "
+                                               "into the member directories. The output file name is given by --output, default: basename of FILE1")
+    parser.add_argument("-j", "--jobs",  default=None, type=int, help="Number of processes for --batch and for comparing two directories, default: number of CPUs")
+    parser.add_argument("--serve", default=None, metavar='SOCKET',
+                                          help="Run as a server on Unix socket SOCKET, keep decoded files in memory and serve requests from nmlclient.py")
 
-    parser.add_argument("file1", nargs=1,   help="A Fortran namelist file")
-    parser.add_argument("file2", nargs='?', help="Another namelist file or var-value flat file for comparison or merging" )
+    parser.add_argument("file1", nargs='?', help="A Fortran namelist file")
+    parser.add_argument("file2", nargs='*', help="Another namelist file or var-value flat file for comparison or merging, or more files for --matrix. "
+                                                 "When FILE1 and FILE2 are both directories, all configuration files in the two trees are compared (see diff_trees)" )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     options = {'debug': args.debug, 'output' : args.output,  'keep1' : args.keep1,
                'force': args.force, 'inline' : args.inline,  'strict': args.strict,
-               'blkname': args.name, 'action' : None, 'varsep': args.separator}
+               'blkname': args.name, 'action' : None, 'varsep': args.separator,
+               'validate': args.validate, 'cachedir': args.cachedir, 'template': None,
+               'batch': args.batch, 'jobs': args.jobs, 'serve': args.serve,
+               'backup_keep': args.backup_keep, 'backup_bytes': args.backup_bytes,
+               'format': args.format, 'semantic': args.rtol if args.semantic else None}
 
-    argfiles = args.file1
-    if args.file2 is not None:
-        argfiles.append(args.file2)
+    if args.serve is not None:
+        options['action'] = 'serve'
+        return (options, [])
+
+    if args.template is not None:
+        try:
+            options['template'] = decode_template_map(args.template)
+        except (ValueError, OSError) as err:
+            print(f"ERROR: wrong template map - {err}", file=sys.stderr)
+            sys.exit(1)
+
+    argfiles = []
+    if args.file1 is not None:
+        argfiles.append(args.file1)
+    elif options['template'] is None or 'templates' not in options['template']:
+        parser.error("FILE1 is required")
+    argfiles.extend(args.file2)
 
     if len(argfiles) == 1:
         options['action'] = 'print'
     elif len(argfiles) == 2:
         options['action'] = 'diff'
+    elif len(argfiles) > 2:
+        options['action'] = 'matrix'
 
     if args.print:
         options['action'] = 'print'
     elif args.diff:
         options['action'] = 'diff'
+    elif args.matrix:
+        options['action'] = 'matrix'
     elif args.merge:
         options['action'] = 'merge'
     elif args.set:
         options['action'] = 'set'
+    elif args.batch:
+        options['action'] = 'batch'
+        if len(argfiles) != 1:
+            print(f"\n  ERROR: 1 template file is require to do \"batch\".", file=sys.stderr)
+            sys.exit(0)
+        argfiles.append(args.batch)
+    elif args.template:
+        options['action'] = 'template'
+
+    if options['action'] in ['diff', 'set', 'merge'] and len(argfiles) > 2:
+        print(f"\n  ERROR: only 2 files are allowed to do \"{options['action']}\".", file=sys.stderr)
+        sys.exit(0)
+
+    if options['action'] == 'diff' and len(argfiles) == 2 and os.path.isdir(argfiles[0]) and os.path.isdir(argfiles[1]):
+        options['action'] = 'treediff'
 
     if options['action'] in ['diff', 'set', 'merge']:
         if len(argfiles) == 2:
@@ -1400,32 +2934,236 @@ def parseArgv() :
     return (options, argfiles)
 #enddef parseArgv
 
+##======================================================================
+## Server mode
+##======================================================================
+
+def serve(sockpath,debug=False):
+    '''Serve requests on the Unix socket "sockpath" until a "shutdown" request
+
+       Each request is one JSON line, the response is one JSON line
+
+         {"op": "run", "argv": [...], "cwd": "...", "env": {...}}
+             Run namelist.py with the command line arguments "argv" in
+             directory "cwd". The NAMELIST_* variables of the client in
+             "env" replace those of the server while the request runs.
+             Returns {"status", "stdout", "stderr", "elapsed"}.
+         {"op": "stats"}
+             Returns {"requests", "elapsed", "cache"} of this server.
+         {"op": "shutdown"}
+             Stops the server.
+
+       The decoded files are kept in "nml_cache" between requests, so that
+       a file is decoded again only when it is changed. Requests are served
+       one by one, because each request runs in its own working directory
+       with redirected stdout and stderr.
+    '''
+    import socket, socketserver, io, contextlib, traceback, json
+
+    if os.path.exists(sockpath):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(sockpath)
+        except OSError:                       ## stale socket file
+            os.unlink(sockpath)
+        else:
+            probe.close()
+            print(f"ERROR: server is already running on {sockpath}", file=sys.stderr)
+            return 1
+
+    stats = {'requests': 0, 'elapsed': 0.0, 'running': True}
+
+    ## the defaults of the command line options, taken from the client
+    envkeys = ('NAMELIST_CACHE_DIR', 'NAMELIST_BACKUP_KEEP', 'NAMELIST_BACKUP_BYTES')
+
+    def run_request(request):
+        op = request.get('op','run')
+        if op == 'stats':
+            return {'requests': stats['requests'], 'elapsed': stats['elapsed'], 'cache': nml_cache.stats(), 'pid': os.getpid()}
+        elif op == 'shutdown':
+            stats['running'] = False
+            return {'status': 0}
+        elif op != 'run':
+            return {'status': 2, 'stdout': '', 'stderr': f'ERROR: unknown request "{op}".\n'}
+
+        stdout = io.StringIO()
+        stderr = io.StringIO()
+        cwd    = os.getcwd()
+        btime  = time.perf_counter()
+        environ  = {key: os.environ.get(key) for key in envkeys}
+        cachedir = nml_cache.cachedir
+        try:
+            for key in envkeys:
+                value = request.get('env',{}).get(key)
+                if value is None: os.environ.pop(key,None)
+                else:             os.environ[key] = value
+            os.chdir(request.get('cwd',cwd))
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                try:
+                    status = main(request.get('argv',[]),cache=True)
+                except SystemExit as exitcode:
+                    status = exitcode.code if isinstance(exitcode.code,int) else (0 if exitcode.code is None else 1)
+                except Exception:
+                    traceback.print_exc()
+                    status = 1
+        except OSError as oserr:
+            stderr.write(f'ERROR: {oserr}\n')
+            status = 1
+        finally:
+            os.chdir(cwd)
+            for key,value in environ.items():
+                if value is None: os.environ.pop(key,None)
+                else:             os.environ[key] = value
+            nml_cache.cachedir = cachedir
+        elapsed = time.perf_counter()-btime
+
+        stats['requests'] += 1
+        stats['elapsed']  += elapsed
+        if debug: print(f"{request.get('argv')} -> {status} in {elapsed*1000:.2f} ms", file=sys.stderr)
+
+        return {'status': status or 0, 'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(), 'elapsed': elapsed}
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                try:
+                    response = run_request(json.loads(line))
+                except ValueError as err:
+                    response = {'status': 2, 'stdout': '', 'stderr': f'ERROR: wrong request - {err}\n'}
+                self.wfile.write((json.dumps(response)+'\n').encode())
+                self.wfile.flush()
+                if not stats['running']: break
+
+    oldmask = os.umask(0o077)                 ## the socket is for this user only
+    try:
+        server = socketserver.UnixStreamServer(sockpath,RequestHandler)
+    finally:
+        os.umask(oldmask)
+
+    print(f"INFO: serving on {sockpath} (pid {os.getpid()})", file=sys.stderr)
+    try:
+        with server:
+            while stats['running']:
+                server.handle_request()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if os.path.exists(sockpath): os.unlink(sockpath)
+
+    return 0
+#enddef serve
+
 ##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
 ##
 ## Entance Point
 ##
 ##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
 
-if __name__ == '__main__':
+def write_inline(filename,text,opts):
+  ''' Back up "filename" and replace it with "text", unless it is unchanged'''
 
-  import os, argparse
+  bakfiles = []
+  def backup():
+      bakfiles.append(create_a_backup_file(filename,opts['backup_keep'],opts['backup_bytes']))
 
-  (opts,args) = parseArgv()
+  if not replace_file(filename,text,backup):
+      print(f"INFO: The file {filename} is unchanged, not written",file=sys.stderr)
+      return
+
+  print(f"INFO: The original file is backuped in file: {bakfiles[0]}",file=sys.stderr)
+#enddef write_inline
+
+def main(argv=None,cache=False):
+  ''' Run namelist.py with command line arguments "argv" (sys.argv by default),
+      "cache" keeps decoded files in "nml_cache" (see serve)
+  '''
+
+  (opts,args) = parseArgv(argv)
+
+  if opts['action'] == 'serve':
+    return serve(opts['serve'],opts['debug'])
+
+  usecache = cache or opts['cachedir'] is not None
+  nml_cache.cachedir = opts['cachedir']       ## restored after each request by serve
 
   dictfmt = False
   if opts['varsep'] == ':': dictfmt = True
 
+  if opts['action'] == 'template':
+
+    tmplspec = opts['template']
+    if len(args) == 0:                ## render run directories
+        for outfile in render_templates(tmplspec,opts['debug'],usecache):
+            print(f"INFO: written {outfile}", file=sys.stderr)
+    else:                             ## render one file
+        template = namelistTemplate(args[0],'config' if dictfmt else None,usecache)
+        variables = tmplspec.get('variables',{})
+        if opts['output'] is not None:
+            template.render(opts['output'],tmplspec['values'],variables)
+        elif opts['inline']:
+            import io
+            outhdl = io.StringIO()
+            template.render(outhdl,tmplspec['values'],variables)
+            write_inline(args[0],outhdl.getvalue(),opts)
+        else:
+            template.render(sys.stdout,tmplspec['values'],variables)
+
+    return 0
+
+  elif opts['action'] == 'batch':
+
+    tmplspec = opts['template'] or {'values': {}}
+    template = namelistTemplate(args[0],'config' if dictfmt else None,usecache)
+    runs     = read_batch_table(args[1])
+    outname  = opts['output'] if opts['output'] is not None else os.path.basename(args[0])
+
+    btime = time.perf_counter()
+    try:
+        results = render_batch(template,runs,outname,tmplspec['values'],opts['jobs'])
+    except ValueError as err:
+        print(f"ERROR: {err}", file=sys.stderr)
+        return 1
+    for outfile,seconds in results:
+        print(f"INFO: written {outfile} in {seconds*1000:.2f} ms", file=sys.stderr)
+    print(f"INFO: {len(results)} files written in {time.perf_counter()-btime:.3f} s", file=sys.stderr)
+
+    return 0
+
+  elif opts['action'] == 'treediff':
+
+    if opts['output'] is None :
+        ndiffs = diff_trees(args[0],args[1],sys.stdout,opts['strict'],opts['semantic'],opts['blkname'],opts['format'],True,opts['jobs'])
+    else :
+        with open(opts['output'],'w') as outhdl:
+            ndiffs = diff_trees(args[0],args[1],outhdl,opts['strict'],opts['semantic'],opts['blkname'],opts['format'],False,opts['jobs'])
+
+    return 1 if ndiffs > 0 else 0
+
   ## Decode a nameliss file to get the base namelist group
   nmlfile = args[0]
-  nmlgrp = namelistGroup.fromFile(nmlfile,opts['varsep'],opts['debug'],dictfmt)
+  nmlgrp = namelistGroup.fromFile(nmlfile,opts['varsep'],opts['debug'],dictfmt,opts['validate'],opts['keep1'],usecache)
 
   output = True
 
   if opts['action'] == 'diff' :
 
-    nmlgrp2 = namelistGroup.fromFile(args[1],opts['varsep'],opts['debug'],dictfmt)
+    nmlgrp2 = namelistGroup.fromFile(args[1],opts['varsep'],opts['debug'],dictfmt,opts['validate'],cache=usecache)
     ## compare two namelist groups
-    nmlcmp = namelistCMPGroup(nmlgrp,nmlgrp2,opts['strict'])
+    if opts['format'] != 'text':
+        records = namelistCMPGroup.records(nmlgrp,nmlgrp2,opts['strict'],opts['blkname'],opts['semantic'])
+        if opts['output'] is None :
+            try:
+                namelistCMPGroup.output_records(sys.stdout,records,opts['format'])
+            except BrokenPipeError:   ## the reader exits early
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, sys.stdout.fileno())
+                return 1
+        else :
+            with open(opts['output'],'w') as outhdl:
+                namelistCMPGroup.output_records(outhdl,records,opts['format'])
+        return 0
+
+    nmlcmp = namelistCMPGroup(nmlgrp,nmlgrp2,opts['strict'],opts['semantic'])
 
     if opts['output'] is None :
         nmlcmp.output(sys.stdout,nmlgrp,nmlgrp2,opts['blkname'],True)
@@ -1435,16 +3173,29 @@ if __name__ == '__main__':
 
     output = False        ## done
 
+  elif opts['action'] == 'matrix' :
+
+    nmlgrps = [nmlgrp]+[namelistGroup.fromFile(afile,opts['varsep'],opts['debug'],dictfmt,opts['validate'],cache=usecache)
+                        for afile in args[1:]]
+    nmlmtx  = namelistCMPMatrix(nmlgrps,opts['strict'])
+
+    if opts['output'] is None :
+        nmlmtx.output(sys.stdout,opts['blkname'],True)
+    else :
+        with open(opts['output'],'w') as outhdl:
+            nmlmtx.output(outhdl,opts['blkname'],False)
+
+    output = False        ## done
+
   elif opts['action']  == 'merge':
 
-    nmlgrp2 = namelistGroup.fromFile(args[1],opts['varsep'],opts['debug'],dictfmt)
+    nmlgrp2 = namelistGroup.fromFile(args[1],opts['varsep'],opts['debug'],dictfmt,opts['validate'],cache=usecache)
     nmlgrp.merge2dict(nmlgrp2,opts['blkname'],opts['force'])
 
   elif opts['action'] == 'set':
 
-    nmlgrp2 = namelistGroup.fromFile(args[1],opts['varsep'],opts['debug'],True)
-    for nmlname,nmlblock in nmlgrp2.items():
-        nmlgrp.merge1dict(nmlblock,opts['blkname'])
+    nmlgrp2 = namelistGroup.fromFile(args[1],opts['varsep'],opts['debug'],True,opts['validate'],cache=usecache)
+    nmlgrp.merge_many(nmlgrp2.values(),opts['blkname'])
 
   ##
   ## Output the namelist file
@@ -1455,18 +3206,28 @@ if __name__ == '__main__':
     if opts['output'] is not None:
         outhdl = open(opts['output'],'w')
     elif opts['inline']:
-        bakfile = create_a_backup_file(args[0])
-        outhdl  = tempfile.NamedTemporaryFile(mode='w+',delete=False)
+        import io
+        outhdl = io.StringIO()
     else:
         outhdl = sys.stdout
 
-    if opts['keep1'] :
-        nmlgrp.writeToFileWithComments(outhdl,opts['blkname'],opts['debug'],opts['force'])
-    else :    ## Output the base namelist
-        nmlgrp.writeToFile(outhdl,opts['blkname'])
+    try:
+        if opts['keep1'] :
+            nmlgrp.writeToFileWithComments(outhdl,opts['blkname'],opts['debug'],opts['force'])
+        else :    ## Output the base namelist, streamed line by line
+            nmlgrp.writeToFile(outhdl,opts['blkname'])
+    except BrokenPipeError:           ## stdout is piped to a command that exits early, e.g. head
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
 
-    outhdl.close()
-    if opts['inline']:
-        shutil.copy(outhdl.name,args[0])
-        print(f"INFO: The original file is backuped in file: {bakfile}",file=sys.stderr)
-        os.unlink(outhdl.name)
+    if opts['inline'] and opts['output'] is None:
+        write_inline(args[0],outhdl.getvalue(),opts)
+    elif outhdl is not sys.stdout:
+        outhdl.close()
+
+  return 0
+#enddef main
+
+if __name__ == '__main__':
+  sys.exit(main())
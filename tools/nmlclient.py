@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+## ---------------------------------------------------------------------
+##
+## Thin client of "namelist.py --serve SOCKET".
+##
+## It takes the same command line arguments as namelist.py and sends them
+## to the server on the Unix socket in $NAMELIST_SOCKET, so that the run
+## scripts do not pay Python startup and file decoding for each call.
+## When no server is running, it runs namelist.py in this process, which
+## starts faster than running namelist.py as a script, because the byte
+## code of the imported module is cached. It falls back only when the
+## connection fails; once the request is sent, any error is reported and
+## the exit status is 2, since the server may have run the request.
+## The NAMELIST_* environment variables are sent with the request, so
+## that the defaults of the server, e.g. $NAMELIST_BACKUP_KEEP, are those
+## of this process.
+##
+##   nmlclient.py [namelist.py arguments]
+##   nmlclient.py --stats        Print the server counters
+##   nmlclient.py --shutdown     Stop the server
+##
+## With NAMELIST_TIMING=1, the time used by the server and the round
+## trip time of the request are printed to stderr.
+##
+## ---------------------------------------------------------------------
+##
+## Requirements:
+##
+##   o Python 3.6 or above
+##
+########################################################################
+
+import os, sys
+import json
+import socket
+import time
+
+def connect(sockpath):
+    '''Return a socket connected to the server on "sockpath"'''
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(sockpath)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+#enddef connect
+
+def request(sock,req):
+    '''Send one request on the connected socket "sock", return the decoded response'''
+
+    with sock:
+        sock.sendall((json.dumps(req)+'\n').encode())
+        with sock.makefile('rb') as fhdl:
+            line = fhdl.readline()
+
+    if not line:
+        raise ConnectionError('no response from the server')
+    return json.loads(line)
+#enddef request
+
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+##
+## Entance Point
+##
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+if __name__ == '__main__':
+
+    argv     = sys.argv[1:]
+    sockpath = os.environ.get('NAMELIST_SOCKET')
+
+    if argv[:1] == ['--stats']:
+        req = {'op': 'stats'}
+    elif argv[:1] == ['--shutdown']:
+        req = {'op': 'shutdown'}
+    else:
+        env = {key: value for key,value in os.environ.items() if key.startswith('NAMELIST_')}
+        req = {'op': 'run', 'argv': argv, 'cwd': os.getcwd(), 'env': env}
+
+    btime = time.perf_counter()
+    try:
+        if not sockpath: raise ConnectionError('NAMELIST_SOCKET is not set')
+        sock = connect(sockpath)
+    except OSError as err:
+        if req['op'] != 'run':
+            print(f"ERROR: {err}", file=sys.stderr)
+            sys.exit(2)
+        ## no server, run namelist.py in this process, importing the module
+        ## uses its compiled byte code instead of compiling the script
+        import namelist
+        sys.exit(namelist.main(argv))
+
+    ## the server may have run the request already, e.g. written a file
+    ## with "-i", so it is not run again here
+    try:
+        response = request(sock,req)
+    except (OSError, ValueError) as err:
+        print(f"ERROR: request to {sockpath} failed: {err}", file=sys.stderr)
+        sys.exit(2)
+
+    if req['op'] == 'stats':
+        print(json.dumps(response,indent=2))
+        sys.exit(0)
+
+    sys.stdout.write(response.get('stdout',''))
+    sys.stderr.write(response.get('stderr',''))
+
+    if os.environ.get('NAMELIST_TIMING'):
+        elapsed = response.get('elapsed',0.0)
+        print(f"TIMING: server {elapsed*1000:.2f} ms, round trip {(time.perf_counter()-btime)*1000:.2f} ms", file=sys.stderr)
+
+    sys.exit(response.get('status',0))
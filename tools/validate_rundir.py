@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+## ---------------------------------------------------------------------
+##
+## Preflight check of an FV3 run directory before the job is submitted.
+##
+## The run-time files input.nml, model_configure, diag_table, field_table,
+## data_table and nems.configure are decoded, and every file they refer
+## to is derived:
+##
+##   o path-like values in input.nml (see chknml.collect_paths) and the
+##     fix files of the "namsfc" block, "tileX" is replaced by the tile,
+##   o the fix files required by the physics options in input.nml, e.g.
+##     aeroclim.m01-12.nc and optics_*.dat for IAER=5xxx,
+##     co2historicaldata_<year>.txt for ICO2=2 for each year from the
+##     start date to the end of the forecast, as linked by run_fv3_Jet.sh,
+##   o the initial and the lateral boundary files in INPUT/ for a
+##     regional cold start, one boundary file for each "bc_update_interval"
+##     hours up to "nhours_fcst" in model_configure,
+##   o the files in data_table.
+##
+## diag_table and field_table are decoded too. The base date of diag_table
+## must be the start date in model_configure, its fields must go to files
+## defined in the table (see diagtable.py). The tracers in field_table must
+## be complete records, not duplicated, and include the "nwat" water
+## species of input.nml (sphum, liq_wat, ice_wat, ...).
+##
+## All files are checked concurrently (see chknml.check_paths) for
+## missing files, broken links and zero sizes. The boundary files are
+## also expected to have similar sizes, a file much smaller than the
+## others is likely being written. Values that are not valid, e.g.
+## place holders not filled, are reported too.
+##
+## The exit status is 1 if any problem is found.
+##
+## ---------------------------------------------------------------------
+##
+## Requirements:
+##
+##   o Python 3.6 or above
+##   o namelist.py, chknml.py and diagtable.py in the same directory
+##
+########################################################################
+
+import os, sys
+import re
+import time
+from datetime import datetime, timedelta
+
+import namelist
+import chknml
+
+_control_files = ('input.nml', 'model_configure', 'diag_table', 'field_table', 'data_table', 'nems.configure')
+
+##======================================================================
+## Helpers
+##======================================================================
+
+def nml_value(nmlgrp,var,default=None):
+    '''Return the value of "var" in any block of "nmlgrp", "default" if not
+       found or the value is not valid
+    '''
+    nml_name = nmlgrp.findblock(var)
+    if nml_name is None: return default
+    try:
+        return nmlgrp[nml_name][var].value
+    except (TypeError, ValueError):
+        return default
+#enddef nml_value
+
+##----------------------------------------------------------------------
+
+def invalid_values(nmlgrp,filename):
+    '''Return ["file: var = value", ...] for the values that can not be decoded'''
+
+    invalids = []
+    for nml_name in nmlgrp.keys():
+        for var,varvalue in nmlgrp[nml_name].items():
+            try:
+                varvalue.value
+            except (TypeError, ValueError):
+                invalids.append(f"{filename}: {var} = {varvalue}")
+    return invalids
+#enddef invalid_values
+
+##======================================================================
+## Derive the files required by the run directory
+##======================================================================
+
+def physics_files(nmlgrp,years=()):
+    '''Return {file: reason} of the fix files required by the physics options
+       in input.nml, the names are those linked by run_fv3_Jet.sh,
+       "years" are the years of the forecast.
+    '''
+    files = {}
+
+    iaer = nml_value(nmlgrp,'iaer',0)
+    if isinstance(iaer,int) and iaer > 0:
+        files['aerosol.dat'] = f'iaer = {iaer}'
+        if iaer//1000 == 5:                    ## MERRA2 aerosol climatology
+            for month in range(1,13):
+                files[f'aeroclim.m{month:02d}.nc'] = f'iaer = {iaer}'
+            for species in ('BC', 'DU', 'OC', 'SS', 'SU'):
+                files[f'optics_{species}.dat'] = f'iaer = {iaer}'
+
+    if nml_value(nmlgrp,'ico2') == 2:
+        files['co2historicaldata_glob.txt'] = 'ico2 = 2'
+        files['co2monthlycyc.txt']          = 'ico2 = 2'
+        for year in years:
+            files[f'co2historicaldata_{year}.txt'] = f'ico2 = 2, forecast in {year}'
+
+    if nml_value(nmlgrp,'isol') in (1, 2):
+        files['solarconstant_noaa_an.txt'] = f"isol = {nml_value(nmlgrp,'isol')}"
+
+    if nml_value(nmlgrp,'iems') == 1:
+        files['sfc_emissivity_idx.txt'] = 'iems = 1'
+
+    if nml_value(nmlgrp,'h2o_phys') is True:
+        files['global_h2oprdlos.f77'] = 'h2o_phys = .true.'
+
+    if nml_value(nmlgrp,'oz_phys_2015') is True or nml_value(nmlgrp,'oz_phys') is True:
+        files['global_o3prdlos.f77'] = 'oz_phys'
+
+    return files
+#enddef physics_files
+
+##----------------------------------------------------------------------
+
+def input_files(nmlgrp,nhours=None,tile=7):
+    '''Return {file: reason} of the initial and boundary files in INPUT/'''
+
+    files = {}
+    if nml_value(nmlgrp,'warm_start') is True:
+        return files
+
+    if nml_value(nmlgrp,'external_ic') is True and nml_value(nmlgrp,'nggps_ic') is True:
+        for fname in ('gfs_ctrl.nc', 'gfs_data.nc', 'sfc_data.nc'):
+            files[os.path.join('INPUT',fname)] = 'external_ic, nggps_ic'
+
+    if nml_value(nmlgrp,'regional') is True:
+        files[os.path.join('INPUT','oro_data.nc')] = 'regional'
+        files[os.path.join('INPUT',f'grid.tile{tile}.halo4.nc')]     = 'regional'
+        files[os.path.join('INPUT',f'oro_data.tile{tile}.halo4.nc')] = 'regional'
+        if nml_value(nmlgrp,'do_gsl_drag_ls_bl') is True:
+            files[os.path.join('INPUT','oro_data_ls.nc')] = 'do_gsl_drag_ls_bl'
+        if nml_value(nmlgrp,'do_gsl_drag_ss') is True:
+            files[os.path.join('INPUT','oro_data_ss.nc')] = 'do_gsl_drag_ss'
+
+        interval = nml_value(nmlgrp,'bc_update_interval')
+        if isinstance(interval,int) and interval > 0 and isinstance(nhours,int):
+            for hour in range(0,nhours+1,interval):
+                files[os.path.join('INPUT',f'gfs_bndy.tile{tile}.{hour:03d}.nc')] = f'bc_update_interval = {interval}'
+
+    return files
+#enddef input_files
+
+##----------------------------------------------------------------------
+
+def namsfc_files(nmlgrp,tile=7):
+    '''Return {file: reason} of the fix files in the "namsfc" block,
+       "tileX" in the names is replaced by the tile number.
+    '''
+    files = {}
+    if 'namsfc' not in nmlgrp: return files
+
+    for var,varvalue in nmlgrp['namsfc'].items():
+        if not var.startswith('fn'): continue
+        try:
+            value = varvalue.value
+        except (TypeError, ValueError):
+            continue
+        if isinstance(value,str) and '.' in value and not any(c.isspace() for c in value):
+            files[value.replace('tileX',f'tile{tile}')] = f'namsfc: {var}'
+    return files
+#enddef namsfc_files
+
+##----------------------------------------------------------------------
+
+def data_table_files(filename):
+    '''Return {file: reason} of the files in a data_table,
+       "gridname", "fieldname_code", "fieldname_file", "file_name", ...
+    '''
+    files = {}
+    with open(filename,'r') as fhdl:
+        for line in fhdl:
+            line = line.strip()
+            if not line or line.startswith('#'): continue
+            fields = [field.strip().strip('"\'') for field in line.split(',')]
+            if len(fields) >= 4 and fields[3]:
+                fname = fields[3]
+                if not fname.startswith('INPUT/'): fname = os.path.join('INPUT',fname)
+                files[fname] = f'data_table: {fields[1] if len(fields) > 1 else ""}'
+    return files
+#enddef data_table_files
+
+##----------------------------------------------------------------------
+
+_diag_date_re = re.compile(r'^\s*\d{4}\s+\d{1,2}\s+\d{1,2}\s+\d{1,2}\s+\d{1,2}\s+\d{1,2}\s*$')
+
+def check_diag_table(filename,start=None):
+    '''Return the problems of a diag_table: the second line must be the
+       base date "YYYY MM DD HH MM SS", the start date (a datetime) when
+       it is known, and the fields must go to files defined in the table.
+    '''
+    import diagtable
+
+    try:
+        table = diagtable.DiagTable.fromFile(filename)
+    except ValueError as err:
+        return [str(err)]
+
+    if not _diag_date_re.match(table.basedate):
+        return [f"{filename}: invalid base date \"{table.basedate}\""]
+
+    problems = []
+    basedate = [int(value) for value in table.basedate.split()]
+    if start is not None and basedate[0:4] != [start.year, start.month, start.day, start.hour]:
+        problems.append(f"{filename}: base date \"{table.basedate}\" is not the start date {start:%Y %m %d %H} in model_configure")
+    problems.extend(f"{filename}: {problem}" for problem in table.problems())
+    return problems
+#enddef check_diag_table
+
+##----------------------------------------------------------------------
+
+_water_species = ('sphum', 'liq_wat', 'ice_wat', 'rainwat', 'snowwat', 'graupel', 'hailwat')
+_table_token_re = re.compile(r'"[^"]*"|\'[^\']*\'|/|[^\s,"\'/]+')
+
+def field_table_tracers(filename):
+    '''Return (tracer names, problems) of a field_table
+
+       Each record is "TYPE", "model", "name" followed by the method
+       lines and ends with "/", the text after "#" is a comment.
+    '''
+    tokens = []
+    with open(filename,'r') as fhdl:
+        for lineno,line in enumerate(fhdl,1):
+            for match in _table_token_re.finditer(line):
+                token = match.group(0)
+                if token.startswith('#'): break
+                tokens.append((lineno,token.strip('"\'')))
+
+    names    = []
+    problems = []
+    record   = []
+    for lineno,token in tokens:
+        if token != '/':
+            record.append((lineno,token))
+            continue
+        if len(record) < 3:
+            problems.append(f"{filename}: line {lineno}: record without type, model and name")
+        elif record[0][1].upper() == 'TRACER':
+            name = record[2][1]
+            if name in names:
+                problems.append(f"{filename}: line {record[0][0]}: duplicated tracer \"{name}\"")
+            names.append(name)
+        record = []
+    if record:
+        problems.append(f"{filename}: line {record[0][0]}: record not ended with \"/\"")
+
+    return (names, problems)
+#enddef field_table_tracers
+
+def check_field_table(filename,nmlgrp=None):
+    '''Return the problems of a field_table, the water species of
+       "nwat" in input.nml (namelistGroup "nmlgrp") must be tracers
+    '''
+    names, problems = field_table_tracers(filename)
+
+    nwat = nml_value(nmlgrp,'nwat') if nmlgrp is not None else None
+    required = _water_species[:nwat] if isinstance(nwat,int) and nwat > 0 else _water_species[:1]
+    for name in required:
+        if name not in names:
+            problems.append(f"{filename}: tracer \"{name}\" is missing"+(f" for nwat = {nwat}" if nwat else ''))
+    return problems
+#enddef check_field_table
+
+##----------------------------------------------------------------------
+
+def forecast_dates(cfggrp):
+    '''Return (start, end) datetimes of the forecast in model_configure
+       (namelistGroup "cfggrp"), None when not valid, e.g. place holders
+    '''
+    values = [nml_value(cfggrp,var,0 if var in ('start_hour', 'nhours_fcst') else None)
+              for var in ('start_year', 'start_month', 'start_day', 'start_hour', 'nhours_fcst')]
+    if not all(isinstance(value,int) for value in values):
+        return (None, None)
+    try:
+        start = datetime(*values[0:4])
+    except ValueError:
+        return (None, None)
+    return (start, start+timedelta(hours=values[4]))
+#enddef forecast_dates
+
+##======================================================================
+## Validate a run directory
+##======================================================================
+
+def validate_rundir(rundir,tile=7,jobs=16,scandir=False):
+    '''Derive and check all files required by "rundir"
+
+       Return (required, results, problems)
+         required : {path: reason}
+         results  : {path: (status, size, seconds)} from chknml.check_paths
+         problems : other problems, e.g. values not valid
+    '''
+    required = {}
+    problems = []
+
+    def runpath(fname):
+        return os.path.normpath(os.path.join(rundir,fname))
+
+    for fname in _control_files:
+        required[runpath(fname)] = 'run-time file'
+
+    nmlfile = runpath('input.nml')
+    cfgfile = runpath('model_configure')
+
+    nmlgrp = None
+    if os.path.isfile(nmlfile):
+        nmlgrp = namelist.namelistGroup.fromFile(nmlfile,'=')
+        problems.extend(invalid_values(nmlgrp,'input.nml'))
+
+    start = end = nhours = None
+    if os.path.isfile(cfgfile):
+        cfggrp  = namelist.namelistGroup.fromFile(cfgfile,':',dictionary=True)
+        problems.extend(invalid_values(cfggrp,'model_configure'))
+        start, end = forecast_dates(cfggrp)
+        nhours  = nml_value(cfggrp,'nhours_fcst')
+    years = range(start.year,end.year+1) if start is not None else ()
+
+    if nmlgrp is not None:
+        derived = {}
+        for path,refs in chknml.collect_paths(nmlgrp).items():
+            derived[path.replace('tileX',f'tile{tile}')] = ', '.join(f"{nml_name}: {var}" for nml_name,var in refs)
+        derived.update(namsfc_files(nmlgrp,tile))
+        derived.update(physics_files(nmlgrp,years))
+        derived.update(input_files(nmlgrp,nhours,tile))
+        for fname,reason in derived.items():
+            required.setdefault(runpath(fname),reason)
+
+    datatable = runpath('data_table')
+    if os.path.isfile(datatable):
+        for fname,reason in data_table_files(datatable).items():
+            required.setdefault(runpath(fname),reason)
+
+    diagtable = runpath('diag_table')
+    if os.path.isfile(diagtable):
+        problems.extend(check_diag_table(diagtable,start))
+
+    fieldtable = runpath('field_table')
+    if os.path.isfile(fieldtable):
+        problems.extend(check_field_table(fieldtable,nmlgrp))
+
+    results = chknml.check_paths(list(required),jobs,scandir)
+
+    ## an empty data_table is valid, no data override
+    if results[datatable][0] == 'empty':
+        results[datatable] = ('good',)+results[datatable][1:]
+
+    ## the boundary files should have about the same size
+    bndysizes = {path: res[1] for path,res in results.items() if os.path.basename(path).startswith('gfs_bndy.') and res[1]}
+    if len(bndysizes) > 2:
+        median = sorted(bndysizes.values())[len(bndysizes)//2]
+        for path,size in bndysizes.items():
+            if size < median/2:
+                problems.append(f"{path}: size {size} is less than half of the others ({median}), still being written?")
+
+    return (required, results, problems)
+#enddef validate_rundir
+
+##======================================================================
+## Parse command line arguments
+##======================================================================
+
+def parseArgv():
+    '''Parse command line arguments'''
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check all files required by an FV3 run directory before submitting the job")
+
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print all files with their reason, size and time")
+    parser.add_argument("-j", "--jobs",    type=int, default=16, help="Number of threads, default: %(default)s")
+    parser.add_argument("-s", "--scandir", action="store_true", help="List each directory once instead of a stat for each file")
+    parser.add_argument("-t", "--tile",    type=int, default=7,  help="Tile number of the regional domain, default: %(default)s")
+    parser.add_argument("rundir", nargs='?', default='.', help="Run directory, default: current directory")
+
+    return parser.parse_args()
+#enddef parseArgv
+
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+##
+## Entance Point
+##
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+if __name__ == '__main__':
+
+    args = parseArgv()
+
+    btime = time.perf_counter()
+    required, results, problems = validate_rundir(args.rundir,args.tile,args.jobs,args.scandir)
+    elapsed = time.perf_counter()-btime
+
+    labels = {'good': 'Good', 'missing': 'Not exist', 'broken': 'Broken link', 'empty': 'Zero size'}
+    counts = {status: 0 for status in labels}
+    for path,reason in required.items():
+        status,size,seconds = results[path]
+        counts[status] += 1
+        if status != 'good' or args.verbose:
+            sizestr = '' if size is None else f", {size} bytes"
+            print(f"{labels[status]:<12} {path} ({reason}{sizestr}, {seconds*1000:.2f} ms)")
+
+    for problem in problems:
+        print(f"{'Problem':<12} {problem}")
+
+    print(f"{len(required)} files checked in {elapsed*1000:.2f} ms: "
+          f"{counts['missing']} missing, {counts['broken']} broken links, {counts['empty']} zero size, "
+          f"{len(problems)} other problems")
+
+    sys.exit(0 if counts['good'] == len(required) and not problems else 1)
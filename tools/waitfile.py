@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+## ---------------------------------------------------------------------
+##
+## Wait for files to be ready, instead of "while [[ ! -e FILE ]]; sleep"
+## loops in the run scripts.
+##
+## A file is ready when it exists, its size is at least "--min-size"
+## bytes and its size and modification time have not changed for
+## "--stable" milliseconds, i.e. it is not being written any more.
+## A PATH can be a glob pattern, it is ready when "--count" matching
+## files are ready.
+##
+## Each PATH is printed as soon as it is ready, so that a script can
+## start the work for that file while waiting for the others. The exit
+## status is 0 when all PATHs (or one of them with "--any") are ready,
+## 1 at "--timeout", 2 if a "--exec" command fails.
+##
+## The directories of the paths are watched with inotify, so that the
+## waiting is event driven. inotify does not see files written by other
+## nodes on network file systems (Lustre, NFS, GPFS ...), the paths on
+## these file systems are checked with stat every "--poll" seconds. All
+## paths are checked in one loop, no process is started for each path.
+##
+## Examples (see run_fv3_Jet.sh and run_post.sh):
+##
+##   waitfile.py -m 13000000000 -s 20000 ${gfsfile}
+##   waitfile.py -c ${numhours} "${lbc_dir}/done.lbc_*"
+##   waitfile.py -e 'echo {} is ready' $POSTBUFR_DIR/sndpostdone{00..60}.tm00
+##
+## ---------------------------------------------------------------------
+##
+## Requirements:
+##
+##   o Python 3.6 or above
+##   o Linux for inotify, stat is used on other systems
+##
+########################################################################
+
+import os, sys
+import glob
+import select
+import time
+
+_REMOTE_FSTYPES = ('lustre', 'nfs', 'nfs4', 'gpfs', 'cifs', 'smb3', 'panfs', 'beegfs', 'fuse.sshfs')
+
+##======================================================================
+## inotify through ctypes
+##======================================================================
+
+class Inotify:
+    '''
+    Minimal inotify interface, watch directories for new, moved-in,
+    written and deleted files. Raise OSError if inotify is not available.
+    '''
+
+    IN_MODIFY      = 0x00000002
+    IN_ATTRIB      = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO    = 0x00000080
+    IN_CREATE      = 0x00000100
+    IN_DELETE      = 0x00000200
+    IN_NONBLOCK    = 0o4000
+    IN_CLOEXEC     = 0o2000000
+
+    WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self):
+        import ctypes, ctypes.util
+
+        libname = ctypes.util.find_library('c')
+        try:
+            self._libc = ctypes.CDLL(libname, use_errno=True)
+            self._libc.inotify_init1
+        except (OSError, AttributeError, TypeError) as err:
+            raise OSError(f'inotify is not available: {err}')
+
+        self._fd = self._libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        self.watches = {}              # directory: watch descriptor
+    #enddef
+
+    def fileno(self):
+        return self._fd
+
+    def add_watch(self,dirname):
+        ''' Watch directory "dirname", return False if it can not be watched'''
+        if dirname in self.watches: return True
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(dirname), self.WATCH_MASK)
+        if wd < 0: return False
+        self.watches[dirname] = wd
+        return True
+
+    def drain(self):
+        ''' Read and discard all pending events, return the number of bytes read'''
+        nbytes = 0
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            if not data: break
+            nbytes += len(data)
+        return nbytes
+
+    def close(self):
+        os.close(self._fd)
+
+#endclass
+
+##----------------------------------------------------------------------
+
+def remote_filesystem(path):
+    ''' Whether "path" is on a network file system, where inotify does not
+        see the changes made by other nodes.
+    '''
+    path = os.path.realpath(path)
+    best, fstype = '', ''
+    try:
+        with open('/proc/mounts','r') as fhdl:
+            for line in fhdl:
+                fields = line.split()
+                if len(fields) < 3: continue
+                mountpoint = fields[1].replace('\\040',' ')
+                if (path == mountpoint or path.startswith(mountpoint.rstrip('/')+'/')) and len(mountpoint) > len(best):
+                    best, fstype = mountpoint, fields[2]
+    except OSError:
+        return True                   ## unknown, do not trust inotify
+
+    return fstype in _REMOTE_FSTYPES
+#enddef remote_filesystem
+
+##======================================================================
+## Wait for files
+##======================================================================
+
+def wait_for(patterns,stable=1.0,minsize=0,count=1,timeout=None,poll=10.0,anyone=False,
+             callback=None,usenotify=True,verbose=False):
+    '''Wait until the files in "patterns" are ready
+
+       A file is ready when it exists, has at least "minsize" bytes and has
+       not changed for "stable" seconds. A glob pattern is ready when
+       "count" of its files are ready.
+
+       "callback(pattern, paths)" is called once for each pattern as soon
+       as it is ready. Wait for all patterns, or the first one with "anyone".
+
+       Return the list of patterns not ready, which is empty unless
+       "timeout" seconds have passed.
+    '''
+
+    pending = list(patterns)
+    seen    = {}                      # path: ((size, mtime), time of the last change)
+
+    notify = None
+    polled = set()                    # directories checked by stat only
+    if usenotify:
+        try:
+            notify = Inotify()
+        except OSError as err:
+            if verbose: print(f'INFO: {err}, use stat every {poll} s', file=sys.stderr)
+
+    for pattern in pending:
+        dirname = os.path.dirname(pattern) or '.'
+        if notify is not None and not glob.has_magic(dirname) and os.path.isdir(dirname) \
+           and not remote_filesystem(dirname) and notify.add_watch(dirname):
+            continue
+        polled.add(dirname)
+        if verbose: print(f'INFO: {dirname} is checked every {poll} s', file=sys.stderr)
+
+    def ready_paths(pattern,now):
+        ''' Return the ready paths of "pattern" and the seconds until the next one may be ready'''
+        paths  = glob.glob(pattern) if glob.has_magic(pattern) else [pattern]
+        ready  = []
+        wakeup = None
+        for path in paths:
+            try:
+                fstat = os.stat(path)
+            except OSError:
+                seen.pop(path,None)
+                continue
+            signature = (fstat.st_size, fstat.st_mtime_ns)
+            if path not in seen or seen[path][0] != signature:
+                seen[path] = (signature, now)
+            if fstat.st_size < minsize:
+                continue
+            remaining = seen[path][1]+stable-now
+            if remaining <= 0:
+                ready.append(path)
+            elif wakeup is None or remaining < wakeup:
+                wakeup = remaining
+        return ready, wakeup
+
+    btime = time.monotonic()
+    try:
+        while True:
+            now    = time.monotonic()
+            wakeup = None
+            for pattern in list(pending):
+                ready, remaining = ready_paths(pattern,now)
+                if len(ready) >= (count if glob.has_magic(pattern) else 1):
+                    pending.remove(pattern)
+                    if callback is not None: callback(pattern, sorted(ready))
+                    if anyone: return pending
+                elif remaining is not None:
+                    wakeup = remaining if wakeup is None else min(wakeup,remaining)
+
+            if not pending: return pending
+
+            ## sleep until an event, a file may be stable, the next poll or the timeout
+            delay = poll if polled or notify is None else max(poll,60.0)   # safety check, e.g. targets of symbolic links
+            if wakeup is not None: delay = min(delay,wakeup+0.001)
+            if timeout is not None:
+                left = btime+timeout-time.monotonic()
+                if left <= 0: return pending
+                delay = min(delay,left)
+
+            if notify is not None:
+                events, _, _ = select.select([notify],[],[],delay)
+                if events: notify.drain()
+            else:
+                time.sleep(delay)
+    finally:
+        if notify is not None: notify.close()
+#enddef wait_for
+
+##======================================================================
+## Parse command line arguments
+##======================================================================
+
+def parseArgv():
+    '''Parse command line arguments'''
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Wait for files to exist and to be completely written")
+
+    parser.add_argument("-s", "--stable",  type=int,   default=1000, help="Milliseconds without any change before a file is ready, default: %(default)s")
+    parser.add_argument("-m", "--min-size",type=int,   default=0,    help="Minimum size in bytes of a ready file, default: %(default)s")
+    parser.add_argument("-c", "--count",   type=int,   default=1,    help="Number of ready files for a glob pattern, default: %(default)s")
+    parser.add_argument("-t", "--timeout", type=float, default=None, help="Give up after TIMEOUT seconds, exit status 1, default: wait forever")
+    parser.add_argument("-p", "--poll",    type=float, default=10.0, help="Seconds between checks of files on network file systems, default: %(default)s")
+    parser.add_argument("-a", "--any",     action="store_true", help="Return when any PATH is ready")
+    parser.add_argument("-e", "--exec",    default=None, metavar='CMD',
+                                           help="Run shell command CMD for each PATH as soon as it is ready, \"{}\" is replaced by the ready files")
+    parser.add_argument("--no-inotify",    action="store_true", help="Check all files with stat only")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Print the waiting time of each PATH")
+    parser.add_argument("paths", nargs='+', help="Files or glob patterns (quoted) to wait for")
+
+    return parser.parse_args()
+#enddef parseArgv
+
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+##
+## Entance Point
+##
+##@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@@
+
+if __name__ == '__main__':
+
+    args = parseArgv()
+
+    btime   = time.monotonic()
+    failed  = []
+
+    def ready(pattern,paths):
+        if args.verbose:
+            print(f"INFO: {pattern} is ready after {time.monotonic()-btime:.1f} s", file=sys.stderr)
+        print(pattern, flush=True)
+        if args.exec is not None:
+            import shlex, subprocess
+            command = args.exec.replace('{}',' '.join(shlex.quote(path) for path in paths))
+            if subprocess.call(command, shell=True) != 0:
+                failed.append(pattern)
+
+    try:
+        pending = wait_for(args.paths,args.stable/1000.0,args.min_size,args.count,args.timeout,args.poll,
+                           args.any,ready,not args.no_inotify,args.verbose)
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+    if failed:
+        print(f"ERROR: command failed for {' '.join(failed)}", file=sys.stderr)
+        sys.exit(2)
+
+    if pending and not (args.any and len(pending) < len(args.paths)):
+        print(f"ERROR: not ready after {args.timeout} s: {' '.join(pending)}", file=sys.stderr)
+        sys.exit(1)
+
+    sys.exit(0)